@@ -1,7 +1,14 @@
+import asyncio
+import json
 from fastapi import APIRouter, HTTPException, Query
-from app.services.downloader import extractor
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi.responses import StreamingResponse
+from app.core.config import settings
+from app.services.downloader import extractor, route_url
+from app.services.rate_limiter import host_limiter
+from app.services.extraction_pool import extraction_pool, PoolSaturated
+from app.services.tracing import phase
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional
 
 router = APIRouter()
 
@@ -11,23 +18,179 @@ class Format(BaseModel):
     size: str
     format_id: str
     type: str
+    # Predicted bytes (merged size for video+audio pairs)
+    filesize: Optional[int] = None
+    fps: Optional[float] = None
+    vcodec: Optional[str] = None
+    acodec: Optional[str] = None
+    hdr: Optional[bool] = None
+    # Video + audio land in an MP4 without re-encoding
+    mp4_compatible: Optional[bool] = None
 
 class MediaResponse(BaseModel):
     title: str
-    thumbnail: str
+    thumbnail: Optional[str] = None
     duration: str
     platform: str
     formats: List[Format]
+    # Pass back to POST /download/ to reuse this extraction
+    handle: Optional[str] = None
+
+class PlaylistEntry(BaseModel):
+    id: Optional[str] = None
+    url: Optional[str] = None
+    title: Optional[str] = None
+    thumbnail: Optional[str] = None
+    duration: str
+
+class PlaylistPage(BaseModel):
+    id: Optional[str] = None
+    title: Optional[str] = None
+    platform: Optional[str] = None
+    entry_count: Optional[int] = None
+    entries: List[PlaylistEntry]
+    # Pass as `cursor` to get the next page; null on the last page
+    next_cursor: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    urls: List[str] = Field(..., min_length=1, max_length=settings.ANALYZE_BATCH_MAX_URLS)
 
 @router.get("/", response_model=MediaResponse)
 async def analyze_url(url: str = Query(..., title="Media URL", min_length=5)):
     """
     Analyze a URL and return available media formats.
     """
+    return await _analyze(url)
+
+@router.post("/batch")
+async def analyze_batch(req: BatchRequest):
+    """
+    Analyze many URLs at once. Results are streamed back as NDJSON, one line
+    per URL in completion order (use `index` to match them to the request):
+    {"index": 0, "url": "...", "ok": true, "data": {...MediaResponse}}
+    {"index": 1, "url": "...", "ok": false, "status": 400, "error": "..."}
+    """
+    semaphore = asyncio.Semaphore(settings.ANALYZE_BATCH_CONCURRENCY)
+
+    async def analyze_one(index: int, url: str) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                data = MediaResponse(**await _analyze(url))
+                return {"index": index, "url": url, "ok": True, "data": data.model_dump()}
+            except HTTPException as e:
+                result = {"index": index, "url": url, "ok": False, "status": e.status_code, "error": e.detail}
+                if e.headers and "Retry-After" in e.headers:
+                    result["retry_after"] = int(e.headers["Retry-After"])
+                return result
+            except Exception as e:
+                return {"index": index, "url": url, "ok": False, "status": 500, "error": str(e)}
+
+    async def results():
+        tasks = [asyncio.create_task(analyze_one(i, url)) for i, url in enumerate(req.urls)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # Client disconnected mid-batch: stop waiting for the rest
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@router.get("/playlist", response_model=PlaylistPage)
+async def analyze_playlist(
+    url: str = Query(..., title="Playlist or channel URL", min_length=5),
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.PLAYLIST_PAGE_SIZE, ge=1, le=settings.PLAYLIST_MAX_PAGE_SIZE),
+):
+    """
+    List a playlist or channel page by page without resolving each entry.
+    Open an entry with GET /analyze/?url=<entry url> (or /analyze/batch).
+    """
+    try:
+        offset = int(cursor) if cursor else 0
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
     try:
-        data = extractor.extract_info(url)
-        return data
+        with phase("route"):
+            route = route_url(url, kind="playlist")
+        return await extraction_pool.run(route.platform, extractor.extract_playlist_page, url, offset, limit)
+    except PoolSaturated as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Extractions running in this process, by media key. Requests for the same
+# media join the running one here, so only the loader takes a lane slot.
+_inflight: Dict[str, "asyncio.Task"] = {}
+
+def _landed(key: str, task: "asyncio.Task"):
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    if not task.cancelled():
+        task.exception()  # Retrieved by the waiters; keeps asyncio from logging it
+
+async def _extract_once(key: str, platform: str, url: str) -> Dict[str, Any]:
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(extraction_pool.run(platform, extractor.extract_info, url))
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _landed(key, t))
+    # A waiter that gives up (client gone) must not cancel the others' extraction
+    return await asyncio.shield(task)
+
+async def _analyze(url: str) -> Dict[str, Any]:
+    # Unsupported links are refused here, before they cost a yt-dlp call
+    try:
+        with phase("route"):
+            route = route_url(url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    cached = extractor.cached_result(url)
+    if cached is not None:
+        return cached
+
+    try:
+        return await _extract_once(route.key, route.platform, url)
+    except PoolSaturated as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error during analysis")
+
+@router.get("/cache")
+async def cache_stats():
+    """
+    Hit/miss counters for the analyze cache, used to tune ANALYZE_CACHE_TTL.
+    """
+    return extractor.cache.stats()
+
+@router.get("/pool")
+async def pool_stats():
+    """
+    Active and queued extractions per platform.
+    """
+    return extraction_pool.stats()
+
+@router.get("/identities")
+async def identity_stats():
+    """
+    Health, rate limit and quarantine state of the proxy and cookie-jar pools.
+    """
+    return {"proxies": extractor.proxy_pool.stats(), "cookies": extractor.cookie_pool.stats()}
+
+@router.get("/hosts")
+async def host_stats():
+    """
+    Current adaptive request rate per host group, and which hosts are paused by Retry-After.
+    """
+    return host_limiter.stats()
@@ -1,78 +1,259 @@
+import asyncio
+import json
 import os
-import threading
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Query
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
-from app.services.downloader import extractor
+import time
+from typing import Literal, Optional, Union
+from urllib.parse import quote
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, StreamingResponse
+from pydantic import BaseModel, Field, field_validator
+from app.api.file_response import RangeFileResponse
+from app.core.config import settings
+from app.services.downloader import extractor, route_url, estimate_download_size, stream_urls_expired
+from app.services.download_workers import download_pool
+from app.services.extraction_pool import extraction_pool, PoolSaturated
+from app.services.format_index import constraints_to_selector, select_option
+from app.services.metrics import FILE_SERVE_BYTES
+from app.services.postprocess import postprocess_pool
 from app.services.storage import storage
+from app.services.storage_backends import storage_backend
+from app.services.streamer import streamer
+from app.services.task_events import task_watcher
 from app.services.task_manager import task_manager
 
 router = APIRouter()
 
+class FormatConstraints(BaseModel):
+    """Pick the best format that fits, instead of naming one."""
+    max_size_mb: Optional[float] = Field(None, gt=0)
+    max_height: Optional[int] = Field(None, gt=0)
+    # Codec prefix, e.g. "avc1", "vp9", "av01"
+    vcodec: Optional[str] = Field(None, pattern=r"^[\w.]+$")
+    container: Optional[Literal["mp4", "webm", "mkv"]] = None
+    # True: HDR only, False: SDR only
+    hdr: Optional[bool] = None
+    audio_only: bool = False
+
 class DownloadRequest(BaseModel):
     url: str
-    format_id: str
+    format_id: str = "best"
+    # Resolved against the analyzed format index; overrides format_id
+    constraints: Optional[FormatConstraints] = None
+    # Handle from the analyze response; lets the download skip re-extraction
+    handle: Optional[str] = None
+    # Higher runs first
+    priority: int = Field(0, ge=-10, le=10)
+    # Clip: only download this time range. Seconds or "[HH:]MM:SS[.ms]"
+    start: Optional[Union[float, str]] = None
+    end: Optional[Union[float, str]] = None
+
+    @field_validator("start", "end")
+    @classmethod
+    def parse_timestamp(cls, value):
+        if value is None or isinstance(value, (int, float)):
+            seconds = value
+        else:
+            # Deferred: importing yt_dlp is the slow part of startup
+            from yt_dlp.utils import parse_duration
+            seconds = parse_duration(value)
+            if seconds is None:
+                raise ValueError("Expected seconds or [HH:]MM:SS")
+        if seconds is not None and seconds < 0:
+            raise ValueError("Timestamps can't be negative")
+        return seconds
 
 class DownloadResponse(BaseModel):
     task_id: str
     status: str
+    # The format that will be downloaded (differs from the request when constraints were used)
+    format_id: str
 
-def process_download(task_id: str, url: str, format_id: str):
+@router.post("/", response_model=DownloadResponse)
+async def start_download(req: DownloadRequest):
     try:
-        task_dir, _ = storage.create_temp_dir()
-        # We use the existing task_id for tracking, but create storage for it.
-        # Actually storage.create_temp_dir returns a NEW uuid. 
-        # Let's fix storage to accept an ID or just use the one from task_manager.
-        
-        # Override storage logic slightly here or update storage service?
-        # Let's just use the path from storage.create_temp_dir but map it.
-        # Wait, better:
-        task_dir_path = storage.base_dir / task_id
-        task_dir_path.mkdir(exist_ok=True)
-        
-        task_manager.update_task(task_id, status="processing", progress=0)
-
-        def progress_hook(d):
-            if d['status'] == 'downloading':
-                try:
-                    p = d.get('_percent_str', '0%').replace('%','')
-                    task_manager.update_task(task_id, progress=float(p))
-                except:
-                    pass
-            elif d['status'] == 'finished':
-                task_manager.update_task(task_id, progress=100, status="completed")
-
-        filepath = extractor.download_media(url, format_id, str(task_dir_path), progress_hook)
-        filename = os.path.basename(filepath)
-        
-        task_manager.update_task(task_id, status="completed", filepath=filepath, filename=filename)
-        
-        # Schedule cleanup? handled by separate cleaner or retention policy
-        
-    except Exception as e:
-        task_manager.fail_task(task_id, str(e))
+        route = route_url(req.url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-@router.post("/", response_model=DownloadResponse)
-async def start_download(req: DownloadRequest, background_tasks: BackgroundTasks):
-    task_id = task_manager.create_task()
-    background_tasks.add_task(process_download, task_id, req.url, req.format_id)
-    return {"task_id": task_id, "status": "pending"}
+    # Ship the analyze-time info with the job so a worker in another
+    # process can still skip re-extraction
+    info = None
+    if req.handle and req.handle == route.key:
+        info = extractor.get_raw_info(req.handle)
+
+    format_id = req.format_id
+    if req.constraints:
+        constraints = req.constraints.model_dump(exclude_none=True)
+        index = extractor.get_format_index(req.handle) if info is not None else None
+        if index is not None and (index["options"] or index["audios"]):
+            option = select_option(index, constraints)
+            if option is None:
+                raise HTTPException(status_code=422, detail="No format matches the constraints")
+            format_id = option["format_id"]
+        else:
+            # Not analyzed, expired, or no format metadata (plain files): let yt-dlp apply the same filters
+            format_id = constraints_to_selector(constraints)
+
+    clip = None
+    if req.start is not None or req.end is not None:
+        clip = (req.start or 0, req.end)
+        if clip[1] is not None and clip[1] <= clip[0]:
+            raise HTTPException(status_code=400, detail="Clip end must be after its start")
+        duration = (info or {}).get("duration")
+        if duration and clip[0] >= duration:
+            raise HTTPException(status_code=400, detail="Clip starts after the end of the media")
+
+    # Reject downloads that can never fit before they are queued
+    estimate = estimate_download_size(info, format_id, clip) if info else None
+    if estimate:
+        if settings.MAX_FILE_SIZE_MB and estimate > settings.MAX_FILE_SIZE_MB * 1024 * 1024:
+            raise HTTPException(status_code=413, detail=f"File too large (max {settings.MAX_FILE_SIZE_MB} MB)")
+        # capacity() walks the download directory; keep it off the event loop
+        if estimate > await run_in_threadpool(storage.capacity):
+            raise HTTPException(status_code=507, detail="Not enough storage for this download")
+
+    task_id = await run_in_threadpool(
+        task_manager.create_task,
+        url=req.url,
+        format_id=format_id,
+        handle=req.handle,
+        info=info,
+        priority=req.priority,
+        clip=clip,
+    )
+    download_pool.notify()
+    return {"task_id": task_id, "status": "pending", "format_id": format_id}
+
+@router.get("/pools")
+async def pool_stats():
+    """
+    Download workers, connections in use and the ffmpeg post-processing queue.
+    """
+    from app.services.download_engine import download_engine
+    return {
+        "workers": download_pool.stats(),
+        "connections": download_engine.stats(),
+        "postprocess": postprocess_pool.stats(),
+        "storage": storage_backend.stats(),
+    }
 
 @router.get("/status/{task_id}")
 async def get_status(task_id: str):
-    task = task_manager.get_task(task_id)
+    task = await run_in_threadpool(task_manager.get_task, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     return task
 
-@router.get("/file/{task_id}")
-async def get_file(task_id: str):
-    task = task_manager.get_task(task_id)
+@router.get("/events/{task_id}")
+async def task_events(task_id: str, request: Request):
+    """
+    Server-Sent Events stream of task updates (status, progress, phase,
+    speed, eta). Replaces polling /status: one poller per process reads the
+    task store for every open stream and pushes only when something changed.
+    """
+    first = await run_in_threadpool(task_manager.get_task, task_id)
+    if not first:
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    async def events():
+        queue = task_watcher.subscribe(task_id)
+        try:
+            task = last = first
+            yield f"data: {json.dumps(task)}\n\n"
+            started = time.monotonic()
+            while task is not None and task['status'] not in ('completed', 'failed'):
+                if time.monotonic() - started > settings.PROGRESS_STREAM_TIMEOUT or await request.is_disconnected():
+                    break
+                try:
+                    task = await asyncio.wait_for(queue.get(), 15)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                if task != last:
+                    yield f"data: {json.dumps(task)}\n\n"
+                    last = task
+        finally:
+            task_watcher.unsubscribe(task_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.api_route("/file/{task_id}", methods=["GET", "HEAD"])
+async def get_file(task_id: str, request: Request):
+    task = await run_in_threadpool(task_manager.get_task, task_id)
     if not task or task['status'] != 'completed' or not task['filepath']:
         raise HTTPException(status_code=404, detail="File not ready or found")
-    
-    return FileResponse(
-        path=task['filepath'], 
-        filename=task['filename'], 
-        media_type='application/octet-stream'
+    if task.get('object_key'):
+        # Stored in object storage: let the client fetch it from there
+        url = storage_backend.url(task['object_key'], task['filename'], request.method)
+        if url:
+            return RedirectResponse(url, status_code=307)
+    if not os.path.exists(task['filepath']):
+        # Expired and cleaned up by the storage janitor
+        raise HTTPException(status_code=410, detail="File expired, please download again")
+
+    accel_path = None
+    if settings.FILE_SERVE_ACCEL == "nginx":
+        relative = os.path.relpath(task['filepath'], storage.base_dir)
+        accel_path = f"{settings.FILE_SERVE_ACCEL_PREFIX.rstrip('/')}/{quote(relative)}"
+    return RangeFileResponse(
+        path=task['filepath'],
+        filename=task['filename'],
+        accel=settings.FILE_SERVE_ACCEL,
+        accel_path=accel_path,
+        on_complete=lambda mode, sent: FILE_SERVE_BYTES.labels(mode).observe(sent),
     )
+
+@router.get("/stream")
+async def stream_media(
+    url: str = Query(..., min_length=5),
+    format_id: str = Query("best"),
+    handle: Optional[str] = None,
+):
+    """
+    Send the media to the client while it is being fetched, without a task
+    or a file on disk. Single formats are proxied as they arrive; separate
+    video + audio is remuxed on the fly into fragmented MP4 / Matroska.
+    """
+    # Take the slot now: the stream itself only starts after we return
+    slot = streamer.reserve()
+    if slot is None:
+        raise HTTPException(status_code=503, detail="Too many active streams", headers={"Retry-After": "10"})
+    try:
+        plan = await _stream_plan(url, format_id, handle)
+    except BaseException:
+        slot.release()
+        raise
+
+    headers = {"Content-Disposition": f"attachment; filename*=UTF-8''{quote(plan.filename)}"}
+    if plan.content_length:
+        headers["Content-Length"] = str(plan.content_length)
+    return StreamingResponse(streamer.open(url, plan, slot), media_type=plan.media_type, headers=headers)
+
+async def _stream_plan(url: str, format_id: str, handle: Optional[str]):
+    try:
+        route = route_url(url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    key = route.key
+    info = extractor.get_raw_info(key) if handle in (None, key) else None
+    if info is None or stream_urls_expired(info):
+        extractor.cache.invalidate(key)
+        try:
+            await extraction_pool.run(route.platform, extractor.extract_info, url)
+        except PoolSaturated as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        info = extractor.get_raw_info(key)
+
+    try:
+        return await run_in_threadpool(streamer.plan, url, info, format_id)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Format not available: {e}")
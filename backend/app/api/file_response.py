@@ -0,0 +1,246 @@
+import mimetypes
+import os
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import quote
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+# More ranges than this in one request is almost always abuse; serve the whole file
+MAX_RANGES = 16
+
+def _parse_range(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parse a `Range: bytes=...` header into inclusive (start, end) pairs.
+    Returns None if the header is malformed (ignore it), [] if nothing is satisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    ranges = []
+    for part in spec.split(","):
+        start_str, sep, end_str = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if start_str == "":
+                # Suffix range: last N bytes
+                length = int(end_str)
+                if length <= 0:
+                    continue
+                start, end = max(size - length, 0), size - 1
+            else:
+                start = int(start_str)
+                end = int(end_str) if end_str else None
+        except ValueError:
+            return None
+        if end is not None and start > end:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, size - 1 if end is None else min(end, size - 1)))
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    # Merge overlapping/adjacent ranges so clients can't make us send bytes twice
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+class RangeFileResponse(Response):
+    """
+    File response with byte ranges (single and multipart/byteranges),
+    ETag/Last-Modified validation and HEAD support.
+
+    Bytes are sent with the ASGI `http.response.pathsend` /
+    `http.response.zerocopysend` extensions when the server offers them, or
+    handed to a front proxy through X-Accel-Redirect / X-Sendfile when
+    `accel` is configured, so Python never touches the payload.
+    """
+    chunk_size = 256 * 1024
+
+    def __init__(
+        self,
+        path: str,
+        filename: str,
+        accel: str = "",
+        accel_path: Optional[str] = None,
+        on_complete: Optional[Callable[[str, int], None]] = None,
+    ):
+        self.path = path
+        self.filename = filename
+        self.accel = accel
+        self.accel_path = accel_path
+        # Called with ("direct" | "accel", payload bytes) once the response is done
+        self.on_complete = on_complete
+        self.mode = "direct"
+        self.sent = 0
+        self.status_code = 200
+        self.background = None
+        self.body = b""
+
+        stat = os.stat(path)
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        self.media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        # Built by hand: Response.init_headers would add a content-length for the empty body
+        self.raw_headers = [
+            (k.encode("latin-1"), v.encode("latin-1"))
+            for k, v in {
+                "accept-ranges": "bytes",
+                "etag": self.etag,
+                "last-modified": formatdate(self.mtime, usegmt=True),
+                "content-disposition": f"attachment; filename*=UTF-8''{quote(filename)}",
+            }.items()
+        ]
+
+    def _not_modified(self, headers: Headers) -> bool:
+        if_none_match = headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+            return "*" in tags or self.etag in tags
+        if_modified_since = headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(self.mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _range_applies(self, headers: Headers) -> bool:
+        # If-Range: only honour the range if the client's copy is still current
+        if_range = headers.get("if-range")
+        if not if_range:
+            return True
+        if if_range.startswith(('"', 'W/')):
+            return if_range == self.etag
+        try:
+            return int(self.mtime) <= parsedate_to_datetime(if_range).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self._respond(scope, receive, send)
+        finally:
+            if self.on_complete:
+                self.on_complete(self.mode, self.sent)
+
+    async def _respond(self, scope: Scope, receive: Receive, send: Send) -> None:
+        headers = Headers(scope=scope)
+        head_only = scope["method"].upper() == "HEAD"
+
+        if self._not_modified(headers):
+            await self._start(send, 304, {})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if self.accel:
+            await self._send_accel(send)
+            return
+
+        ranges = None
+        if "range" in headers and self._range_applies(headers):
+            ranges = _parse_range(headers["range"], self.size)
+            if ranges == []:
+                await self._start(send, 416, {"content-range": f"bytes */{self.size}"})
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+        extensions = scope.get("extensions") or {}
+        if not ranges:
+            await self._start(send, 200, {"content-type": self.media_type, "content-length": str(self.size)})
+            if head_only:
+                await send({"type": "http.response.body", "body": b""})
+            elif "http.response.pathsend" in extensions:
+                await send({"type": "http.response.pathsend", "path": os.path.abspath(self.path)})
+                self.sent = self.size
+            else:
+                await self._send_ranges(send, [(0, self.size - 1)], extensions)
+            return
+
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            await self._start(send, 206, {
+                "content-type": self.media_type,
+                "content-range": f"bytes {start}-{end}/{self.size}",
+                "content-length": str(end - start + 1),
+            })
+            if head_only:
+                await send({"type": "http.response.body", "body": b""})
+            else:
+                await self._send_ranges(send, ranges, extensions)
+            return
+
+        boundary = secrets.token_hex(16)
+        parts = [
+            (
+                f"--{boundary}\r\nContent-Type: {self.media_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{self.size}\r\n\r\n"
+            ).encode()
+            for start, end in ranges
+        ]
+        closing = f"\r\n--{boundary}--\r\n".encode()
+        length = sum(len(p) for p in parts) + sum(e - s + 1 for s, e in ranges) + 2 * (len(ranges) - 1) + len(closing)
+        await self._start(send, 206, {
+            "content-type": f"multipart/byteranges; boundary={boundary}",
+            "content-length": str(length),
+        })
+        if head_only:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        for i, (part_header, rng) in enumerate(zip(parts, ranges)):
+            prefix = (b"\r\n" if i else b"") + part_header
+            await send({"type": "http.response.body", "body": prefix, "more_body": True})
+            await self._send_ranges(send, [rng], extensions, final=False)
+        await send({"type": "http.response.body", "body": closing})
+
+    async def _start(self, send: Send, status: int, extra: dict):
+        raw = list(self.raw_headers) + [(k.encode("latin-1"), v.encode("latin-1")) for k, v in extra.items()]
+        await send({"type": "http.response.start", "status": status, "headers": raw})
+
+    async def _send_ranges(self, send: Send, ranges: List[Tuple[int, int]], extensions: dict, final: bool = True):
+        zerocopy = "http.response.zerocopysend" in extensions
+        async with await anyio.open_file(self.path, mode="rb") as f:
+            for i, (start, end) in enumerate(ranges):
+                last = final and i == len(ranges) - 1
+                if zerocopy:
+                    await send({
+                        "type": "http.response.zerocopysend",
+                        "file": f.wrapped.fileno(),
+                        "offset": start,
+                        "count": end - start + 1,
+                        "more_body": not last,
+                    })
+                    self.sent += end - start + 1
+                    continue
+                await f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = await f.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0 or not last})
+                    self.sent += len(chunk)
+
+    async def _send_accel(self, send: Send):
+        """Let nginx (X-Accel-Redirect) or Apache/lighttpd (X-Sendfile) serve the bytes, ranges included."""
+        if self.accel == "nginx":
+            header = {"x-accel-redirect": self.accel_path or self.path}
+        else:
+            header = {"x-sendfile": os.path.abspath(self.path)}
+        await self._start(send, 200, {"content-type": self.media_type, **header})
+        await send({"type": "http.response.body", "body": b""})
+        # The proxy sends the file (or the requested ranges of it); count the whole file
+        self.mode = "accel"
+        self.sent = self.size
@@ -0,0 +1,44 @@
+import time
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.services.tracing import Trace, current_trace
+
+class TracingMiddleware:
+    """
+    Gives every HTTP request a Trace. The phases recorded while handling it
+    are returned in a Server-Timing header (visible in browser dev tools)
+    along with X-Trace-Id, and the trace is sampled into the log.
+
+    Request time is measured to the first response byte, so downloads and
+    event streams aren't reported as slow for the time they keep sending.
+    """
+    def __init__(self, app: ASGIApp, exclude: tuple = ()):
+        self.app = app
+        self.exclude = exclude
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(f"{scope['method']} {scope['path']}")
+        token = current_trace.set(trace)
+        response = {"status": 500, "ttfb": None}
+
+        async def send_with_timing(message: Message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["ttfb"] = time.monotonic() - trace.started
+                headers = list(message.get("headers", []))
+                headers.append((b"x-trace-id", trace.id.encode()))
+                timing = trace.server_timing()
+                if timing:
+                    headers.append((b"server-timing", timing.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_trace.reset(token)
+            trace.attrs["status"] = response["status"]
+            trace.finish("ok" if response["status"] < 500 else "error", total=response["ttfb"])
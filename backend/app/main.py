@@ -1,9 +1,24 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from app.api.api import api_router
+from app.api.middleware import TracingMiddleware
 from app.core.config import settings
+from app.services.extraction_pool import extraction_pool
+from app.services.download_workers import download_pool
+from app.services.downloader import extractor
+from app.services.metrics import render_metrics
+from app.services.postprocess import postprocess_pool
+from app.services.storage import storage
+from app.services.storage_backends import storage_backend
+from app.services.task_manager import task_manager
+from app.services.warmup import warmup
 import os
 import base64
+import logging
+
+# App and yt-dlp output (and sampled traces) go through logging
+logging.basicConfig(level=logging.INFO)
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -18,14 +33,59 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["Server-Timing", "X-Trace-Id"],
     )
 
+# Per-phase timings for every API request (Server-Timing header, sampled logs).
+# Probes, scrapes and event streams (open for minutes) have no phases worth timing.
+app.add_middleware(
+    TracingMiddleware, exclude=("/metrics", "/healthz", "/readyz", f"{settings.API_V1_STR}/download/events/"),
+)
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+@app.on_event("startup")
+def start_workers():
+    # Off the startup path: the port is bound and /healthz answers meanwhile
+    warmup.start([
+        ("tasks", task_manager.open),
+        ("storage", storage.open),
+        ("extractor", extractor.warm_up),
+        ("storage_backend", storage_backend.open),
+    ])
+    if settings.RUN_DOWNLOAD_WORKERS:
+        download_pool.start()
+        # The janitor runs next to the workers, which own the cache references
+        storage.start_janitor(settings.STORAGE_JANITOR_INTERVAL)
+
+@app.on_event("shutdown")
+def shutdown_pools():
+    download_pool.stop()
+    storage.stop_janitor()
+    extraction_pool.shutdown()
+    postprocess_pool.shutdown()
+
 @app.get("/")
 def root():
     return {"message": "Welcome to MediaSense API"}
 
+@app.get("/healthz", include_in_schema=False)
+def healthz():
+    """Liveness: the process is up and serving."""
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+def readyz():
+    """Readiness: 503 until the warm-up (yt-dlp, cookies, download cache) is done."""
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if status["status"] == "ready" else 503)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/debug/cookies")
 def debug_cookies():
     """
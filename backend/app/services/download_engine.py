@@ -0,0 +1,208 @@
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+from yt_dlp.downloader.common import FileDownloader
+from yt_dlp.downloader.http import HttpFD
+from yt_dlp.networking import Request
+from yt_dlp.utils import determine_protocol
+from app.core.config import settings
+from app.services.tracing import record
+
+logger = logging.getLogger(__name__)
+
+class DownloadEngine:
+    """
+    Connection budget for downloads.
+
+    Each download gets up to its platform's number of parallel connections
+    (DASH/HLS fragments via yt-dlp's concurrent_fragment_downloads, or HTTP
+    Range parts via RangeSplitDownloader), but never more than what is left
+    of the global cap, so one 8K job can't take every socket.
+    """
+    def __init__(self, per_platform: Dict[str, int], max_connections: int, split_min_bytes: int, chunk_bytes: int):
+        self.per_platform = per_platform
+        self.max_connections = max_connections
+        self.split_min_bytes = split_min_bytes
+        self.chunk_bytes = chunk_bytes
+        self._available = max_connections
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def connections(self, platform: str) -> Iterator[int]:
+        """Reserve connections for one download; blocks until at least one is free."""
+        want = max(1, min(self.per_platform.get(platform, self.per_platform.get("default", 4)), self.max_connections))
+        requested = time.monotonic()
+        with self._cond:
+            while self._available < 1:
+                self._cond.wait()
+            granted = min(want, self._available)
+            self._available -= granted
+        record("connections", time.monotonic() - requested)
+        try:
+            yield granted
+        finally:
+            with self._cond:
+                self._available += granted
+                self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"max_connections": self.max_connections, "in_use": self.max_connections - self._available}
+
+class RangeSplitDownloader(FileDownloader):
+    """
+    Fetches one large progressive file over several connections: the file is
+    cut into `chunk_bytes` Range requests that `split_connections` threads
+    pull from a queue and write in place into a preallocated .part file.
+    Falls back to yt-dlp's HttpFD when the server doesn't answer ranges with 206.
+    """
+    FD_NAME = "rangesplit"
+
+    @staticmethod
+    def suitable(info: Dict[str, Any], params: Dict[str, Any]) -> bool:
+        if (params.get("split_connections") or 1) < 2 or info.get("is_live"):
+            return False
+        if info.get("section_start") or info.get("section_end"):
+            # Time-range clips are cut by ffmpeg
+            return False
+        if determine_protocol(info) not in ("http", "https"):
+            return False
+        # Unknown size: the probe request in real_download decides
+        size = info.get("filesize") or info.get("filesize_approx")
+        return size is None or size >= download_engine.split_min_bytes
+
+    def _open(self, url: str, headers: Dict[str, str], start: int, end: int):
+        return self.ydl.urlopen(Request(url, headers={**headers, "Range": f"bytes={start}-{end}"}))
+
+    def _fallback(self, filename: str, info_dict: Dict[str, Any]):
+        fd = HttpFD(self.ydl, self.params)
+        for hook in self._progress_hooks:
+            fd.add_progress_hook(hook)
+        return fd.real_download(filename, info_dict)
+
+    def real_download(self, filename: str, info_dict: Dict[str, Any]):
+        url = info_dict["url"]
+        headers = dict(info_dict.get("http_headers") or {})
+
+        # Probe: does the server do ranges, and how big is the file really?
+        probe = self._open(url, headers, 0, 0)
+        content_range = probe.headers.get("Content-Range") or ""
+        probe.read()
+        probe.close()
+        if probe.status != 206 or "/" not in content_range or content_range.endswith("/*"):
+            self.to_screen("[rangesplit] Server does not support ranges, using a single connection")
+            return self._fallback(filename, info_dict)
+        size = int(content_range.rsplit("/", 1)[1])
+        if size < download_engine.split_min_bytes:
+            return self._fallback(filename, info_dict)
+
+        chunk = (info_dict.get("downloader_options") or {}).get("http_chunk_size") or download_engine.chunk_bytes
+        ranges = queue.Queue()
+        for start in range(0, size, chunk):
+            ranges.put((start, min(start + chunk, size) - 1))
+        workers = min(self.params.get("split_connections") or 1, ranges.qsize())
+        retries = self.params.get("retries") or 3
+        if not isinstance(retries, int):
+            retries = 3
+
+        tmpfilename = self.temp_name(filename)
+        self.report_destination(filename)
+        with open(tmpfilename, "wb") as f:
+            f.truncate(size)
+
+        started = time.time()
+        # `contiguous`: bytes from the start of the file that are completely
+        # written, for readers that follow the .part file (streaming uploads)
+        state = {"downloaded": 0, "contiguous": 0}
+        finished_spans = set()
+        errors: List[BaseException] = []
+        lock = threading.Lock()
+
+        def progress(nbytes: int):
+            with lock:
+                state["downloaded"] += nbytes
+                elapsed = time.time() - started
+                self._hook_progress({
+                    "status": "downloading",
+                    "downloaded_bytes": state["downloaded"],
+                    "total_bytes": size,
+                    "filename": filename,
+                    "tmpfilename": tmpfilename,
+                    "contiguous_bytes": state["contiguous"],
+                    "elapsed": elapsed,
+                    "speed": state["downloaded"] / elapsed if elapsed else None,
+                    "eta": (size - state["downloaded"]) / (state["downloaded"] / elapsed) if state["downloaded"] and elapsed else None,
+                }, info_dict)
+
+        def span_done(start: int):
+            with lock:
+                finished_spans.add(start)
+                while state["contiguous"] in finished_spans:
+                    state["contiguous"] = min(state["contiguous"] + chunk, size)
+
+        def fetch(f, span: Tuple[int, int]):
+            pos, end = span
+            for attempt in range(retries + 1):
+                try:
+                    resp = self._open(url, headers, pos, end)
+                    if resp.status != 206:
+                        raise OSError(f"Expected 206 for bytes={pos}-{end}, got {resp.status}")
+                    f.seek(pos)
+                    while pos <= end:
+                        block = resp.read(min(256 * 1024, end - pos + 1))
+                        if not block:
+                            break
+                        f.write(block)
+                        pos += len(block)
+                        progress(len(block))
+                    resp.close()
+                    if pos > end:
+                        f.flush()
+                        span_done(span[0])
+                        return
+                    raise OSError(f"Connection closed at byte {pos} of range ending {end}")
+                except Exception as e:
+                    if errors or attempt == retries:
+                        raise
+                    self.report_warning(f"[rangesplit] {e}, retrying from byte {pos}")
+
+        def worker():
+            with open(tmpfilename, "r+b") as f:
+                while not errors:
+                    try:
+                        span = ranges.get_nowait()
+                    except queue.Empty:
+                        return
+                    try:
+                        fetch(f, span)
+                    except BaseException as e:
+                        errors.append(e)
+                        return
+
+        threads = [threading.Thread(target=worker, name=f"rangesplit-{i}", daemon=True) for i in range(workers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if errors:
+            raise errors[0]
+
+        self.try_rename(tmpfilename, filename)
+        self._hook_progress({
+            "status": "finished",
+            "downloaded_bytes": size,
+            "total_bytes": size,
+            "filename": filename,
+            "elapsed": time.time() - started,
+        }, info_dict)
+        logger.info(f"Fetched {size} bytes over {workers} connections in {time.time() - started:.1f}s")
+        return True
+
+download_engine = DownloadEngine(
+    per_platform=settings.DOWNLOAD_CONNECTIONS,
+    max_connections=settings.DOWNLOAD_MAX_CONNECTIONS,
+    split_min_bytes=settings.DOWNLOAD_SPLIT_MIN_MB * 1024 * 1024,
+    chunk_bytes=settings.DOWNLOAD_CHUNK_MB * 1024 * 1024,
+)
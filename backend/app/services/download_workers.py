@@ -0,0 +1,294 @@
+import os
+import random
+import re
+import socket
+import threading
+import logging
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+from app.core.config import settings
+from app.services.downloader import Clip, clip_tag, extractor, media_key, estimate_download_size
+from app.services.extraction_pool import PoolSaturated
+from app.services.metrics import DOWNLOAD_BYTES, DOWNLOAD_THROUGHPUT, QUEUE_WAIT_SECONDS
+from app.services.progress import ProgressReporter
+from app.services.storage import storage, InsufficientStorage
+from app.services.storage_backends import storage_backend
+from app.services.task_manager import task_manager
+from app.services.tracing import Trace, current_trace
+
+logger = logging.getLogger(__name__)
+
+# yt-dlp error messages that are worth retrying: throttling, upstream 5xx,
+# network hiccups, object storage being unreachable or slowing us down.
+# Everything else (private video, bad format) fails for good.
+_TRANSIENT_ERRORS = re.compile(
+    r"HTTP Error (?:429|5\d\d)|timed? ?out|Connection (?:reset|refused|aborted)|"
+    r"Remote end closed|IncompleteRead|Temporary failure|Got error: \d+ bytes read|"
+    r"Unable to download (?:webpage|video data)|asked us to back off|"
+    r"Could not connect to the endpoint URL|SlowDown|ServiceUnavailable",
+    re.IGNORECASE,
+)
+
+def is_transient(error: Exception) -> bool:
+    # PoolSaturated: every proxy/cookie jar is at its rate limit right now
+    return isinstance(error, PoolSaturated) or bool(_TRANSIENT_ERRORS.search(str(error)))
+
+def _complete(task_ids: List[str], filepath: str, object_key: Optional[str]):
+    task_manager.update_tasks(
+        task_ids, status="completed", progress=100, phase="done", speed=None, eta=None,
+        filepath=filepath, filename=os.path.basename(filepath), object_key=object_key, error=None,
+    )
+
+def _fail_waiter(task_id: str, error: Exception):
+    task_manager.fail_task(task_id, str(error))
+
+def process_download(
+    task_id: str,
+    url: str,
+    format_id: str,
+    handle: Optional[str] = None,
+    info: Optional[Dict[str, Any]] = None,
+    clip: Optional[Clip] = None,
+    settle_waiter: Callable[[str, Exception], None] = _fail_waiter,
+) -> bool:
+    """
+    Run one download job. Errors propagate so the worker can decide to retry.
+
+    Identical (media, format, clip range) requests share one file in the
+    storage cache: the first task downloads it and later tasks are completed
+    straight from the finished file. A task arriving while that download is
+    still running is attached to it and returns False at once, freeing the
+    worker: the owner mirrors its progress to attached tasks, completes them
+    with itself, or hands each to `settle_waiter` with its error.
+    Only downloads running in this process are shared (see Blob).
+
+    With a remote storage backend the owner uploads the file while it is
+    being downloaded, and only publishes it once the upload is complete.
+    """
+    key = storage.blob_key(media_key(url), f"{format_id}@{clip_tag(clip)}" if clip else format_id)
+    blob, owner = storage.acquire_blob(task_id, key)
+
+    if not owner:
+        # Written before attaching: once attached, the owner's updates must not be overwritten
+        task_manager.update_task(task_id, status="processing", progress=blob.progress, phase="waiting")
+        if storage.attach_waiter(blob, task_id):
+            return False
+        if blob.state != "ready":
+            # Failed just now: fail the same way the owner did, so retry/defer decisions match
+            raise blob.error or ValueError("Shared download failed")
+        _complete([task_id], str(blob.filepath), blob.object_key)
+        return True
+
+    task_manager.update_task(task_id, status="processing", progress=0, phase="downloading")
+
+    def fail_waiters(error: Exception):
+        # fail_blob has set `done`: the list can't grow any more
+        for waiter in blob.waiters:
+            try:
+                settle_waiter(waiter, error)
+            except Exception as e:
+                logger.error(f"Failing task {waiter} attached to {task_id} failed: {e}")
+
+    # Admission control: reserve the expected size before fetching a byte
+    if info is None and handle and handle == media_key(url):
+        info = extractor.get_raw_info(handle)
+    estimate = estimate_download_size(info, format_id, clip) if info else None
+    staging = storage.blob_staging_dir(key)
+    try:
+        storage.reserve(task_id, estimate or settings.STORAGE_DEFAULT_RESERVATION_MB * 1024 * 1024, staging)
+    except InsufficientStorage as e:
+        storage.fail_blob(key, staging, e)
+        fail_waiters(e)
+        raise
+
+    def publish(update):
+        blob.progress = update.get("progress", blob.progress)
+        blob.phase = update.get("phase", blob.phase)
+        task_manager.update_tasks([task_id, *blob.waiters], **update)
+
+    reporter = ProgressReporter(publish, settings.PROGRESS_MIN_INTERVAL)
+    upload = storage_backend.start_upload(key)
+    progress_hook = reporter.progress_hook
+    if upload is not None and clip is None:
+        # Clips are cut by ffmpeg, which rewrites the start of the file at the end
+        def progress_hook(d):
+            upload.follow(d)
+            reporter.progress_hook(d)
+
+    started = time.monotonic()
+    try:
+        produced = extractor.download_media(
+            url, format_id, str(staging), progress_hook,
+            handle=handle, info=info, postprocessor_hook=reporter.postprocessor_hook, clip=clip,
+        )
+        transfer_seconds = time.monotonic() - started - reporter.postprocess_seconds
+        object_key = None
+        if upload is not None:
+            publish({"phase": "uploading"})
+            object_key = upload.finish(str(storage.produced_file(staging, produced)))
+        filepath = str(storage.publish_blob(key, staging, produced, object_key=object_key))
+        size = os.path.getsize(filepath)
+        platform = media_key(url).split(":", 1)[0]
+        DOWNLOAD_BYTES.labels(platform).inc(size)
+        if transfer_seconds > 0:
+            DOWNLOAD_THROUGHPUT.labels(platform).observe(size / transfer_seconds)
+    except Exception as e:
+        if upload is not None:
+            upload.abort()
+        storage.fail_blob(key, staging, e)
+        fail_waiters(e)
+        raise
+    finally:
+        # The file itself now shows up in disk usage
+        storage.release_reservation(task_id)
+
+    # publish_blob has set `done`: every attached task is in `waiters` by now
+    _complete([task_id, *blob.waiters], filepath, object_key)
+    return True
+
+class DownloadWorkerPool:
+    """
+    A fixed number of threads pulling jobs from the SQLite queue.
+
+    Several pools (in the web process or in separate `python -m app.worker`
+    processes) can share one database: jobs are claimed with a lease that the
+    owning pool keeps renewing, and expired leases are requeued by any pool.
+    """
+    def __init__(self, concurrency: int, lease_seconds: float, poll_interval: float, max_attempts: int, retry_backoff: float):
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._active: Dict[str, str] = {}  # thread name -> task_id
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._threads:
+            return
+        recovered = task_manager.recover_expired(self.max_attempts)
+        if recovered:
+            logger.info(f"Requeued {recovered} interrupted download(s)")
+        self._stop.clear()
+        for i in range(self.concurrency):
+            t = threading.Thread(target=self._run, name=f"download-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._maintain, name="download-lease", daemon=True)
+        t.start()
+        self._threads.append(t)
+        logger.info(f"Download worker pool {self.worker_id} started with {self.concurrency} workers")
+
+    def stop(self, timeout: float = 5):
+        self._stop.set()
+        self._wakeup.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """Wake an idle worker right away instead of waiting for the next poll."""
+        self._wakeup.set()
+
+    def _run(self):
+        name = threading.current_thread().name
+        while not self._stop.is_set():
+            job = task_manager.claim_next(self.worker_id, self.lease_seconds)
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            with self._lock:
+                self._active[name] = job["id"]
+            try:
+                self._execute(job)
+            finally:
+                with self._lock:
+                    self._active.pop(name, None)
+
+    def _execute(self, job: Dict[str, Any]):
+        task_id = job["id"]
+        trace = Trace("download", task=task_id, format=job["format_id"])
+        token = current_trace.set(trace)
+        waited = max(0.0, time.time() - max(job["created_at"], job["run_after"]))
+        QUEUE_WAIT_SECONDS.labels("download").observe(waited)
+        trace.add("queue", waited)
+        outcome = "ok"
+        try:
+            clip = None
+            if job["clip_start"] is not None or job["clip_end"] is not None:
+                clip = (job["clip_start"] or 0, job["clip_end"])
+            done = process_download(
+                task_id, job["url"], job["format_id"], handle=job["handle"], info=job["info"], clip=clip,
+                settle_waiter=self._settle_waiter,
+            )
+            if not done:
+                # Attached to a running download; its owner finishes this task
+                outcome = "attached"
+        except Exception as e:
+            outcome = self._settle(job, e)
+        finally:
+            current_trace.reset(token)
+            trace.finish(outcome)
+            task_manager.update_task(task_id, trace=trace.summary())
+
+    def _settle(self, job: Dict[str, Any], error: Exception) -> str:
+        """Retry, defer or fail a job whose download raised. Returns the trace outcome."""
+        task_id = job["id"]
+        if isinstance(error, InsufficientStorage):
+            if time.time() - job["created_at"] > settings.STORAGE_ADMISSION_TIMEOUT:
+                task_manager.fail_task(task_id, str(error))
+            else:
+                logger.info(f"Task {task_id} waiting for disk space: {error}")
+                task_manager.defer_task(task_id, settings.STORAGE_ADMISSION_RETRY)
+            return "deferred"
+        if is_transient(error) and job["attempts"] < self.max_attempts:
+            delay = self.retry_backoff * 2 ** (job["attempts"] - 1) * random.uniform(0.8, 1.2)
+            logger.warning(f"Task {task_id} attempt {job['attempts']} failed ({error}), retrying in {delay:.0f}s")
+            task_manager.retry_task(task_id, delay, str(error))
+        else:
+            logger.error(f"Task {task_id} failed: {error}")
+            task_manager.fail_task(task_id, str(error))
+        return "error"
+
+    def _settle_waiter(self, task_id: str, error: Exception):
+        # An attached task fails the way its owner did, with its own attempts count
+        job = task_manager.get_job(task_id)
+        if job is not None and job["status"] == "processing":
+            self._settle(job, error)
+
+    def _maintain(self):
+        # Keep our leases alive and pick up jobs orphaned by dead workers
+        interval = self.lease_seconds / 3
+        while not self._stop.wait(interval):
+            with self._lock:
+                active = list(self._active.values())
+            # Tasks attached to a running download hold a lease but no thread
+            for task_id in active + storage.waiting_tasks():
+                task_manager.renew_lease(task_id, self.worker_id, self.lease_seconds)
+            if task_manager.recover_expired(self.max_attempts):
+                self.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            active = len(self._active)
+        return {
+            "worker_id": self.worker_id,
+            "concurrency": self.concurrency,
+            "active": active,
+            "attached": len(storage.waiting_tasks()),
+        }
+
+download_pool = DownloadWorkerPool(
+    concurrency=settings.DOWNLOAD_CONCURRENCY,
+    lease_seconds=settings.DOWNLOAD_LEASE_SECONDS,
+    poll_interval=settings.DOWNLOAD_POLL_INTERVAL,
+    max_attempts=settings.DOWNLOAD_MAX_ATTEMPTS,
+    retry_backoff=settings.DOWNLOAD_RETRY_BACKOFF,
+)
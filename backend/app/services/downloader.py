@@ -1,20 +1,203 @@
-import yt_dlp
+import copy
 import logging
 import os
+import re
 import tempfile
-import random
+import threading
 import time
 import base64
-from typing import Dict, Any, List
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
 from app.core.config import settings as app_settings
+from app.services.cache import TTLCache
+from app.services.extraction_pool import extraction_pool
+from app.services.format_index import build_format_index, predicted_size, select_option
+from app.services.identity_pool import IdentityPool, PoolEntry, blocked_status, is_network_error
+from app.services.metrics import EXTRACTION_SECONDS
+from app.services.tracing import phase, ytdlp_logger
+
+# yt_dlp, and ydl_pool / download_engine which build on it, are imported where
+# they are used: loading yt-dlp is most of the API's cold start, and the
+# background warm-up (see app.services.warmup) pulls it in right after boot
 
 logger = logging.getLogger(__name__)
 
+class Route(NamedTuple):
+    """Where a URL goes: platform, canonical media ID/URL and the yt-dlp extractor to use."""
+    kind: str               # "video" or "playlist"
+    platform: str
+    media_id: str
+    url: str                # canonical URL handed to yt-dlp
+    ie_key: Optional[str]   # None = let yt-dlp pick (generic links only)
+    proxied: bool           # platform blocks datacenter IPs, go through PROXY_URL
+
+    @property
+    def key(self) -> str:
+        """Canonical media key, shared by link variants (youtu.be vs watch?v=, tracking params...)."""
+        return f"{self.platform}:{self.media_id}"
+
+# (kind, platform, pattern, yt-dlp ie_key, canonical URL template, proxied).
+# Canonical URLs must still match the extractor's own _VALID_URL.
+_ROUTES = [
+    ("video", "youtube", r"^https?://(?:(?:www|m|music)\.)?youtube\.com/(?:watch\?(?:.*&)?v=|shorts/|embed/|live/|v/)(?P<id>[\w-]{11})",
+     "Youtube", "https://www.youtube.com/watch?v={id}", True),
+    ("video", "youtube", r"^https?://youtu\.be/(?P<id>[\w-]{11})",
+     "Youtube", "https://www.youtube.com/watch?v={id}", True),
+    ("playlist", "youtube", r"^https?://(?:(?:www|m|music)\.)?youtube\.com/(?:playlist|watch)\?(?:.*&)?list=(?P<id>[\w-]+)",
+     "YoutubeTab", "https://www.youtube.com/playlist?list={id}", True),
+    ("playlist", "youtube", r"^https?://(?:(?:www|m)\.)?youtube\.com/(?P<id>(?:@[\w.-]+|channel/[\w-]+|c/[\w.-]+|user/[\w.-]+)(?:/(?:videos|shorts|streams|playlists))?)/?(?:[?#]|$)",
+     "YoutubeTab", "https://www.youtube.com/{id}", True),
+    ("video", "instagram", r"^https?://(?:www\.)?instagram\.com/(?:[\w.]+/)?(?:p|reels?|tv)/(?P<id>[\w-]+)",
+     "Instagram", "https://www.instagram.com/p/{id}/", True),
+    ("video", "twitter", r"^https?://(?:(?:www|mobile)\.)?(?:twitter|x)\.com/(?:i/web|\w+)/status(?:es)?/(?P<id>\d+)",
+     "Twitter", "https://x.com/i/web/status/{id}", False),
+    ("video", "pinterest", r"^https?://(?:[\w-]+\.)?pinterest\.[\w.]+/pin/(?:[\w-]*--)?(?P<id>\d+)",
+     "Pinterest", "https://www.pinterest.com/pin/{id}/", False),
+    # Short links only resolve to a pin after a redirect, let yt-dlp follow it
+    ("video", "pinterest", r"^https?://pin\.it/(?P<id>\w+)",
+     None, "https://pin.it/{id}", False),
+]
+
+class UrlRouter:
+    """
+    Precompiled URL router: canonicalizes a link once and picks the platform,
+    media ID and extractor, so yt-dlp doesn't test the URL against its whole
+    extractor list and unsupported links are refused before any yt-dlp work.
+    """
+    def __init__(self, allow_generic: bool = False):
+        self.allow_generic = allow_generic
+        self._routes = [
+            (kind, platform, re.compile(pattern), ie_key, template, proxied)
+            for kind, platform, pattern, ie_key, template, proxied in _ROUTES
+        ]
+
+    def route(self, url: str, kind: str = "video") -> Route:
+        url = url.strip()
+        for route_kind, platform, pattern, ie_key, template, proxied in self._routes:
+            if route_kind != kind:
+                continue
+            match = pattern.match(url)
+            if match:
+                media_id = match.group("id")
+                return Route(kind, platform, media_id, template.format(id=media_id), ie_key, proxied)
+
+        parsed = urlparse(url)
+        if self.allow_generic and parsed.scheme in ("http", "https") and parsed.hostname:
+            host = parsed.hostname.lower()
+            if host.startswith("www."):
+                host = host[4:]
+            if parsed.port:
+                host = f"{host}:{parsed.port}"
+            path = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+            return Route(kind, "generic", f"{host}{path}", url, None, False)
+        raise ValueError("Unsupported URL. Supported platforms: YouTube, Instagram, Pinterest, X (Twitter)")
+
+url_router = UrlRouter(allow_generic=app_settings.ALLOW_GENERIC_URLS)
+
+def route_url(url: str, kind: str = "video") -> Route:
+    return url_router.route(url, kind)
+
+def media_key(url: str) -> str:
+    return route_url(url).key
+
+# Key in stored info dicts recording which proxy/cookie jar extracted them.
+# Signed stream URLs are often bound to that IP, so downloads reuse it.
+IDENTITY_KEY = "__mediasense_identity"
+# Median request latency of the extraction, handed back from the (possibly
+# out-of-process) yt-dlp call and popped before the info is stored
+LATENCY_KEY = "__mediasense_request_latency"
+
+class Identity(NamedTuple):
+    """The proxy and cookie jar one request goes out with (None = direct / no cookies)."""
+    proxy: Optional[PoolEntry]
+    cookies: Optional[PoolEntry]
+
+    def pin(self) -> Dict[str, Optional[str]]:
+        return {
+            "proxy": self.proxy.id if self.proxy else None,
+            "cookies": self.cookies.id if self.cookies else None,
+        }
+
+def _url_expiry(url: str) -> Optional[int]:
+    """
+    Expiry timestamp embedded in a signed CDN URL, if we know how to read it.
+    googlevideo uses `expire=<epoch>`, Instagram/Facebook CDNs `oe=<hex epoch>`.
+    """
+    query = parse_qs(urlparse(url).query)
+    try:
+        if 'expire' in query:
+            return int(query['expire'][0])
+        if 'Expires' in query:
+            return int(query['Expires'][0])
+        if 'oe' in query:
+            return int(query['oe'][0], 16)
+    except ValueError:
+        pass
+    return None
+
+def stream_urls_expired(info: Dict[str, Any], margin: int = 60) -> bool:
+    """True if any signed stream URL in the info dict expires within `margin` seconds."""
+    deadline = time.time() + margin
+    for f in info.get('formats') or []:
+        expires = _url_expiry(f.get('url') or '')
+        if expires is not None and expires < deadline:
+            return True
+    return False
+
+# A (start, end) time range in seconds; end None = until the end of the media
+Clip = Tuple[float, Optional[float]]
+
+def clip_tag(clip: Clip) -> str:
+    """Short, filename-safe description of a clip, e.g. "65-120s" or "600s-end"."""
+    start, end = clip
+    return f"{start:g}-{end:g}s" if end is not None else f"{start:g}s-end"
+
+def estimate_download_size(info: Dict[str, Any], format_id: str, clip: Optional[Clip] = None) -> Optional[int]:
+    """
+    Predict how many bytes a download will need on disk, from yt-dlp's
+    filesize/filesize_approx (or bitrate x duration). None if we can't tell.
+    Merged downloads count twice: the parts and the merged output coexist.
+    Clips are cut and merged by a single ffmpeg pass, so they only count
+    their share of the duration.
+    """
+    formats = info.get('formats') or []
+    duration = info.get('duration')
+
+    def size_of(f):
+        return predicted_size(f, duration)
+
+    if format_id == 'best':
+        videos = [f for f in formats if f.get('vcodec') not in (None, 'none') and f.get('height')]
+        audios = [f for f in formats if f.get('vcodec') == 'none' and f.get('acodec') not in (None, 'none')]
+        picks = []
+        if videos:
+            picks.append(max(videos, key=lambda f: (f.get('height') or 0, f.get('tbr') or 0)))
+        if audios:
+            picks.append(max(audios, key=lambda f: f.get('tbr') or 0))
+        if not picks and formats:
+            picks.append(formats[-1])
+    else:
+        by_id = {f.get('format_id'): f for f in formats}
+        picks = [by_id.get(fid) for fid in format_id.split('+')]
+
+    if not picks or any(f is None for f in picks):
+        return None
+    sizes = [size_of(f) for f in picks]
+    if any(size is None for size in sizes):
+        return None
+    total = sum(sizes)
+    if clip and duration:
+        end = min(clip[1] if clip[1] is not None else duration, duration)
+        return int(total * max(end - clip[0], 0) / duration)
+    return total * 2 if len(picks) > 1 else total
+
 class MediaExtractor:
     def __init__(self):
-        self.cookie_file_path = None
-        if app_settings.COOKIES_CONTENT:
-            self.cookie_file_path = self._write_cookies_file(app_settings.COOKIES_CONTENT)
+        # Built on first use (or by the warm-up): decoding and writing the
+        # cookie files shouldn't hold up startup
+        self._proxy_pool: Optional[IdentityPool] = None
+        self._cookie_pool: Optional[IdentityPool] = None
+        self._identity_lock = threading.Lock()
 
         self.ydl_opts = {
             'quiet': False,
@@ -31,9 +214,14 @@ class MediaExtractor:
             # Force IPv4 to avoid common IPv6 blocks in datacenters
             'source_address': '0.0.0.0', 
             'outtmpl': '%(title)s.%(ext)s',
+            # Output goes to the "yt_dlp" logger and marks trace phases (webpage, formats, download...)
+            'logger': ytdlp_logger,
+            # Among formats of the same resolution prefer mp4 + m4a (or webm + opus):
+            # those merge with a plain stream copy
+            'format_sort': app_settings.FORMAT_SORT,
             # Anti-bot measures
             # 'user_agent': '...', # REMOVED: Let yt-dlp pick the correct UA for the client (ios/android)
-            'sleep_interval': random.randint(2, 5),
+            # Request pacing is done per host by host_limiter (see ydl_pool), not a fixed sleep
             # Removed specific player_client args to let new yt-dlp version handle defaults
             'http_headers': {
                 'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
@@ -42,124 +230,382 @@ class MediaExtractor:
             }
         }
 
-        if self.cookie_file_path:
-            self.ydl_opts['cookiefile'] = self.cookie_file_path
+        # Normalized analyze results keyed by canonical media ID
+        self.cache = TTLCache(
+            ttl_seconds=app_settings.ANALYZE_CACHE_TTL,
+            max_entries=app_settings.ANALYZE_CACHE_MAX_ENTRIES,
+        )
+
+    def _init_identities(self):
+        with self._identity_lock:
+            if self._cookie_pool is not None:
+                return
+            cookie_contents = list(app_settings.COOKIES_CONTENTS)
+            if app_settings.COOKIES_CONTENT:
+                cookie_contents.append(app_settings.COOKIES_CONTENT)
+            cookie_files = [path for path in map(self._write_cookies_file, cookie_contents) if path]
+
+            proxy_urls = list(app_settings.PROXY_URLS)
+            if app_settings.PROXY_URL and app_settings.PROXY_URL not in proxy_urls:
+                proxy_urls.append(app_settings.PROXY_URL)
+
+            pool_settings = dict(
+                rate_per_minute=app_settings.IDENTITY_RATE_PER_MINUTE,
+                burst=app_settings.IDENTITY_BURST,
+                min_health=app_settings.IDENTITY_MIN_HEALTH,
+                latency_target=app_settings.IDENTITY_LATENCY_TARGET,
+                quarantine_seconds=app_settings.IDENTITY_QUARANTINE_SECONDS,
+                max_quarantine_seconds=app_settings.IDENTITY_MAX_QUARANTINE_SECONDS,
+                acquire_timeout=app_settings.IDENTITY_ACQUIRE_TIMEOUT,
+            )
+            # Proxies are only used for platforms that block datacenter IPs (see Route.proxied)
+            self._proxy_pool = IdentityPool("proxy", proxy_urls, **pool_settings)
+            self._cookie_pool = IdentityPool("cookies", cookie_files, **pool_settings)
 
-        if self.cookie_file_path:
-            self.ydl_opts['cookiefile'] = self.cookie_file_path
+    @property
+    def proxy_pool(self) -> IdentityPool:
+        if self._proxy_pool is None:
+            self._init_identities()
+        return self._proxy_pool
 
-        # Proxy is now applied dynamically in _get_opts based on the URL
-        self.proxy_url = app_settings.PROXY_URL
+    @property
+    def cookie_pool(self) -> IdentityPool:
+        if self._cookie_pool is None:
+            self._init_identities()
+        return self._cookie_pool
 
-    def _get_opts(self, url: str) -> Dict[str, Any]:
+    def warm_up(self):
         """
-        Get options with proxy applied only for YouTube.
+        Pay the first request's setup cost ahead of time: import yt-dlp and
+        the extractors we route to, write the cookie files and park one warm
+        extraction YoutubeDL per cookie jar in ydl_pool. In process executor mode the worker processes still warm
+        up on their first job.
+        """
+        from app.services.ydl_pool import ydl_pool
+        ie_keys = {ie_key for _, _, _, ie_key, _, _ in _ROUTES if ie_key}
+        for cookies in self.cookie_pool.entries or [None]:
+            identity = Identity(None, cookies)
+            opts = self.ydl_opts.copy()
+            if cookies:
+                opts['cookiefile'] = cookies.value
+            with ydl_pool.lease(self._profile("extract", identity), opts) as ydl:
+                # Loads the extractor modules our routes use
+                for ie_key in ie_keys | {"Generic"}:
+                    ydl.get_info_extractor(ie_key)
+        if url_router.allow_generic:
+            # Generic links are tested against every extractor's URL pattern;
+            # compiling those ~1900 regexes is half a second on the first one
+            from yt_dlp.extractor import gen_extractor_classes
+            for ie in gen_extractor_classes():
+                ie.suitable("")
+
+    def request_opts(self, route: Route, identity: Identity) -> Dict[str, Any]:
+        """
+        yt-dlp options for one request going out through `identity` (proxy /
+        cookie jar). Also used by the streamer for its own yt-dlp and ffmpeg runs.
         """
         opts = self.ydl_opts.copy()
-        # Check if it's a YouTube or Instagram URL (both aggressively block IPs)
-        if any(domain in url for domain in ["youtube.com", "youtu.be", "instagram.com"]):
-            if self.proxy_url:
-                opts['proxy'] = self.proxy_url
-                logger.info(f"Using Proxy for URL: {url}")
+        if identity.proxy:
+            opts['proxy'] = identity.proxy.value
+            logger.info(f"Using {identity.proxy.id} for {route.key}")
+        if identity.cookies:
+            opts['cookiefile'] = identity.cookies.value
         return opts
 
-    def download_media(self, url: str, format_id: str, output_dir: str, progress_hook=None) -> str:
+    def acquire_identity(self, route: Route, info: Optional[Dict[str, Any]] = None) -> Identity:
+        """
+        Pick a proxy (proxied platforms only) and cookie jar by health, waiting
+        for their rate limits. Prefers the ones that extracted `info`.
+        """
+        pinned = (info or {}).get(IDENTITY_KEY) or {}
+        proxy = self.proxy_pool.acquire(prefer=pinned.get("proxy")) if route.proxied else None
+        cookies = self.cookie_pool.acquire(prefer=pinned.get("cookies"))
+        return Identity(proxy, cookies)
+
+    def pinned_identity(self, route: Route, info: Dict[str, Any]) -> Identity:
+        """The identity that extracted `info`, without spending rate-limit tokens."""
+        pinned = info.get(IDENTITY_KEY) or {}
+        proxy = self.proxy_pool.get(pinned.get("proxy")) if route.proxied else None
+        return Identity(proxy, self.cookie_pool.get(pinned.get("cookies")))
+
+    def report_identity(self, identity: Identity, latency: Optional[float], error: Optional[Exception] = None):
+        """
+        Feed a request outcome into the pools' health scores. Errors that are
+        not the proxy's or account's fault (private video, bad URL) don't count.
+        `latency` is the median per-request latency of an extraction (see
+        ThrottledYoutubeDL.request_seconds), not its total time, so heavy pages
+        that need many requests don't make a proxy look slow. None for downloads.
+        """
+        status = blocked_status(str(error)) if error else None
+        if error is not None and status is None and not is_network_error(str(error)):
+            return
+        for pool, entry in ((self.proxy_pool, identity.proxy), (self.cookie_pool, identity.cookies)):
+            pool.report(entry, error is None, latency, status)
+
+    def _profile(self, purpose: str, identity: Identity) -> str:
+        """Name of the warm YoutubeDL profile in ydl_pool for this purpose and identity."""
+        proxy = identity.proxy.id if identity.proxy else "direct"
+        cookies = identity.cookies.id if identity.cookies else "anon"
+        return f"{purpose}:{proxy}:{cookies}"
+
+    def lease(self, route: Route, identity: Identity, purpose: str = "extract", **overrides):
+        """
+        Borrow a warm YoutubeDL for `route` going out through `identity`.
+        purpose is "extract" (simulate only) or "download"; overrides apply
+        to this lease only.
+        """
+        from app.services.ydl_pool import ydl_pool
+        opts = self.request_opts(route, identity)
+        if purpose == "download":
+            opts['simulate'] = False
+            opts['skip_download'] = False
+        return ydl_pool.lease(self._profile(purpose, identity), opts, **overrides)
+
+    def download_media(
+        self,
+        url: str,
+        format_id: str,
+        output_dir: str,
+        progress_hook=None,
+        handle: Optional[str] = None,
+        info: Optional[Dict[str, Any]] = None,
+        postprocessor_hook=None,
+        clip: Optional[Clip] = None,
+    ) -> str:
         """
         Download media to the specified directory.
         Returns the path to the downloaded file.
+
+        If `info` is given, or `handle` points at a still-valid analyze result,
+        the stored formats are downloaded directly instead of running the
+        extractor a second time.
+
+        With `clip`, only that time range is fetched: yt-dlp hands the
+        download to ffmpeg, which seeks in the DASH/HLS playlist or, for
+        progressive files, with byte-range requests from the nearest
+        keyframe, and stream-copies the result (no re-encode, so the cut
+        lands on the keyframe at or before `start`).
         """
-        opts = self._get_opts(url)
-        opts['simulate'] = False
-        opts['skip_download'] = False
-        opts['paths'] = {'home': output_dir}
-        if progress_hook:
-            opts['progress_hooks'] = [progress_hook]
+        import yt_dlp
+        from app.services.download_engine import download_engine
+        route = route_url(url)
+        overrides = {
+            'paths': {'home': output_dir},
+            'format': 'bestvideo+bestaudio/best' if format_id == 'best' else format_id,
+            'progress_hooks': [progress_hook] if progress_hook else [],
+            'postprocessor_hooks': [postprocessor_hook] if postprocessor_hook else [],
+        }
+        if clip is not None:
+            start, end = clip
+            overrides['download_ranges'] = yt_dlp.utils.download_range_func(
+                None, [(start, end if end is not None else float('inf'))],
+            )
+            overrides['force_keyframes_at_cuts'] = False
+            overrides['outtmpl'] = {'default': f"%(title)s [{clip_tag(clip)}].%(ext)s"}
 
-        if format_id == 'best':
-            opts['format'] = 'bestvideo+bestaudio/best'
-        else:
-            opts['format'] = format_id
+        # Only trust a handle that belongs to this URL
+        if info is None and handle and handle == route.key:
+            info = self.get_raw_info(handle)
+        if info is not None and stream_urls_expired(info):
+            logger.info(f"Stored stream URLs for {handle} expired, re-extracting")
+            info = None
 
+        with phase("identity"):
+            identity = self.acquire_identity(route, info)
         try:
-            with yt_dlp.YoutubeDL(opts) as ydl:
-                info = ydl.extract_info(url, download=True)
-                # yt-dlp might return a list if it's a playlist (disabled) or just info
-                # The filename can be tricky to predict exactly because of merging.
-                # We often use 'prepare_filename' but it might differ after merge.
-                # A robust way is to finding the file in the dir since we make a unique dir.
-                return ydl.prepare_filename(info)
+            with download_engine.connections(route.platform) as connections:
+                # Parallel DASH/HLS fragments, or Range parts for big progressive files
+                overrides['concurrent_fragment_downloads'] = connections
+                overrides['split_connections'] = connections
+                with self.lease(route, identity, "download", **overrides) as ydl:
+                    if info is not None:
+                        try:
+                            # process_ie_result mutates the dict, so work on a copy
+                            info = ydl.process_ie_result(copy.deepcopy(info), download=True)
+                            self.report_identity(identity, None)
+                            return ydl.prepare_filename(info)
+                        except (yt_dlp.utils.DownloadError, yt_dlp.utils.ReExtractInfo) as e:
+                            logger.warning(f"Download from stored info failed ({e}), re-extracting")
+                            if handle:
+                                self.cache.invalidate(handle)
+                    info = ydl.extract_info(route.url, download=True, ie_key=route.ie_key)
+                    # yt-dlp might return a list if it's a playlist (disabled) or just info
+                    # The filename can be tricky to predict exactly because of merging.
+                    # We often use 'prepare_filename' but it might differ after merge.
+                    # A robust way is to finding the file in the dir since we make a unique dir.
+                    self.report_identity(identity, None)
+                    return ydl.prepare_filename(info)
         except Exception as e:
+            self.report_identity(identity, None, e)
             logger.error(f"Download failed: {str(e)}")
             raise ValueError(f"Download failed: {str(e)}")
 
 
     def extract_info(self, url: str) -> Dict[str, Any]:
+        """
+        Return normalized media info, served from the cache when possible.
+        Concurrent calls for the same media share a single extraction.
+        """
+        route = route_url(url)
+        return self.cache.get_or_load(route.key, lambda: self._extract(route))["data"]
+
+    def extract_playlist_page(self, url: str, offset: int, limit: int) -> Dict[str, Any]:
+        """
+        One page of a playlist/channel using flat extraction: IDs, titles and
+        thumbnails only, no per-entry format resolution. yt-dlp fetches only
+        the continuation pages needed to reach `offset + limit`.
+        Entries are resolved later, one by one, through extract_info.
+        """
+        route = route_url(url, kind="playlist")
+        key = f"playlist:{route.key}:{offset}:{limit}"
+        return self.cache.get_or_load(key, lambda: self._extract_playlist(route, offset, limit))["data"]
+
+    def _extract_playlist(self, route: Route, offset: int, limit: int) -> Dict[str, Any]:
+        overrides = {
+            'noplaylist': False,
+            'extract_flat': 'in_playlist',
+            # One extra entry tells us whether there is a next page
+            'playlist_items': f"{offset + 1}:{offset + limit + 1}",
+        }
+        with phase("identity"):
+            identity = self.acquire_identity(route)
+        try:
+            info = extraction_pool.offload(
+                _extract_playlist_raw, route.url, self._profile("extract", identity),
+                self.request_opts(route, identity), route.ie_key, overrides,
+            )
+            self.report_identity(identity, info.pop(LATENCY_KEY, None))
+        except Exception as e:
+            self.report_identity(identity, None, e)
+            logger.error(f"Playlist extraction failed: {str(e)}")
+            raise ValueError(f"Failed to extract playlist: {str(e)}")
+
+        if info.get('_type') not in ('playlist', 'multi_video'):
+            raise ValueError("URL is not a playlist or channel")
+
+        entries = []
+        for entry in (info.get('entries') or [])[:limit]:
+            if not entry:
+                continue
+            thumbnails = entry.get('thumbnails') or []
+            entries.append({
+                "id": entry.get('id'),
+                "url": entry.get('url') or entry.get('webpage_url'),
+                "title": entry.get('title'),
+                "thumbnail": entry.get('thumbnail') or (thumbnails[-1].get('url') if thumbnails else None),
+                "duration": self._format_duration(entry.get('duration')),
+            })
+        has_more = len(info.get('entries') or []) > limit
+
+        data = {
+            "id": info.get('id'),
+            "title": info.get('title'),
+            "platform": info.get('extractor_key'),
+            "entry_count": info.get('playlist_count'),
+            "entries": entries,
+            "next_cursor": str(offset + limit) if has_more else None,
+        }
+        return {"info": None, "data": data}
+
+    def cached_result(self, url: str) -> Optional[Dict[str, Any]]:
+        """Normalized info for a URL if it is already cached, without extracting."""
+        entry = self.cache.get(route_url(url).key)
+        return entry["data"] if entry else None
+
+    def get_raw_info(self, handle: str) -> Optional[Dict[str, Any]]:
+        """The raw yt-dlp info dict stored under an analyze handle, if still cached."""
+        entry = self.cache.get(handle)
+        return entry["info"] if entry else None
+
+    def get_format_index(self, handle: str) -> Optional[Dict[str, Any]]:
+        """The format index built at analyze time for a handle, if still cached."""
+        entry = self.cache.get(handle)
+        return entry.get("index") if entry else None
+
+    def _extract(self, route: Route) -> Dict[str, Any]:
+        requested = time.monotonic()
+        with phase("identity"):
+            identity = self.acquire_identity(route)
+        info = None
         try:
-            with yt_dlp.YoutubeDL(self._get_opts(url)) as ydl:
-                info = ydl.extract_info(url, download=False)
-                return self._process_info(info)
+            info = extraction_pool.offload(
+                _extract_raw, route.url, self._profile("extract", identity),
+                self.request_opts(route, identity), route.ie_key,
+            )
+            self.report_identity(identity, info.pop(LATENCY_KEY, None))
+            info[IDENTITY_KEY] = identity.pin()
+            with phase("index"):
+                index = build_format_index(info)
+                data = self._process_info(info, index)
+            # The cache key doubles as the handle clients pass back to /download
+            data["handle"] = route.key
+            EXTRACTION_SECONDS.labels(route.platform, "ok").observe(time.monotonic() - requested)
+            return {"info": info, "data": data, "index": index}
         except Exception as e:
+            if info is None:
+                self.report_identity(identity, None, e)
+            EXTRACTION_SECONDS.labels(route.platform, "error").observe(time.monotonic() - requested)
             logger.error(f"Extraction failed: {str(e)}")
             raise ValueError(f"Failed to extract media info: {str(e)}")
 
-    def _process_info(self, info: Dict[str, Any]) -> Dict[str, Any]:
+    def _process_info(self, info: Dict[str, Any], index: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Normalize the data from yt-dlp into our MediaData format.
+        Video entries come from the format index: one per height / high-fps /
+        HDR variant, each a ready-to-download video+audio pair, preferring
+        MP4-compatible and then smaller encodes.
         """
+        index = index or build_format_index(info)
         formats = []
-        seen_resolutions = set()
 
-        raw_formats = info.get('formats', [])
-        
-        # Sort best to worst
-        raw_formats.sort(key=lambda x: (x.get('height') or 0, x.get('tbr') or 0), reverse=True)
+        variants: Dict[Tuple, Dict[str, Any]] = {}
+        for option in index["options"]:
+            if not option["height"]:
+                continue
+            fps = option["fps"] if (option["fps"] or 0) > 30 else None
+            key = (option["height"], fps, option["hdr"])
+            current = variants.get(key)
+            if current is None or (option["mp4_compatible"], -(option["size"] or 0)) > (current["mp4_compatible"], -(current["size"] or 0)):
+                variants[key] = option
 
-        for f in raw_formats:
-            # Skip formats without video or audio if we want mixed, 
-            # but yt-dlp separates them often. 
-            # For now, let's list distinct video qualities and audio.
-            
-            ext = f.get('ext')
-            height = f.get('height')
-            format_id = f.get('format_id')
-            filesize = f.get('filesize')
-            
-            # Simple filtering logic
-            if height: # Video
-                res_str = f"{height}p"
-                
-                # Filter out storyboards/mhtml which often appear when main formats are blocked
-                if ext in ['mhtml', 'html', 'htm']:
-                    continue
-                if 'storyboard' in f.get('format_note', '') or 'storyboard' in f.get('protocol', ''):
-                    continue
-
-                # Removed 'ext != webm' check to allow VP9/AV1 formats which are standard now
-                if res_str not in seen_resolutions: 
-                    formats.append({
-                        "resolution": res_str,
-                        "ext": ext,
-                        "size": self._format_size(filesize),
-                        "format_id": format_id,
-                        "type": "video"
-                    })
-                    seen_resolutions.add(res_str)
-            elif f.get('acodec') != 'none' and f.get('vcodec') == 'none': # Audio only
-                 formats.append({
-                        "resolution": "Audio",
-                        "ext": ext,
-                        "size": self._format_size(filesize),
-                        "format_id": format_id,
-                        "type": "audio"
-                    })
-
-        # Add "Best" option
+        for (height, fps, hdr), option in variants.items():
+            formats.append({
+                "resolution": f"{height}p{round(fps) if fps else ''}{' HDR' if hdr else ''}",
+                "ext": option["ext"],
+                "size": self._format_size(option["size"]),
+                "format_id": option["format_id"],
+                "type": "video",
+                "filesize": option["size"],
+                "fps": option["fps"],
+                "vcodec": option["vcodec"],
+                "acodec": option["acodec"],
+                "hdr": option["hdr"],
+                "mp4_compatible": option["mp4_compatible"],
+            })
+
+        for audio in index["audios"]:
+            formats.append({
+                "resolution": "Audio",
+                "ext": audio["ext"],
+                "size": self._format_size(audio["size"]),
+                "format_id": audio["format_id"],
+                "type": "audio",
+                "filesize": audio["size"],
+                "acodec": audio["acodec"],
+            })
+
+        # "Best" is pinned to the option it describes, so the size and container
+        # shown are what gets downloaded. select_option ranks like FORMAT_SORT:
+        # the highest resolution, stream-copy friendly pair first
+        best = select_option(index, {})
+        best_size = best["size"] if best else predicted_size(info, info.get('duration'))
         formats.insert(0, {
             "resolution": "Best Quality",
-            "ext": info.get('ext', 'mp4'),
-            "size": "Variable",
-            "format_id": "best",
-            "type": "best"
+            "ext": best["ext"] if best else info.get('ext', 'mp4'),
+            "size": self._format_size(best_size) if best_size else "Variable",
+            "format_id": best["format_id"] if best else "best",
+            "type": "best",
+            "filesize": best_size,
         })
 
         return {
@@ -222,4 +668,28 @@ class MediaExtractor:
             logger.error(f"Failed to create cookies file: {e}")
             return None
 
+def _extract_raw(url: str, profile: str, opts: Dict[str, Any], ie_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Run yt-dlp extraction. Module level so it can be shipped to a process pool
+    (each worker process then keeps its own warm ydl_pool).
+    """
+    from app.services.ydl_pool import ydl_pool
+    with ydl_pool.lease(profile, opts) as ydl:
+        info = ydl.extract_info(url, download=False, ie_key=ie_key)
+        # Same cleanup as --load-info-json, so the dict can be fed back to process_ie_result
+        info = ydl.sanitize_info(info, remove_private_keys=True)
+        info[LATENCY_KEY] = ydl.request_latency()
+        return info
+
+def _extract_playlist_raw(
+    url: str, profile: str, opts: Dict[str, Any], ie_key: Optional[str], overrides: Dict[str, Any],
+) -> Dict[str, Any]:
+    from app.services.ydl_pool import ydl_pool
+    with ydl_pool.lease(profile, opts, **overrides) as ydl:
+        info = ydl.extract_info(url, download=False, ie_key=ie_key)
+        # Keep `entries` (remove_private_keys would drop it), but turn the lazy list into a real one
+        info = ydl.sanitize_info(info)
+        info[LATENCY_KEY] = ydl.request_latency()
+        return info
+
 extractor = MediaExtractor()
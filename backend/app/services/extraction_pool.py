@@ -0,0 +1,153 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from app.core.config import settings
+from app.services.metrics import QUEUE_WAIT_SECONDS
+from app.services.tracing import record
+
+logger = logging.getLogger(__name__)
+
+class PoolSaturated(Exception):
+    """Raised when a platform's wait queue is full. The API turns this into a 503."""
+    def __init__(self, platform: str, retry_after: int):
+        self.platform = platform
+        self.retry_after = retry_after
+        super().__init__(f"Too many pending extractions for {platform}, retry in {retry_after}s")
+
+class _Lane:
+    """Concurrency limit + bounded wait queue for one platform."""
+    def __init__(self, limit: int, queue_limit: int):
+        self.limit = limit
+        self.queue_limit = queue_limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+        # Moving average of how long one extraction takes, used for Retry-After
+        self.avg_seconds = 0.0
+
+    def record(self, seconds: float):
+        self.avg_seconds = seconds if not self.avg_seconds else 0.8 * self.avg_seconds + 0.2 * seconds
+
+class ExtractionPool:
+    """
+    Runs blocking yt-dlp work off the event loop.
+
+    Every platform gets its own lane with a concurrency limit and a bounded
+    queue, so a YouTube backlog can't starve Instagram (or status polls).
+    Jobs always run on a thread pool; with EXTRACTION_EXECUTOR=process the
+    yt-dlp call itself is offloaded again to a process pool (see `offload`).
+    """
+    def __init__(
+        self,
+        max_workers: int,
+        limits: Dict[str, int],
+        queue_limit: int,
+        executor_kind: str = "thread",
+        default_retry_after: int = 5,
+    ):
+        self.max_workers = max_workers
+        self.limits = limits
+        self.queue_limit = queue_limit
+        self.executor_kind = executor_kind
+        self.default_retry_after = default_retry_after
+        self._lanes: Dict[str, _Lane] = {}
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _lane(self, platform: str) -> _Lane:
+        lane = self._lanes.get(platform)
+        if lane is None:
+            limit = self.limits.get(platform, self.limits.get("default", 2))
+            lane = self._lanes[platform] = _Lane(limit, self.queue_limit)
+        return lane
+
+    def _thread_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="extract")
+            return self._threads
+
+    def _retry_after(self, lane: _Lane) -> int:
+        if not lane.avg_seconds:
+            return self.default_retry_after
+        # Rough time until the queue in front of a new request drains
+        return max(1, math.ceil(lane.avg_seconds * (lane.waiting + 1) / lane.limit))
+
+    async def run(self, platform: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run `fn` in the worker pool under the platform's limit.
+        Raises PoolSaturated straight away if the platform's queue is full.
+        """
+        lane = self._lane(platform)
+        if lane.active >= lane.limit and lane.waiting >= lane.queue_limit:
+            raise PoolSaturated(platform, self._retry_after(lane))
+
+        lane.waiting += 1
+        queued = time.monotonic()
+        try:
+            await lane.semaphore.acquire()
+        finally:
+            lane.waiting -= 1
+        lane.active += 1
+
+        started = time.monotonic()
+        QUEUE_WAIT_SECONDS.labels("extraction").observe(started - queued)
+        record("queue", started - queued)
+        loop = asyncio.get_running_loop()
+        try:
+            # Carry the request's context (its trace) into the worker thread
+            context = contextvars.copy_context()
+            future = loop.run_in_executor(self._thread_executor(), context.run, functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            lane.active -= 1
+            lane.semaphore.release()
+            raise
+
+        def _release(_):
+            # Release only when the thread is really done, even if the client went away
+            lane.record(time.monotonic() - started)
+            lane.active -= 1
+            lane.semaphore.release()
+
+        future.add_done_callback(_release)
+        return await asyncio.shield(future)
+
+    def offload(self, fn: Callable[..., Any], *args) -> Any:
+        """
+        Run a CPU-heavy callable from inside a worker thread.
+        In process mode it goes to the process pool (fn and args must be picklable).
+        """
+        if self.executor_kind != "process":
+            return fn(*args)
+        with self._lock:
+            if self._processes is None:
+                self._processes = ProcessPoolExecutor(max_workers=self.max_workers)
+            processes = self._processes
+        return processes.submit(fn, *args).result()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            platform: {"active": lane.active, "waiting": lane.waiting, "limit": lane.limit, "queue_limit": lane.queue_limit}
+            for platform, lane in self._lanes.items()
+        }
+
+    def shutdown(self):
+        if self._threads:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+        if self._processes:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+
+extraction_pool = ExtractionPool(
+    max_workers=settings.EXTRACTION_WORKERS,
+    limits=settings.EXTRACTION_CONCURRENCY,
+    queue_limit=settings.EXTRACTION_QUEUE_LIMIT,
+    executor_kind=settings.EXTRACTION_EXECUTOR,
+    default_retry_after=settings.EXTRACTION_RETRY_AFTER,
+)
@@ -0,0 +1,187 @@
+from typing import Any, Dict, List, Optional
+
+# Codecs ffmpeg can stream-copy into MP4; anything else goes to Matroska/WebM
+MP4_VIDEO = ("avc1", "avc3", "hev1", "hvc1", "av01")
+MP4_AUDIO = ("mp4a", "ac-3", "ec-3")
+WEBM_VIDEO = ("vp8", "vp9", "vp09", "av01")
+WEBM_AUDIO = ("opus", "vorbis")
+
+def merge_container(video: Dict[str, Any], audio: Dict[str, Any]) -> str:
+    """Container a video + audio pair can be stream-copied into without re-encoding."""
+    vcodec = (video.get("vcodec") or "").lower()
+    acodec = (audio.get("acodec") or "").lower()
+    if vcodec.startswith(MP4_VIDEO) and acodec.startswith(MP4_AUDIO):
+        return "mp4"
+    if vcodec.startswith(WEBM_VIDEO) and acodec.startswith(WEBM_AUDIO):
+        return "webm"
+    return "mkv"
+
+def predicted_size(f: Dict[str, Any], duration: Optional[float]) -> Optional[int]:
+    """filesize, else filesize_approx, else bitrate x duration. None if unknown."""
+    size = f.get("filesize") or f.get("filesize_approx")
+    if not size and f.get("tbr") and duration:
+        size = f["tbr"] * 1000 / 8 * duration
+    return int(size) if size else None
+
+def _is_junk(f: Dict[str, Any]) -> bool:
+    # Storyboards/mhtml often show up when the real formats are blocked
+    return (
+        f.get("ext") in ("mhtml", "html", "htm")
+        or "storyboard" in (f.get("format_note") or "")
+        or "storyboard" in (f.get("protocol") or "")
+    )
+
+def _has_video(f: Dict[str, Any]) -> bool:
+    return f.get("vcodec") not in (None, "none") or bool(f.get("height"))
+
+def _has_audio(f: Dict[str, Any]) -> bool:
+    return f.get("acodec") not in (None, "none")
+
+def _best_audio(audios: List[Dict[str, Any]], prefixes) -> Optional[Dict[str, Any]]:
+    matching = [a for a in audios if (a.get("acodec") or "").lower().startswith(prefixes)]
+    pool = matching or audios
+    return max(pool, key=lambda a: a.get("abr") or a.get("tbr") or 0) if pool else None
+
+def build_format_index(info: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Structured view of an info dict's formats, computed once at analyze time.
+
+    options: every downloadable choice: muxed formats as-is and every
+    video-only format paired with the best audio it can be stream-copied
+    with (m4a for H.264/HEVC/AV1, opus for VP9). Each option carries the
+    yt-dlp format_id ("137+140"), height, fps, HDR flag, codecs, output
+    container, predicted total size and whether it lands in an MP4 without
+    re-encoding. Sorted best first.
+    audios: audio-only formats, best first.
+    """
+    duration = info.get("duration")
+    formats = [f for f in info.get("formats") or [] if f.get("format_id") and not _is_junk(f)]
+    audios = sorted(
+        (f for f in formats if _has_audio(f) and not _has_video(f)),
+        key=lambda a: a.get("abr") or a.get("tbr") or 0,
+        reverse=True,
+    )
+
+    options = []
+    for f in formats:
+        if not _has_video(f):
+            continue
+        audio = None
+        if _has_audio(f):
+            container = f.get("ext") or "mp4"
+            mp4_compatible = container == "mp4"
+        else:
+            vcodec = (f.get("vcodec") or "").lower()
+            audio = _best_audio(audios, WEBM_AUDIO if vcodec.startswith(("vp8", "vp9", "vp09")) else MP4_AUDIO)
+            if audio is None:
+                continue
+            container = merge_container(f, audio)
+            mp4_compatible = container == "mp4"
+
+        sizes = [predicted_size(f, duration)] + ([predicted_size(audio, duration)] if audio else [])
+        options.append({
+            "format_id": f"{f['format_id']}+{audio['format_id']}" if audio else f["format_id"],
+            "height": f.get("height"),
+            "width": f.get("width"),
+            "fps": f.get("fps"),
+            "hdr": (f.get("dynamic_range") or "SDR") != "SDR",
+            "vcodec": f.get("vcodec"),
+            "acodec": (audio or f).get("acodec"),
+            "ext": container,
+            "tbr": (f.get("tbr") or 0) + ((audio or {}).get("tbr") or 0),
+            "size": None if None in sizes else sum(sizes),
+            "mp4_compatible": mp4_compatible,
+            "merged": audio is not None,
+        })
+
+    options.sort(key=lambda o: (o["height"] or 0, o["fps"] or 0, o["tbr"] or 0), reverse=True)
+    return {
+        "duration": duration,
+        "options": options,
+        "audios": [
+            {
+                "format_id": a["format_id"],
+                "acodec": a.get("acodec"),
+                "ext": a.get("ext"),
+                "abr": a.get("abr") or a.get("tbr"),
+                "size": predicted_size(a, duration),
+            }
+            for a in audios
+        ],
+    }
+
+def _matches(option: Dict[str, Any], constraints: Dict[str, Any], check_size: bool) -> bool:
+    max_height = constraints.get("max_height")
+    if max_height and (option["height"] or 0) > max_height:
+        return False
+    vcodec = constraints.get("vcodec")
+    if vcodec and not (option["vcodec"] or "").lower().startswith(vcodec.lower()):
+        return False
+    container = constraints.get("container")
+    if container and option["ext"] != container:
+        return False
+    hdr = constraints.get("hdr")
+    if hdr is not None and option["hdr"] != hdr:
+        return False
+    max_bytes = (constraints.get("max_size_mb") or 0) * 1024 * 1024
+    if check_size and max_bytes and (option["size"] is None or option["size"] > max_bytes):
+        return False
+    return True
+
+def select_option(index: Dict[str, Any], constraints: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Highest quality option satisfying the constraints (max_size_mb,
+    max_height, vcodec prefix, container, hdr: True for HDR only, False for
+    SDR only). Ranked like FORMAT_SORT ("res", "ext", then yt-dlp's own
+    order): resolution, MP4 compatibility, fps, HDR, and the smallest last.
+    With audio_only, the best audio under the size limit. None if nothing fits.
+    """
+    max_bytes = (constraints.get("max_size_mb") or 0) * 1024 * 1024
+    if constraints.get("audio_only"):
+        audios = [a for a in index["audios"] if not max_bytes or (a["size"] is not None and a["size"] <= max_bytes)]
+        return dict(audios[0], merged=False) if audios else None
+
+    candidates = [o for o in index["options"] if _matches(o, constraints, check_size=True)]
+    if not candidates and max_bytes and all(o["size"] is None for o in index["options"]):
+        # No sizes known at all: the size limit can't be checked up front
+        candidates = [o for o in index["options"] if _matches(o, constraints, check_size=False)]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda o: (
+        o["height"] or 0,
+        o["mp4_compatible"],
+        o["fps"] or 0,
+        o["hdr"],
+        -(o["size"] or 0),
+    ))
+
+def constraints_to_selector(constraints: Dict[str, Any]) -> str:
+    """
+    The same constraints as a yt-dlp format selector, for when no analyzed
+    index is at hand. Unknown sizes and heights pass the filters (`<?`).
+    """
+    max_kib = int(constraints["max_size_mb"] * 1024) if constraints.get("max_size_mb") else None
+    if constraints.get("audio_only"):
+        size = f"[filesize<?{max_kib}K]" if max_kib else ""
+        return f"ba{size}/b{size}"
+
+    video = ""
+    if constraints.get("max_height"):
+        video += f"[height<=?{constraints['max_height']}]"
+    if constraints.get("vcodec"):
+        video += f"[vcodec^={constraints['vcodec']}]"
+    if constraints.get("hdr") is False:
+        video += "[dynamic_range=SDR]"
+    elif constraints.get("hdr"):
+        # No dynamic_range reported means SDR, as in the format index
+        video += "[dynamic_range!=SDR]"
+    container = constraints.get("container")
+    audio = "[ext=m4a]" if container == "mp4" else "[ext=webm]" if container == "webm" else ""
+    single = video + (f"[ext={container}]" if container else "")
+    if max_kib:
+        # Size applies to the whole download; give the video most of the budget
+        single += f"[filesize<?{max_kib}K]"
+        video += f"[filesize<?{int(max_kib * 0.9)}K]"
+    if container in ("mp4", "webm"):
+        video += f"[ext={container}]"
+    return f"bv*{video}+ba{audio}/b{single}"
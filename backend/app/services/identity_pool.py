@@ -0,0 +1,185 @@
+import logging
+import math
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+from app.services.extraction_pool import PoolSaturated
+from app.services.rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# yt-dlp error messages that mean "this IP/account is throttled or flagged",
+# as opposed to a broken URL or a private video
+_BLOCK_PATTERNS = [
+    (re.compile(r"HTTP Error 429|Too Many Requests|rate.?limit", re.I), 429),
+    (re.compile(r"HTTP Error 403|Sign in to confirm|not a bot|login required|checkpoint", re.I), 403),
+]
+
+_NETWORK_ERRORS = re.compile(
+    r"timed? ?out|Connection (?:reset|refused|aborted)|Remote end closed|ProxyError|"
+    r"Tunnel connection failed|Temporary failure|Unable to download webpage|HTTP Error 5\d\d",
+    re.IGNORECASE,
+)
+
+def blocked_status(error: str) -> Optional[int]:
+    """429/403 if an error message says we were throttled or blocked, else None."""
+    for pattern, status in _BLOCK_PATTERNS:
+        if pattern.search(error):
+            return status
+    return None
+
+def is_network_error(error: str) -> bool:
+    """Connection-level failures, which count against a proxy's health."""
+    return bool(_NETWORK_ERRORS.search(error))
+
+class PoolEntry:
+    """
+    One proxy or cookie jar with a rolling health score and its own rate limit.
+
+    health = success rate (EWMA) x latency factor, where latency is the
+    per-request latency through this entry. 429/403 responses count as
+    failures and also quarantine the entry, for exponentially longer each
+    time they repeat; an entry whose health drops below the pool's minimum
+    (failures or latency) is quarantined too.
+    """
+    def __init__(self, entry_id: str, value: str, rate: float, burst: float):
+        self.id = entry_id
+        self.value = value
+        self.bucket = TokenBucket(rate, burst)
+        self.success = 1.0
+        self.latency = 0.0
+        self.samples = 0
+        self.blocks = 0
+        self.consecutive_blocks = 0
+        self.quarantined_until = 0.0
+
+    def health(self, latency_target: float) -> float:
+        return self.success / (1 + self.latency / latency_target)
+
+    def available(self, now: float) -> bool:
+        return now >= self.quarantined_until
+
+    def describe(self) -> str:
+        # Never expose proxy credentials or cookie contents
+        parsed = urlparse(self.value)
+        return parsed.hostname or self.id
+
+class IdentityPool:
+    """
+    Rotating pool of proxies (or cookie jars) for outgoing yt-dlp requests.
+
+    `acquire` picks an entry at random weighted by health among those that
+    are not quarantined and have a rate-limit token, waiting for a token if
+    every entry is busy. `report` feeds the outcome back into the score.
+    An empty pool always yields None (direct connection / no cookies).
+    """
+    def __init__(
+        self,
+        kind: str,
+        values: List[str],
+        rate_per_minute: float,
+        burst: float,
+        min_health: float = 0.3,
+        quarantine_seconds: float = 120,
+        max_quarantine_seconds: float = 1800,
+        latency_target: float = 2.0,
+        acquire_timeout: float = 20,
+        alpha: float = 0.2,
+    ):
+        self.kind = kind
+        self.entries = [PoolEntry(f"{kind}{i}", v, rate_per_minute / 60, burst) for i, v in enumerate(values)]
+        self.min_health = min_health
+        self.quarantine_seconds = quarantine_seconds
+        self.max_quarantine_seconds = max_quarantine_seconds
+        self.latency_target = latency_target
+        self.acquire_timeout = acquire_timeout
+        self.alpha = alpha
+        self._lock = threading.Lock()
+
+    def get(self, entry_id: Optional[str]) -> Optional[PoolEntry]:
+        return next((e for e in self.entries if e.id == entry_id), None)
+
+    def acquire(self, prefer: Optional[str] = None) -> Optional[PoolEntry]:
+        """
+        Take a rate-limit token from a healthy entry. `prefer` pins a specific
+        entry (e.g. the proxy whose IP the stream URLs are bound to) as long
+        as it is not quarantined. Raises PoolSaturated if no token frees up
+        within `acquire_timeout`.
+        """
+        if not self.entries:
+            return None
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                candidates = [e for e in self.entries if e.available(now)]
+                if not candidates:
+                    # Everything is quarantined: better to try the entry that comes back first than fail outright
+                    fallback = min(self.entries, key=lambda e: e.quarantined_until)
+                    logger.warning(f"All {self.kind} entries quarantined, using {fallback.id}")
+                    candidates = [fallback]
+                pinned = self.get(prefer)
+                if pinned in candidates:
+                    candidates = [pinned]
+
+                ready = [e for e in candidates if e.bucket.wait_time() == 0]
+                if ready:
+                    weights = [max(e.health(self.latency_target), 0.01) for e in ready]
+                    for entry in random.choices(ready, weights=weights, k=len(ready)):
+                        if entry.bucket.try_acquire():
+                            return entry
+                wait = min(e.bucket.wait_time() for e in candidates)
+
+            if now + wait > deadline:
+                raise PoolSaturated(self.kind, max(1, math.ceil(wait)))
+            time.sleep(min(max(wait, 0.05), 1.0))
+
+    def report(self, entry: Optional[PoolEntry], ok: bool, latency: Optional[float] = None, status: Optional[int] = None):
+        if entry is None:
+            return
+        with self._lock:
+            entry.samples += 1
+            entry.success += self.alpha * ((1.0 if ok else 0.0) - entry.success)
+            if latency is not None and ok:
+                entry.latency = latency if not entry.latency else entry.latency + self.alpha * (latency - entry.latency)
+
+            if status in (429, 403):
+                entry.blocks += 1
+                entry.consecutive_blocks += 1
+                self._quarantine(entry, self.quarantine_seconds * 2 ** (entry.consecutive_blocks - 1), status)
+                return
+            if ok:
+                entry.consecutive_blocks = 0
+            # Checked on successes too: an entry can get too slow without failing
+            if entry.samples >= 5 and entry.health(self.latency_target) < self.min_health:
+                self._quarantine(entry, self.quarantine_seconds, None)
+
+    def _quarantine(self, entry: PoolEntry, seconds: float, status: Optional[int]):
+        seconds = min(seconds, self.max_quarantine_seconds)
+        entry.quarantined_until = time.monotonic() + seconds
+        # Back on probation afterwards: enough weight to get traffic, not enough to dominate
+        entry.success = max(entry.success, 0.5)
+        entry.samples = 0
+        # and its latency is measured afresh, or a once-slow entry would be quarantined again on sight
+        entry.latency = 0.0
+        reason = f"HTTP {status}" if status else f"health below {self.min_health}"
+        logger.warning(f"Taking {self.kind} {entry.id} ({entry.describe()}) out of rotation for {seconds:.0f}s: {reason}")
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "id": e.id,
+                    "host": e.describe() if self.kind == "proxy" else None,
+                    "health": round(e.health(self.latency_target), 3),
+                    "success_rate": round(e.success, 3),
+                    "latency": round(e.latency, 3),
+                    "blocks": e.blocks,
+                    "quarantined_for": max(0, round(e.quarantined_until - now)),
+                }
+                for e in self.entries
+            ]
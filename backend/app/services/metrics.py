@@ -0,0 +1,80 @@
+import os
+from typing import Tuple
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+from app.services.storage import storage
+from app.services.task_manager import task_manager
+
+# With several uvicorn/worker processes, point PROMETHEUS_MULTIPROC_DIR at a
+# shared empty directory: every process then writes its samples there and
+# /metrics aggregates them.
+_MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+_SECONDS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+EXTRACTION_SECONDS = Histogram(
+    "mediasense_extraction_seconds",
+    "yt-dlp extraction latency (proxy/cookie wait included)",
+    ["platform", "outcome"],
+    buckets=_SECONDS,
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "mediasense_queue_wait_seconds",
+    "Time spent waiting for a worker: extraction lane, download job queue or post-processing slot",
+    ["queue"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900),
+)
+DOWNLOAD_THROUGHPUT = Histogram(
+    "mediasense_download_throughput_bytes_per_second",
+    "Average transfer rate of finished downloads (post-processing excluded)",
+    ["platform"],
+    buckets=(1e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2.5e7, 5e7, 1e8, 2.5e8),
+)
+DOWNLOAD_BYTES = Counter("mediasense_download_bytes", "Bytes of finished downloads", ["platform"])
+POSTPROCESS_SECONDS = Histogram(
+    "mediasense_postprocess_seconds",
+    "ffmpeg post-processing time (merge, remux, audio extraction...), queueing excluded",
+    ["postprocessor"],
+    buckets=_SECONDS,
+)
+FILE_SERVE_BYTES = Histogram(
+    "mediasense_file_serve_bytes",
+    "Bytes per file response; `accel` responses are sent by the front proxy",
+    ["mode"],
+    buckets=(1e5, 1e6, 1e7, 5e7, 1e8, 5e8, 1e9, 5e9),
+)
+UPLOAD_SECONDS = Histogram(
+    "mediasense_upload_tail_seconds",
+    "Time from the end of a download until its upload to object storage was complete; "
+    "`streamed` uploads overlapped the download, `whole` ones started after it",
+    ["mode"],
+    buckets=_SECONDS,
+)
+
+class _StateCollector:
+    """Gauges read from shared state at scrape time, so every process reports the same numbers."""
+    def describe(self):
+        # Skip the collect() call register() would otherwise make at import time
+        return []
+
+    def collect(self):
+        tasks = GaugeMetricFamily("mediasense_tasks", "Download tasks by status", labels=["status"])
+        for status, count in task_manager.status_counts().items():
+            tasks.add_metric([status], count)
+        yield tasks
+        yield GaugeMetricFamily("mediasense_queue_depth", "Download jobs waiting to run", value=task_manager.queue_depth())
+        yield GaugeMetricFamily(
+            "mediasense_temp_downloads_bytes", "Disk used by the download directory", value=storage.directory_usage(),
+        )
+
+if _MULTIPROCESS:
+    _registry = CollectorRegistry()
+    MultiProcessCollector(_registry)
+else:
+    _registry = REGISTRY
+_registry.register(_StateCollector())
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Body and content type for the /metrics endpoint."""
+    return generate_latest(_registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,93 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+from app.core.config import settings
+from app.services.metrics import POSTPROCESS_SECONDS, QUEUE_WAIT_SECONDS
+from app.services.tracing import record
+
+logger = logging.getLogger(__name__)
+
+class PostProcessPool:
+    """
+    Separate, small pool for ffmpeg work (merging, remuxing, audio extraction,
+    thumbnail embedding), so N downloads finishing together can't start N
+    ffmpeg processes and pin every CPU.
+
+    Download threads hand their post-processing step to this pool and wait
+    for it. Each pool thread lowers its own priority (`nice`) and restricts
+    itself to `cpus` when it starts; on Linux both are per thread and are
+    inherited by the ffmpeg processes the thread spawns.
+    """
+    def __init__(self, workers: int, nice: int = 0, cpus: List[int] = None):
+        self.workers = workers
+        self.nice = nice
+        self.cpus = cpus or []
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="postprocess", initializer=self._init_thread,
+        )
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+
+    def _init_thread(self):
+        if self.nice and hasattr(os, "setpriority"):
+            try:
+                # PRIO_PROCESS with a thread id only affects that thread on Linux
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+            except OSError as e:
+                logger.warning(f"Could not renice post-processing thread: {e}")
+        if self.cpus and hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(0, self.cpus)
+            except OSError as e:
+                logger.warning(f"Could not pin post-processing thread to CPUs {self.cpus}: {e}")
+
+    def run(self, name: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run post-processor `name` (`fn`) on a post-processing thread and wait
+        for its result (or exception).
+        """
+        with self._lock:
+            self._queued += 1
+        queued = time.monotonic()
+
+        def task():
+            started = time.monotonic()
+            QUEUE_WAIT_SECONDS.labels("postprocess").observe(started - queued)
+            record("postprocess_queue", started - queued)
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                POSTPROCESS_SECONDS.labels(name).observe(time.monotonic() - started)
+                with self._lock:
+                    self._active -= 1
+                    self._completed += 1
+
+        # The caller's context carries its trace over to the pool thread
+        return self._executor.submit(contextvars.copy_context().run, task).result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "active": self._active,
+                "queued": self._queued,
+                "completed": self._completed,
+            }
+
+postprocess_pool = PostProcessPool(
+    workers=settings.POSTPROCESS_WORKERS,
+    nice=settings.POSTPROCESS_NICE,
+    cpus=settings.POSTPROCESS_CPUS,
+)
@@ -0,0 +1,86 @@
+import time
+import threading
+from typing import Any, Callable, Dict, Optional
+
+class ProgressReporter:
+    """
+    yt-dlp progress/postprocessor hook that turns raw callbacks into
+    throttled task updates.
+
+    yt-dlp calls progress hooks for every chunk it writes; we only forward an
+    update when `min_interval` has passed or the phase changes. Percentages
+    come from downloaded_bytes / total_bytes (or the estimate) summed over all
+    parts of a merged download, instead of parsing `_percent_str`.
+
+    Post-processing (ffmpeg) is reported as its own phases: "postprocess_queued"
+    while waiting for a post-processing slot, then "merging"/"postprocessing",
+    with the time spent in ffmpeg accumulated in `postprocess_seconds`.
+    """
+    def __init__(self, publish: Callable[[Dict[str, Any]], None], min_interval: float = 0.5):
+        self.publish = publish
+        self.min_interval = min_interval
+        self.phase = "downloading"
+        self.progress = 0.0
+        self._files: Dict[str, Dict[str, float]] = {}
+        self._last_publish = 0.0
+        self._pp_started: Optional[float] = None
+        self.postprocess_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def progress_hook(self, d: Dict[str, Any]):
+        key = d.get('filename') or d.get('tmpfilename') or ''
+        total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+        downloaded = d.get('downloaded_bytes') or 0
+
+        with self._lock:
+            entry = self._files.setdefault(key, {"downloaded": 0, "total": 0})
+            entry["downloaded"] = downloaded
+            if total:
+                entry["total"] = total
+            if d['status'] == 'finished':
+                entry["total"] = entry["total"] or downloaded
+                entry["downloaded"] = entry["total"]
+
+            downloaded_all = sum(f["downloaded"] for f in self._files.values())
+            total_all = sum(f["total"] for f in self._files.values())
+            if total_all:
+                # A second part (audio after video) grows the total; never go backwards
+                self.progress = max(self.progress, min(downloaded_all / total_all * 100, 99.9))
+
+            update = {
+                "phase": "downloading",
+                "progress": round(self.progress, 1),
+                "downloaded_bytes": downloaded_all,
+                "total_bytes": total_all or None,
+                "speed": d.get('speed'),
+                "eta": d.get('eta'),
+            }
+        self._emit(update, force=d['status'] != 'downloading')
+
+    def postprocessor_hook(self, d: Dict[str, Any]):
+        status = d.get('status')
+        if d.get('postprocessor') == 'MoveFiles':
+            # Renaming into place, not post-processing
+            return
+        if status == 'queued':
+            self.set_phase("postprocess_queued")
+        elif status == 'started':
+            self._pp_started = time.monotonic()
+            self.set_phase("merging" if d.get('postprocessor') == 'Merger' else "postprocessing")
+        elif status == 'finished' and self._pp_started is not None:
+            self.postprocess_seconds += time.monotonic() - self._pp_started
+            self._pp_started = None
+            self._emit({"postprocess_seconds": round(self.postprocess_seconds, 2)}, force=True)
+
+    def set_phase(self, phase: str, **extra):
+        self._emit({"phase": phase, "speed": None, "eta": None, **extra}, force=True)
+
+    def _emit(self, update: Dict[str, Any], force: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            phase_changed = update.get("phase") != self.phase
+            if not force and not phase_changed and now - self._last_publish < self.min_interval:
+                return
+            self.phase = update.get("phase", self.phase)
+            self._last_publish = now
+        self.publish(update)
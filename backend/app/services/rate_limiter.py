@@ -0,0 +1,186 @@
+import math
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlparse
+from app.core.config import settings
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, at most `burst` saved up.
+    Thread-safe; callers either take a token now or ask how long to wait.
+    """
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens: float = 1) -> float:
+        """Seconds until `tokens` are available (0 if they are now)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            missing = tokens - self.tokens
+            if missing <= 0:
+                return 0.0
+            return missing / self.rate if self.rate > 0 else float("inf")
+
+class HostBackoff(Exception):
+    """A host told us to slow down for longer than we are willing to block a worker."""
+    def __init__(self, host: str, retry_after: int):
+        self.host = host
+        self.retry_after = retry_after
+        super().__init__(f"{host} asked us to back off, retry in {retry_after}s")
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After as seconds from now; the header is either seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class AdaptiveLimiter:
+    """
+    AIMD request rate for one host: the rate creeps up additively with every
+    successful request and is cut multiplicatively on a 429/403, so each host
+    runs close to the highest rate it tolerates. A Retry-After header pauses
+    the host entirely until it has passed.
+    """
+    def __init__(
+        self,
+        rate: float,
+        min_rate: float,
+        max_rate: float,
+        decrease: float = 0.5,
+        max_wait: float = 60,
+    ):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.decrease = decrease
+        self.max_wait = max_wait
+        self.bucket = TokenBucket(rate, max(1.0, rate))
+        self.paused_until = 0.0
+        self.throttled = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def _set_rate(self, rate: float):
+        self.rate = rate
+        self.bucket.rate = rate
+        self.bucket.burst = max(1.0, rate)
+
+    def acquire(self, host: str):
+        """Block until a request to this host may go out. Raises HostBackoff if that is more than max_wait away."""
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            now = time.monotonic()
+            pause = self.paused_until - now
+            wait = pause if pause > 0 else self.bucket.wait_time()
+            if wait <= 0 and self.bucket.try_acquire():
+                return
+            if now + wait > deadline:
+                raise HostBackoff(host, max(1, math.ceil(wait)))
+            time.sleep(min(max(wait, 0.01), 1.0))
+
+    def on_success(self):
+        with self._lock:
+            # +1 request/s per `rate` successes: roughly one step per second of traffic
+            self._set_rate(min(self.max_rate, self.rate + 1 / self.rate))
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        now = time.monotonic()
+        with self._lock:
+            self.throttled += 1
+            # Requests already in flight come back throttled together; count them as one event
+            if now - self._last_decrease > 1 / self.rate:
+                self._set_rate(max(self.min_rate, self.rate * self.decrease))
+                self._last_decrease = now
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+
+# Hosts sharing one rate budget. Anything else is limited per hostname
+# with the "default" settings.
+HOST_GROUPS = {
+    "youtube": ("youtube.com", "youtu.be", "youtube-nocookie.com", "youtubei.googleapis.com"),
+    "googlevideo": ("googlevideo.com",),
+    "instagram": ("instagram.com",),
+    "instagram_cdn": ("cdninstagram.com", "fbcdn.net"),
+    "twitter": ("twitter.com", "x.com"),
+    "twimg": ("twimg.com",),
+    "pinterest": ("pinterest.com",),
+    "pinimg": ("pinimg.com",),
+}
+
+def host_group(host: str) -> str:
+    host = (host or "").lower().rstrip(".")
+    for group, suffixes in HOST_GROUPS.items():
+        if any(host == s or host.endswith("." + s) for s in suffixes):
+            return group
+    return host
+
+class HostRateLimiter:
+    """
+    Shared AdaptiveLimiter per host group (and per proxy: throttling is per
+    source IP). Used by every YoutubeDL request, extraction and download alike.
+    """
+    def __init__(self, rates: Dict[str, float], min_rate: float, max_factor: float, decrease: float, max_wait: float):
+        self.rates = rates
+        self.min_rate = min_rate
+        self.max_factor = max_factor
+        self.decrease = decrease
+        self.max_wait = max_wait
+        self._limiters: Dict[str, AdaptiveLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get(self, url: str, proxy: Optional[str] = None) -> Tuple[str, AdaptiveLimiter]:
+        group = host_group(urlparse(url).hostname or "")
+        key = f"{group}@{urlparse(proxy).hostname}" if proxy else group
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                rate = self.rates.get(group, self.rates.get("default", 5))
+                limiter = self._limiters[key] = AdaptiveLimiter(
+                    rate, min(self.min_rate, rate), rate * self.max_factor, self.decrease, self.max_wait,
+                )
+        return key, limiter
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                key: {
+                    "rate": round(limiter.rate, 2),
+                    "throttled": limiter.throttled,
+                    "paused_for": max(0, round(limiter.paused_until - now)),
+                }
+                for key, limiter in self._limiters.items()
+            }
+
+host_limiter = HostRateLimiter(
+    rates=settings.HOST_RATE_LIMITS,
+    min_rate=settings.HOST_RATE_MIN,
+    max_factor=settings.HOST_RATE_MAX_FACTOR,
+    decrease=settings.HOST_RATE_DECREASE,
+    max_wait=settings.HOST_RATE_MAX_WAIT,
+)
@@ -1,25 +1,105 @@
 import os
+import json
 import shutil
+import hashlib
+import threading
 import time
 import uuid
 import logging
 from pathlib import Path
 from threading import Thread
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+class Blob:
+    """
+    One entry of the content-addressed download cache.
+
+    `refs` maps the task IDs currently pointing at this file to when they
+    started (or finished) using it; a blob is only evictable once nobody
+    references it. While the first task (the owner) is still downloading,
+    later tasks are recorded in `waiters` without holding a worker, and the
+    owner completes or fails them along with itself.
+
+    Blobs, refs and waiters live in this process only: with several worker
+    processes, identical requests running in different processes download
+    separately, and a process's janitor doesn't see refs held in another.
+    """
+    def __init__(self, key: str, path: Path):
+        self.key = key
+        self.path = path
+        self.filepath: Optional[Path] = None
+        # Set when the file was also stored by a remote storage backend
+        self.object_key: Optional[str] = None
+        self.state = "downloading"
+        self.error: Optional[BaseException] = None
+        self.size = 0
+        self.progress = 0.0
+        self.phase = "downloading"
+        self.refs: Dict[str, float] = {}
+        self.waiters: List[str] = []
+        self.last_access = time.time()
+        # Set (under the store's lock) once the blob is ready or failed; no waiter attaches after that
+        self.done = threading.Event()
+
+class InsufficientStorage(Exception):
+    """Not enough disk left to admit a download right now."""
+    def __init__(self, needed: int, available: int):
+        self.needed = needed
+        self.available = available
+        super().__init__(f"Not enough disk space: need {needed} bytes, {available} available")
+
 class StorageService:
-    def __init__(self, base_dir: str = "temp_downloads", retention_seconds: int = 300):
+    def __init__(
+        self,
+        base_dir: str = "temp_downloads",
+        retention_seconds: int = 300,
+        cache_max_bytes: int = 0,
+        high_watermark: float = 0.85,
+        low_watermark: float = 0.70,
+        eviction_order: str = "oldest",
+    ):
         self.base_dir = Path(base_dir)
         self.retention_seconds = retention_seconds
-        self.base_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Start cleanup thread or use a scheduler in real production
-        # For this scope, we'll check on access or use a simplistic background loop if needed.
-        # But actually, FastAPI background tasks can handle cleanup after serving.
-        
+
+        # Disk usage fractions: above `high_watermark` the janitor evicts
+        # until usage is back under `low_watermark`
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.eviction_order = eviction_order
+        # Bytes promised to running downloads (task_id -> (bytes, dir they are written to))
+        self._reservations: Dict[str, Tuple[int, Optional[Path]]] = {}
+        self._janitor: Optional[Thread] = None
+        self._janitor_stop = threading.Event()
+
+        # Content-addressed store: cas/<sha256(media key + format)>/<file>
+        self.cas_dir = self.base_dir / "cas"
+        self.staging_dir = self.cas_dir / ".staging"
+        self.cache_max_bytes = cache_max_bytes
+        self._blobs: Dict[str, Blob] = {}
+        self._lock = threading.Lock()
+        self._opened = False
+
+    def open(self):
+        """
+        Create the directories and index the download cache. Done once, by the
+        startup warm-up or on first use, so importing the app doesn't touch
+        the disk.
+        """
+        if self._opened:
+            return
+        with self._lock:
+            if self._opened:
+                return
+            self.staging_dir.mkdir(parents=True, exist_ok=True)
+            self._load_blobs()
+            self._opened = True
+
     def create_temp_dir(self) -> Path:
         """Create a unique directory for a download task."""
+        self.open()
         task_id = str(uuid.uuid4())
         task_dir = self.base_dir / task_id
         task_dir.mkdir(exist_ok=True)
@@ -29,7 +109,9 @@ class StorageService:
         return self.base_dir / task_id / filename
 
     def cleanup(self, task_id: str):
-        """Delete the temporary directory for a task."""
+        """Delete the temporary directory for a task and drop its cache references."""
+        self.release_blobs(task_id)
+        self.release_reservation(task_id)
         task_dir = self.base_dir / task_id
         try:
             if task_dir.exists():
@@ -38,4 +120,317 @@ class StorageService:
         except Exception as e:
             logger.error(f"Failed to cleanup {task_id}: {e}")
 
-storage = StorageService()
+    # Content-addressed download cache
+
+    @staticmethod
+    def blob_key(media_key: str, format_selector: str) -> str:
+        return hashlib.sha256(f"{media_key}\n{format_selector}".encode()).hexdigest()
+
+    def _load_blobs(self):
+        """Rebuild the index from disk; half-finished downloads are thrown away."""
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        for path in self.cas_dir.iterdir():
+            if path == self.staging_dir or not path.is_dir():
+                continue
+            try:
+                self._load_one(path)
+            except Exception:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def acquire_blob(self, task_id: str, key: str) -> Tuple[Blob, bool]:
+        """
+        Reference the blob for `key` from `task_id`.
+        Returns (blob, owner). Only the owner downloads; everyone else
+        attaches to it with attach_waiter (or gets a ready file straight away).
+        """
+        self.open()
+        with self._lock:
+            blob = self._blobs.get(key)
+            if blob is None:
+                # Another process may have finished it since we built the index
+                path = self.cas_dir / key
+                if (path / ".meta.json").exists():
+                    self._load_one(path)
+                    blob = self._blobs.get(key)
+            if blob is not None and blob.state == "ready" and not blob.filepath.exists():
+                del self._blobs[key]
+                blob = None
+
+            owner = blob is None
+            if owner:
+                blob = self._blobs[key] = Blob(key, self.cas_dir / key)
+            blob.refs[task_id] = time.time()
+            blob.last_access = time.time()
+            return blob, owner
+
+    def attach_waiter(self, blob: Blob, task_id: str) -> bool:
+        """
+        Have the owner of an in-flight blob complete `task_id` along with its
+        own task. False if the blob is already ready or failed.
+        """
+        with self._lock:
+            if blob.done.is_set():
+                return False
+            blob.waiters.append(task_id)
+            return True
+
+    def waiting_tasks(self) -> List[str]:
+        """Tasks attached to downloads still running in this process."""
+        with self._lock:
+            return [t for b in self._blobs.values() if b.state == "downloading" for t in b.waiters]
+
+    def _load_one(self, path: Path):
+        meta = json.loads((path / ".meta.json").read_text())
+        blob = Blob(path.name, path)
+        blob.filepath = path / meta["filename"]
+        blob.object_key = meta.get("object_key")
+        blob.size = blob.filepath.stat().st_size
+        blob.last_access = path.stat().st_mtime
+        blob.state = "ready"
+        blob.done.set()
+        self._blobs[blob.key] = blob
+
+    def blob_staging_dir(self, key: str) -> Path:
+        self.open()
+        path = self.staging_dir / f"{key}-{uuid.uuid4().hex[:8]}"
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    @staticmethod
+    def produced_file(staging: Path, filepath: Optional[str] = None) -> Path:
+        """
+        The finished file in a staging dir. `filepath` is yt-dlp's idea of the
+        output name; after a merge the real extension can differ, so fall back
+        to the largest file in the dir.
+        """
+        if filepath and Path(filepath).exists():
+            return Path(filepath)
+        candidates = [p for p in staging.iterdir() if p.is_file() and not p.name.endswith((".part", ".ytdl"))]
+        if not candidates:
+            raise ValueError("Download finished but produced no file")
+        return max(candidates, key=lambda p: p.stat().st_size)
+
+    def publish_blob(
+        self, key: str, staging: Path, filepath: Optional[str] = None, object_key: Optional[str] = None,
+    ) -> Path:
+        """
+        Move a finished download from its staging dir into the store and wake
+        waiters. `object_key` is where the storage backend put a copy, if anywhere.
+        """
+        self.open()
+        produced = self.produced_file(staging, filepath)
+
+        final = self.cas_dir / key
+        meta = {"filename": produced.name, "created": time.time(), "object_key": object_key}
+        (staging / ".meta.json").write_text(json.dumps(meta))
+        try:
+            os.rename(staging, final)
+        except OSError:
+            # Someone else (another worker process) published the same blob first
+            shutil.rmtree(staging, ignore_errors=True)
+            produced = final / json.loads((final / ".meta.json").read_text())["filename"]
+        else:
+            produced = final / produced.name
+
+        with self._lock:
+            blob = self._blobs.get(key) or Blob(key, final)
+            self._blobs[key] = blob
+            blob.filepath = produced
+            blob.object_key = object_key
+            blob.size = produced.stat().st_size
+            blob.state = "ready"
+            blob.progress = 100
+            blob.last_access = time.time()
+            # Retention of the tasks waiting on this blob starts now
+            for task_id in blob.refs:
+                blob.refs[task_id] = blob.last_access
+            blob.done.set()
+        self.enforce_cache_budget()
+        return produced
+
+    def fail_blob(self, key: str, staging: Optional[Path], error: BaseException):
+        """Drop an in-flight blob so the next attempt starts a fresh download."""
+        if staging is not None:
+            shutil.rmtree(staging, ignore_errors=True)
+        with self._lock:
+            blob = self._blobs.pop(key, None)
+            if blob is not None:
+                blob.state = "failed"
+                blob.error = error
+                blob.done.set()
+
+    def release_blobs(self, task_id: str):
+        with self._lock:
+            for blob in self._blobs.values():
+                blob.refs.pop(task_id, None)
+
+    def directory_usage(self) -> int:
+        """Bytes on disk under the download directory: cache, staging and task files."""
+        return self._tree_size(self.base_dir)
+
+    @staticmethod
+    def _tree_size(path: Path) -> int:
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass  # Deleted by the janitor while we were walking
+        return total
+
+    def cache_usage(self) -> int:
+        self.open()
+        with self._lock:
+            return sum(b.size for b in self._blobs.values() if b.state == "ready")
+
+    def enforce_cache_budget(self) -> int:
+        """
+        Evict unreferenced blobs, least recently used first, until the store
+        fits in the configured budget. Returns bytes freed.
+        """
+        if not self.cache_max_bytes:
+            return 0
+        excess = self.cache_usage() - self.cache_max_bytes
+        return self._evict_blobs(excess, "oldest") if excess > 0 else 0
+
+    def _evict_blobs(self, bytes_to_free: int, order: str) -> int:
+        """Delete unreferenced ready blobs, oldest or largest first, until `bytes_to_free` is reached."""
+        if order == "largest":
+            sort_key = lambda b: -b.size
+        else:
+            sort_key = lambda b: b.last_access
+        freed = 0
+        victims = []
+        with self._lock:
+            ready = [b for b in self._blobs.values() if b.state == "ready" and not b.refs]
+            for blob in sorted(ready, key=sort_key):
+                if freed >= bytes_to_free:
+                    break
+                victims.append(blob)
+                freed += blob.size
+                del self._blobs[blob.key]
+        for blob in victims:
+            shutil.rmtree(blob.path, ignore_errors=True)
+            logger.info(f"Evicted cached download {blob.key[:12]} ({blob.size} bytes)")
+        return freed
+
+    # Admission control
+
+    def _disk_budget(self) -> Tuple[int, int]:
+        """(bytes we may still use before the high watermark, reserved bytes not yet written)."""
+        self.open()
+        usage = shutil.disk_usage(self.base_dir)
+        limit = int(usage.total * self.high_watermark)
+        with self._lock:
+            reservations = list(self._reservations.values())
+        # What a running download has written is already in usage.used; only
+        # the rest of its reservation is still to come
+        reserved = sum(max(0, nbytes - (self._tree_size(path) if path else 0)) for nbytes, path in reservations)
+        return limit - usage.used - reserved, reserved
+
+    def reserve(self, task_id: str, nbytes: int, path: Optional[Path] = None):
+        """
+        Reserve disk space for a download before it starts. `path` is the
+        directory it writes to, so the bytes already written there stop
+        counting against the reservation. Evicts cached files if that makes
+        room, otherwise raises InsufficientStorage.
+        """
+        available, _ = self._disk_budget()
+        if nbytes > available:
+            self._evict_blobs(nbytes - available, self.eviction_order)
+            available, _ = self._disk_budget()
+        if nbytes > available:
+            raise InsufficientStorage(nbytes, max(available, 0))
+        with self._lock:
+            self._reservations[task_id] = (nbytes, path)
+
+    def release_reservation(self, task_id: str):
+        with self._lock:
+            self._reservations.pop(task_id, None)
+
+    def capacity(self) -> int:
+        """Most bytes a single download could ever be given."""
+        self.open()
+        return int(shutil.disk_usage(self.base_dir).total * self.high_watermark)
+
+    # Janitor
+
+    def start_janitor(self, interval: float):
+        if self._janitor is not None:
+            return
+        self._janitor_stop.clear()
+        self._janitor = Thread(target=self._janitor_loop, args=(interval,), name="storage-janitor", daemon=True)
+        self._janitor.start()
+
+    def stop_janitor(self):
+        self._janitor_stop.set()
+        if self._janitor is not None:
+            self._janitor.join(5)
+            self._janitor = None
+
+    def _janitor_loop(self, interval: float):
+        while not self._janitor_stop.wait(interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Storage janitor failed: {e}")
+
+    def sweep(self):
+        """
+        One janitor pass: expire task references and task dirs past the
+        retention window, drop orphaned staging dirs, then evict harder if
+        disk usage is above the high watermark.
+        """
+        self.open()
+        now = time.time()
+        usage = shutil.disk_usage(self.base_dir)
+        pressure = usage.used > usage.total * self.high_watermark
+        # Under disk pressure finished tasks only keep their file for a fraction of the window
+        retention = self.retention_seconds / 4 if pressure else self.retention_seconds
+
+        with self._lock:
+            for blob in self._blobs.values():
+                if blob.state != "ready":
+                    continue
+                for task_id, since in list(blob.refs.items()):
+                    if now - since > retention:
+                        del blob.refs[task_id]
+
+        for path in self.base_dir.iterdir():
+            if path == self.cas_dir or not path.is_dir():
+                continue
+            try:
+                if now - path.stat().st_mtime > retention:
+                    shutil.rmtree(path, ignore_errors=True)
+            except FileNotFoundError:
+                pass
+
+        with self._lock:
+            inflight = {b.key for b in self._blobs.values() if b.state == "downloading"}
+        for path in self.staging_dir.iterdir():
+            # Staging dirs of other processes show up here too; only reap ones that are long dead
+            key = path.name.rsplit("-", 1)[0]
+            try:
+                if key not in inflight and now - path.stat().st_mtime > 6 * 3600:
+                    shutil.rmtree(path, ignore_errors=True)
+            except FileNotFoundError:
+                pass
+
+        self.enforce_cache_budget()
+
+        usage = shutil.disk_usage(self.base_dir)
+        if usage.used > usage.total * self.high_watermark:
+            target = usage.used - int(usage.total * self.low_watermark)
+            freed = self._evict_blobs(target, self.eviction_order)
+            logger.warning(f"Disk usage above {self.high_watermark:.0%}, evicted {freed} bytes")
+
+storage = StorageService(
+    base_dir=settings.TEMP_DOWNLOAD_DIR,
+    retention_seconds=settings.STORAGE_RETENTION_SECONDS,
+    cache_max_bytes=settings.DOWNLOAD_CACHE_MAX_BYTES,
+    high_watermark=settings.STORAGE_HIGH_WATERMARK,
+    low_watermark=settings.STORAGE_LOW_WATERMARK,
+    eviction_order=settings.STORAGE_EVICTION_ORDER,
+)
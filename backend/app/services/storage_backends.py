@@ -0,0 +1,351 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+from app.core.config import settings
+from app.services.metrics import UPLOAD_SECONDS
+from app.services.tracing import record
+
+logger = logging.getLogger(__name__)
+
+class StorageBackend:
+    """
+    Where finished downloads are served from. Downloads always land in the
+    local store first (StorageService, which also does the caching and disk
+    admission); a backend decides whether the file is copied somewhere else
+    and where clients are sent to fetch it.
+    """
+    name = "local"
+
+    def open(self):
+        """Check the configuration and connect. Run by the startup warm-up."""
+
+    def start_upload(self, blob_key: str) -> Optional["MultipartUpload"]:
+        """An upload to feed while the download runs, or None if files stay on this box."""
+        return None
+
+    def url(self, object_key: str, filename: str, method: str = "GET") -> Optional[str]:
+        """URL to redirect a client to for `object_key`, or None to serve the local file."""
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+class LocalBackend(StorageBackend):
+    """Files are sent by the API process (or its front proxy) from TEMP_DOWNLOAD_DIR."""
+
+class MultipartUpload:
+    """
+    Streams one download into S3 while yt-dlp is still writing it.
+
+    `follow` is chained into the progress hook: it opens the .part file
+    yt-dlp reports and wakes a tail thread that uploads each complete
+    `part_size` slice as soon as it is on disk. Only bytes that won't change
+    are sent: up to the file size for downloaders that append, up to
+    `contiguous_bytes` for the range-split downloader, which fills a
+    preallocated file out of order.
+
+    `finish` then only has to send the last partial part. If the finished
+    file is not the one that was followed (video+audio merge, ffmpeg remux,
+    in-place rewrite), the streamed parts are dropped and the file is
+    uploaded in one go.
+    """
+    def __init__(self, backend: "S3Backend", object_key: str):
+        self.backend = backend
+        self.object_key = object_key
+        self.upload_id: Optional[str] = None
+        self.offset = 0
+        self.mode: Optional[str] = None  # "streamed" or "whole" once finished
+        self._parts: List[Future] = []
+        self._hash = hashlib.sha256()
+        self._fd: Optional[int] = None
+        self._path: Optional[str] = None
+        self._content_type: Optional[str] = None
+        self._contiguous: Optional[int] = None
+        self._error: Optional[BaseException] = None
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def follow(self, d: Dict[str, Any]):
+        """yt-dlp progress hook."""
+        if self._stop.is_set():
+            return
+        path = d.get("tmpfilename")
+        if path:
+            with self._lock:
+                if self._path is None:
+                    try:
+                        self._fd = os.open(path, os.O_RDONLY)
+                    except FileNotFoundError:
+                        return
+                    # Keep reading through this fd; it survives the .part -> final rename
+                    self._path = path
+                    self._content_type = mimetypes.guess_type(path[:-5] if path.endswith(".part") else path)[0]
+                    self._thread = threading.Thread(target=self._tail, name="s3-upload-tail", daemon=True)
+                    self._thread.start()
+                elif path != self._path:
+                    # A second file (audio for a merge): the result will be a new file
+                    logger.info(f"Upload of {self.object_key} waits for the merged file")
+                    self._stop.set()
+        if "contiguous_bytes" in d:
+            self._contiguous = d["contiguous_bytes"]
+        self._wake.set()
+
+    def _tail(self):
+        while not self._stop.is_set():
+            self._wake.wait(0.5)
+            self._wake.clear()
+            try:
+                while not self._stop.is_set() and self._limit() - self.offset >= self.backend.part_size:
+                    self._send_part(self.backend.part_size)
+            except Exception as e:
+                logger.warning(f"Streaming upload of {self.object_key} failed, will upload after the download: {e}")
+                self._error = e
+                return
+
+    def _limit(self) -> int:
+        size = os.fstat(self._fd).st_size
+        return size if self._contiguous is None else min(size, self._contiguous)
+
+    def _send_part(self, length: int):
+        self.backend._slots.acquire()
+        try:
+            data = os.pread(self._fd, length, self.offset)
+            if len(data) != length:
+                raise OSError(f"Short read at byte {self.offset} of {self._path}")
+            if self.upload_id is None:
+                extra = {"ContentType": self._content_type} if self._content_type else {}
+                self.upload_id = self.backend.client.create_multipart_upload(
+                    Bucket=self.backend.bucket, Key=self.object_key, **extra,
+                )["UploadId"]
+            self._hash.update(data)
+            number = len(self._parts) + 1
+            self._parts.append(self.backend._executor.submit(self._upload_part, number, data))
+            self.offset += length
+        except BaseException:
+            self.backend._slots.release()
+            raise
+
+    def _upload_part(self, number: int, data: bytes) -> Dict[str, Any]:
+        try:
+            resp = self.backend.client.upload_part(
+                Bucket=self.backend.bucket, Key=self.object_key, UploadId=self.upload_id,
+                PartNumber=number, Body=data,
+            )
+            self.backend._count("bytes_uploaded", len(data))
+            return {"PartNumber": number, "ETag": resp["ETag"]}
+        finally:
+            self.backend._slots.release()
+
+    def _unchanged(self, path: str) -> bool:
+        """`path` is the file we followed and still starts with the bytes already sent."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        ours = os.fstat(self._fd)
+        if (st.st_dev, st.st_ino) != (ours.st_dev, ours.st_ino) or st.st_size < self.offset:
+            return False
+        # Fixups may rewrite a file in place (same inode), so compare the content too
+        digest = hashlib.sha256()
+        pos = 0
+        while pos < self.offset:
+            block = os.pread(self._fd, min(1024 * 1024, self.offset - pos), pos)
+            if not block:
+                return False
+            digest.update(block)
+            pos += len(block)
+        return digest.digest() == self._hash.digest()
+
+    def _stop_tail(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def finish(self, path: str) -> str:
+        """Complete the upload with the finished file at `path`; returns the object key."""
+        self._stop_tail()
+        started = time.monotonic()
+        try:
+            if self.upload_id and self._error is None and self._unchanged(path):
+                size = os.path.getsize(path)
+                while self.offset < size:
+                    self._send_part(min(self.backend.part_size, size - self.offset))
+                parts = [future.result() for future in self._parts]
+                self.backend.client.complete_multipart_upload(
+                    Bucket=self.backend.bucket, Key=self.object_key, UploadId=self.upload_id,
+                    MultipartUpload={"Parts": parts},
+                )
+                self.mode = "streamed"
+            else:
+                self._abort_multipart()
+                content_type = mimetypes.guess_type(path)[0]
+                self.backend.upload_file(path, self.object_key, content_type)
+                self.mode = "whole"
+        except BaseException:
+            self._abort_multipart()
+            raise
+        finally:
+            self._close()
+        elapsed = time.monotonic() - started
+        self.backend._count(f"uploads_{self.mode}")
+        UPLOAD_SECONDS.labels(self.mode).observe(elapsed)
+        record("upload", elapsed)
+        logger.info(f"Stored {self.object_key} ({self.mode}), {elapsed:.1f}s after the download finished")
+        return self.object_key
+
+    def abort(self):
+        """The download failed: drop whatever was uploaded."""
+        self._stop_tail()
+        self._abort_multipart()
+        self._close()
+
+    def _abort_multipart(self):
+        if self.upload_id is None:
+            return
+        for future in self._parts:
+            # Let parts in flight land first, or they would outlive the abort
+            try:
+                future.result()
+            except BaseException:
+                pass
+        try:
+            self.backend.client.abort_multipart_upload(
+                Bucket=self.backend.bucket, Key=self.object_key, UploadId=self.upload_id,
+            )
+        except Exception as e:
+            # A bucket lifecycle rule for incomplete uploads cleans this up eventually
+            logger.warning(f"Could not abort multipart upload of {self.object_key}: {e}")
+        self.upload_id = None
+
+    def _close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+class S3Backend(StorageBackend):
+    """
+    Any S3-compatible object store (AWS, MinIO, R2...). Every download is
+    uploaded to `<prefix><blob key>` while it runs and clients are redirected
+    to a presigned URL, so any API instance can serve any finished task.
+
+    boto3 is only needed (and only imported) when this backend is used.
+    """
+    name = "s3"
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key_id: Optional[str] = None,
+        secret_access_key: Optional[str] = None,
+        part_size: int = 16 * 1024 * 1024,
+        concurrency: int = 4,
+        presign_seconds: int = 3600,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        # S3 rejects parts under 5 MiB (except the last one)
+        self.part_size = max(part_size, 5 * 1024 * 1024)
+        self.concurrency = concurrency
+        self.presign_seconds = presign_seconds
+        self._client = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="s3-upload")
+        # Parts read into memory but not uploaded yet, across all uploads
+        self._slots = threading.BoundedSemaphore(concurrency * 2)
+        self._counters = {"uploads_streamed": 0, "uploads_whole": 0, "bytes_uploaded": 0}
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    try:
+                        import boto3
+                        from botocore.config import Config
+                    except ImportError as e:
+                        raise RuntimeError("STORAGE_BACKEND=s3 needs boto3 (pip install -r requirements-s3.txt)") from e
+                    self._client = boto3.client(
+                        "s3",
+                        endpoint_url=self.endpoint_url,
+                        region_name=self.region,
+                        aws_access_key_id=self.access_key_id,
+                        aws_secret_access_key=self.secret_access_key,
+                        config=Config(
+                            signature_version="s3v4",
+                            max_pool_connections=self.concurrency + 4,
+                            retries={"max_attempts": 5, "mode": "standard"},
+                        ),
+                    )
+        return self._client
+
+    def open(self):
+        if not self.bucket:
+            raise ValueError("STORAGE_BACKEND=s3 needs S3_BUCKET")
+        self.client.head_bucket(Bucket=self.bucket)
+
+    def start_upload(self, blob_key: str) -> MultipartUpload:
+        return MultipartUpload(self, f"{self.prefix}{blob_key}")
+
+    def upload_file(self, path: str, object_key: str, content_type: Optional[str] = None):
+        from boto3.s3.transfer import TransferConfig
+        self.client.upload_file(
+            path, self.bucket, object_key,
+            ExtraArgs={"ContentType": content_type} if content_type else None,
+            Config=TransferConfig(
+                multipart_threshold=self.part_size, multipart_chunksize=self.part_size,
+                max_concurrency=self.concurrency,
+            ),
+        )
+        self._count("bytes_uploaded", os.path.getsize(path))
+
+    def url(self, object_key: str, filename: str, method: str = "GET") -> str:
+        params = {"Bucket": self.bucket, "Key": object_key}
+        if method == "HEAD":
+            # The signature covers the method, and 307 keeps it
+            return self.client.generate_presigned_url("head_object", Params=params, ExpiresIn=self.presign_seconds)
+        params["ResponseContentDisposition"] = f"attachment; filename*=UTF-8''{quote(filename)}"
+        return self.client.generate_presigned_url("get_object", Params=params, ExpiresIn=self.presign_seconds)
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        return {"backend": self.name, "bucket": self.bucket, "part_size": self.part_size, **counters}
+
+def create_backend() -> StorageBackend:
+    if settings.STORAGE_BACKEND == "s3":
+        return S3Backend(
+            bucket=settings.S3_BUCKET,
+            prefix=settings.S3_PREFIX,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            region=settings.S3_REGION,
+            access_key_id=settings.S3_ACCESS_KEY_ID,
+            secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+            part_size=settings.S3_PART_SIZE_MB * 1024 * 1024,
+            concurrency=settings.S3_UPLOAD_CONCURRENCY,
+            presign_seconds=settings.S3_PRESIGN_SECONDS,
+        )
+    if settings.STORAGE_BACKEND != "local":
+        raise ValueError(f"Unknown STORAGE_BACKEND {settings.STORAGE_BACKEND!r}, expected 'local' or 's3'")
+    return LocalBackend()
+
+storage_backend = create_backend()
@@ -0,0 +1,226 @@
+import asyncio
+import copy
+import json
+import logging
+import os
+import sys
+import tempfile
+from typing import Any, AsyncIterator, Dict, List, Optional
+from app.core.config import settings
+from app.services.downloader import extractor, route_url
+from app.services.format_index import merge_container
+from app.services.metrics import FILE_SERVE_BYTES
+from app.services.rate_limiter import host_limiter, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+_MEDIA_TYPES = {
+    "mp4": "video/mp4",
+    "m4a": "audio/mp4",
+    "webm": "video/webm",
+    "mkv": "video/x-matroska",
+    "mp3": "audio/mpeg",
+    "ogg": "audio/ogg",
+    "opus": "audio/ogg",
+}
+
+class StreamPlan:
+    """
+    How one stream request will be served.
+
+    kind is one of:
+      http  - single progressive/audio format, proxied straight from the CDN
+      ytdlp - single format on a segmented protocol (HLS/DASH), yt-dlp writes it to stdout
+      merge - separate video + audio, muxed live by ffmpeg into fMP4/Matroska on stdout
+    """
+    def __init__(self, kind: str, formats: List[Dict[str, Any]], info: Dict[str, Any], ext: str, filename: str):
+        self.kind = kind
+        self.formats = formats
+        self.info = info
+        self.ext = ext
+        self.filename = filename
+        self.media_type = _MEDIA_TYPES.get(ext, "application/octet-stream")
+
+    @property
+    def content_length(self) -> Optional[int]:
+        # Only known up front when we proxy the bytes untouched
+        if self.kind == "http":
+            return self.formats[0].get("filesize")
+        return None
+
+# ffmpeg and the HTTP proxy need a single URL per format; segmented DASH
+# (and HLS, whose URL is a playlist) can't be merged that way
+_MERGEABLE_PROTOCOLS = ("http", "https")
+
+class StreamSlot:
+    """
+    One of the streamer's `max_streams` places, taken before the response
+    starts. Released once, by the stream when it ends, or when the request
+    fails or is dropped before the stream ever started.
+    """
+    def __init__(self, streamer: "MediaStreamer"):
+        self.streamer = streamer
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.streamer.active -= 1
+
+    def __del__(self):
+        # A response whose body was never iterated never runs the stream's finally
+        self.release()
+
+class MediaStreamer:
+    """
+    Sends media to the client while it is being fetched, instead of waiting
+    for download_media (and the merge) to finish on disk first.
+    """
+    def __init__(self, max_streams: int, chunk_size: int = 256 * 1024):
+        self.max_streams = max_streams
+        self.chunk_size = chunk_size
+        self.active = 0
+
+    def reserve(self) -> Optional[StreamSlot]:
+        """Take a stream slot, or None if all `max_streams` are in use."""
+        if self.active >= self.max_streams:
+            return None
+        self.active += 1
+        return StreamSlot(self)
+
+    def plan(self, url: str, info: Dict[str, Any], format_id: str) -> StreamPlan:
+        """
+        Resolve `format_id` against a stored info dict with yt-dlp's own selector.
+        Blocking (yt-dlp), run it in a thread.
+        """
+        spec = "bestvideo+bestaudio/best" if format_id == "best" else format_id
+        route = route_url(url)
+        with extractor.lease(route, extractor.pinned_identity(route, info), format=spec) as ydl:
+            resolved = ydl.process_ie_result(copy.deepcopy(info), download=False)
+            base = os.path.splitext(os.path.basename(ydl.prepare_filename(resolved)))[0]
+
+        requested = resolved.get("requested_formats")
+        if requested and len(requested) == 2:
+            for fmt in requested:
+                if fmt.get("protocol") not in _MERGEABLE_PROTOCOLS:
+                    raise ValueError(
+                        f"format {fmt.get('format_id')} is delivered as {fmt.get('protocol')} and can't be "
+                        f"merged while streaming; download it with POST /download/ instead"
+                    )
+            # `format_id` may name audio first ("140+137"); keep video first
+            video, audio = sorted(requested, key=lambda f: f.get("vcodec") == "none")
+            ext = merge_container(video, audio)
+            return StreamPlan("merge", [video, audio], resolved, ext, f"{base}.{ext}")
+
+        fmt = resolved
+        ext = fmt.get("ext") or "mp4"
+        kind = "http" if fmt.get("protocol") in ("http", "https") else "ytdlp"
+        return StreamPlan(kind, [fmt], resolved, ext, f"{base}.{ext}")
+
+    def _opts(self, url: str, info: Dict[str, Any]) -> Dict[str, Any]:
+        # Fetch through the proxy that extracted the info: signed URLs are often bound to its IP
+        route = route_url(url)
+        return extractor.request_opts(route, extractor.pinned_identity(route, info))
+
+    async def open(self, url: str, plan: StreamPlan, slot: StreamSlot) -> AsyncIterator[bytes]:
+        sent = 0
+        try:
+            if plan.kind == "http":
+                source = self._proxy_http(url, plan)
+            elif plan.kind == "merge":
+                source = self._run_process(self._ffmpeg_args(url, plan))
+            else:
+                source = self._ytdlp_stdout(url, plan)
+            async for chunk in source:
+                yield chunk
+                sent += len(chunk)
+        finally:
+            slot.release()
+            FILE_SERVE_BYTES.labels("stream").observe(sent)
+
+    async def _proxy_http(self, url: str, plan: StreamPlan) -> AsyncIterator[bytes]:
+        # Imported on first stream, not at startup: aiohttp is slow to load
+        import aiohttp
+        fmt = plan.formats[0]
+        proxy = self._opts(url, plan.info).get("proxy")
+        # Same per-host pacing as yt-dlp's own requests
+        key, limiter = host_limiter.get(fmt["url"], proxy)
+        await asyncio.to_thread(limiter.acquire, key)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(fmt["url"], headers=fmt.get("http_headers") or {}, proxy=proxy) as resp:
+                if resp.status in (429, 403):
+                    limiter.on_throttle(parse_retry_after(resp.headers.get("Retry-After")))
+                resp.raise_for_status()
+                limiter.on_success()
+                async for chunk in resp.content.iter_chunked(self.chunk_size):
+                    yield chunk
+
+    def _ffmpeg_args(self, url: str, plan: StreamPlan) -> List[str]:
+        proxy = self._opts(url, plan.info).get("proxy")
+        args = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin"]
+        for fmt in plan.formats:
+            headers = "".join(f"{k}: {v}\r\n" for k, v in (fmt.get("http_headers") or {}).items())
+            if headers:
+                args += ["-headers", headers]
+            if proxy and fmt.get("protocol") in ("http", "https"):
+                args += ["-http_proxy", proxy]
+            args += ["-reconnect", "1", "-reconnect_streamed", "1", "-i", fmt["url"]]
+        # Stream copy only: remux, never re-encode
+        args += _stream_maps(plan.formats) + ["-c", "copy"]
+        if plan.ext == "mp4":
+            args += ["-movflags", "frag_keyframe+empty_moov+default_base_moof", "-f", "mp4"]
+        elif plan.ext == "webm":
+            args += ["-f", "webm"]
+        else:
+            args += ["-f", "matroska"]
+        return args + ["pipe:1"]
+
+    async def _ytdlp_stdout(self, url: str, plan: StreamPlan) -> AsyncIterator[bytes]:
+        import yt_dlp
+        # Hand yt-dlp the info we already have so it doesn't extract again
+        fd, info_path = tempfile.mkstemp(suffix=".info.json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(yt_dlp.YoutubeDL.sanitize_info(plan.info, remove_private_keys=True), f)
+
+        opts = self._opts(url, plan.info)
+        args = [sys.executable, "-m", "yt_dlp", "--quiet", "--no-progress", "--load-info-json", info_path,
+                "-f", plan.formats[0]["format_id"], "-o", "-"]
+        if opts.get("proxy"):
+            args += ["--proxy", opts["proxy"]]
+        if opts.get("cookiefile"):
+            args += ["--cookies", opts["cookiefile"]]
+        try:
+            async for chunk in self._run_process(args):
+                yield chunk
+        finally:
+            os.unlink(info_path)
+
+    async def _run_process(self, args: List[str]) -> AsyncIterator[bytes]:
+        with tempfile.TemporaryFile() as stderr:
+            proc = await asyncio.create_subprocess_exec(
+                *args, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=stderr,
+            )
+            try:
+                while True:
+                    chunk = await proc.stdout.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+                code = await proc.wait()
+                if code != 0:
+                    stderr.seek(0)
+                    logger.error(f"{args[0]} exited with {code}: {stderr.read()[-500:].decode(errors='replace')}")
+            finally:
+                # Client went away (or we failed): don't leave the fetcher running
+                if proc.returncode is None:
+                    proc.kill()
+                    await proc.wait()
+
+def _stream_maps(formats: List[Dict[str, Any]]) -> List[str]:
+    """ffmpeg -map arguments: video from the input that has it, audio from the other one."""
+    video = next((i for i, f in enumerate(formats) if f.get("vcodec") != "none"), 0)
+    audio = next((i for i, f in enumerate(formats) if i != video and f.get("acodec") != "none"), 1 - video)
+    return ["-map", f"{video}:v:0", "-map", f"{audio}:a:0"]
+
+streamer = MediaStreamer(max_streams=settings.STREAM_MAX_CONCURRENT)
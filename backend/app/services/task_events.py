@@ -0,0 +1,57 @@
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Set
+from app.core.config import settings
+from app.services.task_manager import task_manager
+
+logger = logging.getLogger(__name__)
+
+class TaskWatcher:
+    """
+    Feeds the SSE task streams of this process from one poller: every
+    `interval` it reads all watched tasks in a single query (off the event
+    loop) and pushes the ones that changed to their subscribers, instead of
+    each open stream polling the database on its own.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._last: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._poller: Optional[asyncio.Task] = None
+
+    def subscribe(self, task_id: str) -> asyncio.Queue:
+        """Queue that receives the task (or None once it is gone) every time it changes."""
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll())
+        return queue
+
+    def unsubscribe(self, task_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(task_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[task_id]
+            self._last.pop(task_id, None)
+
+    async def _poll(self):
+        while self._subscribers:
+            ids = list(self._subscribers)
+            try:
+                tasks = await asyncio.to_thread(task_manager.get_tasks, ids)
+            except Exception as e:
+                logger.error(f"Task watcher poll failed: {e}")
+                tasks = None
+            if tasks is not None:
+                for task_id in ids:
+                    task = tasks.get(task_id)
+                    if task_id in self._last and self._last[task_id] == task:
+                        continue
+                    self._last[task_id] = task
+                    for queue in self._subscribers.get(task_id, ()):
+                        queue.put_nowait(task)
+            await asyncio.sleep(self.interval)
+
+task_watcher = TaskWatcher(settings.PROGRESS_MIN_INTERVAL)
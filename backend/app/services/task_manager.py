@@ -1,29 +1,260 @@
-from typing import Dict, Any, Optional
+import json
+import logging
+import sqlite3
+import threading
+import time
 import uuid
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Columns exposed through get_task(). Anything else passed to update_task()
+# is kept in the free-form `meta` column and merged into the result.
+PUBLIC_FIELDS = ("status", "progress", "filename", "error", "filepath")
+_COLUMNS = {
+    "status", "progress", "filename", "error", "filepath", "url", "format_id",
+    "handle", "info", "priority", "attempts", "run_after", "worker_id", "lease_until",
+    "clip_start", "clip_end",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'pending',
+    progress REAL NOT NULL DEFAULT 0,
+    filename TEXT,
+    filepath TEXT,
+    error TEXT,
+    url TEXT,
+    format_id TEXT,
+    handle TEXT,
+    info TEXT,
+    clip_start REAL,
+    clip_end REAL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after REAL NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    lease_until REAL,
+    meta TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_queue ON tasks (status, priority DESC, created_at);
+"""
+
+# Columns added after the first release; older databases get them on startup
+_ADDED_COLUMNS = {
+    "clip_start": "REAL",
+    "clip_end": "REAL",
+}
 
 class TaskManager:
-    def __init__(self):
-        self._tasks: Dict[str, Dict[str, Any]] = {}
+    """
+    Task state and download job queue, stored in SQLite so every API worker
+    and every download worker process sees the same tasks, and nothing is
+    lost on restart.
+    """
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._opened = False
+
+    def open(self):
+        """
+        Create the database and bring its schema up to date. Done once, by the
+        startup warm-up or on first use, so importing the app doesn't touch
+        the disk.
+        """
+        if self._opened:
+            return
+        with self._lock:
+            if self._opened:
+                return
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            conn = self._connect()
+            conn.executescript(_SCHEMA)
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(tasks)")}
+            for column, kind in _ADDED_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} {kind}")
+            self._local.conn = conn
+            self._opened = True
 
-    def create_task(self) -> str:
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are not shareable across threads, keep one per thread
+        self.open()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def create_task(
+        self,
+        url: Optional[str] = None,
+        format_id: Optional[str] = None,
+        handle: Optional[str] = None,
+        info: Optional[Dict[str, Any]] = None,
+        priority: int = 0,
+        clip: Optional[Tuple[float, float]] = None,
+    ) -> str:
         task_id = str(uuid.uuid4())
-        self._tasks[task_id] = {
-            "status": "pending",
-            "progress": 0,
-            "filename": None,
-            "error": None,
-            "filepath": None
-        }
+        now = time.time()
+        clip_start, clip_end = clip or (None, None)
+        self._conn().execute(
+            "INSERT INTO tasks (id, url, format_id, handle, info, clip_start, clip_end, priority, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (task_id, url, format_id, handle, json.dumps(info) if info else None, clip_start, clip_end, priority, now, now),
+        )
         return task_id
 
     def update_task(self, task_id: str, **kwargs):
-        if task_id in self._tasks:
-            self._tasks[task_id].update(kwargs)
+        self.update_tasks([task_id], **kwargs)
+
+    def update_tasks(self, task_ids: List[str], **kwargs):
+        """The same update_task() for many tasks, in one statement per 500 IDs."""
+        columns = {k: v for k, v in kwargs.items() if k in _COLUMNS}
+        extra = {k: v for k, v in kwargs.items() if k not in _COLUMNS}
+        if "info" in columns and columns["info"] is not None:
+            columns["info"] = json.dumps(columns["info"])
+
+        assignments = [f"{k} = ?" for k in columns] + ["updated_at = ?"]
+        params = list(columns.values()) + [time.time()]
+        if extra:
+            assignments.append("meta = json_patch(meta, ?)")
+            params.append(json.dumps(extra))
+        for i in range(0, len(task_ids), 500):
+            batch = task_ids[i:i + 500]
+            self._conn().execute(
+                f"UPDATE tasks SET {', '.join(assignments)} WHERE id IN ({', '.join('?' * len(batch))})",
+                params + batch,
+            )
+
+    @staticmethod
+    def _public(row: sqlite3.Row) -> Dict[str, Any]:
+        task = {field: row[field] for field in PUBLIC_FIELDS}
+        task.update(json.loads(row["meta"]))
+        return task
 
     def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
-        return self._tasks.get(task_id)
+        row = self._conn().execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return self._public(row) if row is not None else None
+
+    def get_tasks(self, task_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """get_task() for many tasks in one query per 500 IDs; missing ones are left out."""
+        tasks = {}
+        for i in range(0, len(task_ids), 500):
+            batch = task_ids[i:i + 500]
+            rows = self._conn().execute(
+                f"SELECT * FROM tasks WHERE id IN ({', '.join('?' * len(batch))})", batch,
+            ).fetchall()
+            tasks.update((row["id"], self._public(row)) for row in rows)
+        return tasks
+
+    def get_job(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Full row including the queue bookkeeping columns, for workers."""
+        row = self._conn().execute("SELECT * FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["info"] = json.loads(job["info"]) if job["info"] else None
+        job["meta"] = json.loads(job["meta"])
+        return job
 
     def fail_task(self, task_id: str, error: str):
-        self.update_task(task_id, status="failed", error=error)
+        self.update_task(task_id, status="failed", error=error, worker_id=None, lease_until=None)
+
+    # Queue operations
+
+    def claim_next(self, worker_id: str, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """
+        Atomically take the highest priority runnable job and lease it to `worker_id`.
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id FROM tasks WHERE status = 'pending' AND run_after <= ? "
+                "ORDER BY priority DESC, created_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = 'processing', worker_id = ?, lease_until = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (worker_id, now + lease_seconds, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get_job(row["id"])
+
+    def renew_lease(self, task_id: str, worker_id: str, lease_seconds: float):
+        self._conn().execute(
+            "UPDATE tasks SET lease_until = ? WHERE id = ? AND worker_id = ? AND status = 'processing'",
+            (time.time() + lease_seconds, task_id, worker_id),
+        )
+
+    def retry_task(self, task_id: str, delay: float, error: str):
+        """Put a job back in the queue after a transient failure."""
+        self.update_task(
+            task_id, status="pending", progress=0, error=error,
+            run_after=time.time() + delay, worker_id=None, lease_until=None,
+        )
+
+    def defer_task(self, task_id: str, delay: float):
+        """
+        Put a job back without counting the attempt, e.g. while it waits for disk space.
+        """
+        self._conn().execute(
+            "UPDATE tasks SET status = 'pending', run_after = ?, attempts = MAX(attempts - 1, 0), "
+            "worker_id = NULL, lease_until = NULL, updated_at = ? WHERE id = ?",
+            (time.time() + delay, time.time(), task_id),
+        )
+
+    def recover_expired(self, max_attempts: int) -> int:
+        """
+        Requeue jobs whose worker stopped renewing its lease (crash, restart, OOM kill).
+        Jobs that already used `max_attempts` are failed instead: a job that
+        takes its worker down would otherwise crash workers forever.
+        Returns the number of requeued jobs.
+        """
+        conn = self._conn()
+        now = time.time()
+        failed = conn.execute(
+            "UPDATE tasks SET status = 'failed', error = ?, worker_id = NULL, lease_until = NULL, updated_at = ? "
+            "WHERE status = 'processing' AND lease_until < ? AND attempts >= ?",
+            (f"Worker died during the download ({max_attempts} attempts)", now, now, max_attempts),
+        ).rowcount
+        if failed:
+            logger.warning(f"Failed {failed} job(s) whose workers died on every attempt")
+        cur = conn.execute(
+            "UPDATE tasks SET status = 'pending', worker_id = NULL, lease_until = NULL, updated_at = ? "
+            "WHERE status = 'processing' AND lease_until < ?",
+            (now, now),
+        )
+        return cur.rowcount
+
+    def status_counts(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall()
+        return {row[0]: row[1] for row in rows}
+
+    def queue_depth(self) -> int:
+        row = self._conn().execute("SELECT COUNT(*) FROM tasks WHERE status = 'pending'").fetchone()
+        return row[0]
 
-task_manager = TaskManager()
+task_manager = TaskManager(settings.TASK_DB_PATH)
@@ -0,0 +1,160 @@
+import contextvars
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class Trace:
+    """
+    Phase timings for one API request or download task.
+
+    Phases are recorded either as blocks (`with trace.phase("queue")`) or as
+    marks (`trace.mark("webpage")`), where each mark ends the previous one;
+    marks come from yt-dlp's log lines, which is the only place we learn
+    when it moves from fetching the webpage to resolving formats.
+    """
+    def __init__(self, name: str, **attrs):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.attrs = attrs
+        self.started = time.monotonic()
+        self.spans: List[Tuple[str, float]] = []
+        self._open: Optional[Tuple[str, float]] = None
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self.spans.append((name, seconds))
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - started)
+
+    def mark(self, name: str):
+        now = time.monotonic()
+        with self._lock:
+            if self._open and self._open[0] == name:
+                return
+            if self._open:
+                self.spans.append((self._open[0], now - self._open[1]))
+            self._open = (name, now)
+
+    def end_mark(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._open:
+                self.spans.append((self._open[0], now - self._open[1]))
+                self._open = None
+
+    def phases(self) -> Dict[str, float]:
+        """Seconds per phase, summed over repeats (e.g. several webpage fetches)."""
+        totals: Dict[str, float] = {}
+        with self._lock:
+            for name, seconds in self.spans:
+                totals[name] = totals.get(name, 0.0) + seconds
+        return {name: round(seconds, 4) for name, seconds in totals.items()}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "total": round(time.monotonic() - self.started, 4),
+            "phases": self.phases(),
+        }
+
+    def server_timing(self) -> str:
+        """The phases as a Server-Timing header value (milliseconds)."""
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.phases().items())
+
+    def finish(self, outcome: str = "ok", total: Optional[float] = None):
+        """
+        Close the trace and log it if sampled. Slow traces and outcome "error"
+        are always logged. `total` overrides the elapsed time (e.g. time to
+        first byte).
+        """
+        self.end_mark()
+        if total is None:
+            total = time.monotonic() - self.started
+        if outcome != "error" and total < settings.TRACE_SLOW_SECONDS and random.random() >= settings.TRACE_SAMPLE_RATE:
+            return
+        fields = [f"total={total:.3f}s"]
+        fields += [f"{name}={seconds:.3f}s" for name, seconds in self.phases().items()]
+        fields += [f"{k}={v}" for k, v in self.attrs.items() if v is not None]
+        logger.info(f"trace {self.id} {self.name} {outcome} {' '.join(fields)}")
+
+current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Record a phase on the current trace, if there is one."""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.phase(name):
+        yield
+
+def record(name: str, seconds: float):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+# yt-dlp log lines that start a phase, checked in order
+_PHASE_PATTERNS = [
+    ("postprocess", re.compile(r"^\[(?:Merger|ExtractAudio|EmbedThumbnail|VideoRemuxer|VideoConvertor|Fixup\w*|ffmpeg|Metadata)\]")),
+    ("download", re.compile(r"^\[(?:download|hlsnative|dashsegments|rangesplit)\]")),
+    ("formats", re.compile(
+        r"player|m3u8|MPD|manifest|formats?\b|Downloading \d+ format|nsig|signature|^\[info\]", re.IGNORECASE,
+    )),
+    ("webpage", re.compile(r"webpage|API JSON|initial data|client config|Extracting|Requesting|Downloading", re.IGNORECASE)),
+]
+_DOWNLOAD_PROGRESS = re.compile(r"^\[download\]\s+\d+(?:\.\d+)?%")
+
+class YtdlpLogger:
+    """
+    yt-dlp `logger`: forwards its output to the "yt_dlp" Python logger and
+    turns its progress lines into phase marks on the current trace.
+    Stateless (the trace comes from a context variable), so it can be
+    pickled into extraction worker processes along with the options.
+    """
+    _log = logging.getLogger("yt_dlp")
+
+    def debug(self, msg: str):
+        if msg.startswith("[debug] "):
+            self._log.debug(msg)
+            return
+        self._mark(msg)
+        # Per-chunk progress lines would flood the log
+        self._log.log(logging.DEBUG if _DOWNLOAD_PROGRESS.match(msg) else logging.INFO, msg)
+
+    def info(self, msg: str):
+        self._mark(msg)
+        self._log.info(msg)
+
+    def warning(self, msg: str):
+        self._log.warning(msg)
+
+    def error(self, msg: str):
+        self._log.error(msg)
+
+    @staticmethod
+    def _mark(msg: str):
+        trace = current_trace.get()
+        if trace is None or not msg.startswith("["):
+            return
+        for name, pattern in _PHASE_PATTERNS:
+            if pattern.search(msg):
+                trace.mark(name)
+                return
+
+ytdlp_logger = YtdlpLogger()
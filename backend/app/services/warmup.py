@@ -0,0 +1,71 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class Warmup:
+    """
+    Slow startup work (loading yt-dlp, writing cookie files, indexing the
+    download cache) run on a background thread once the server is up, so the
+    port is bound and health checks answer straight away.
+
+    Every step also happens lazily on first use, so a request that arrives
+    before warm-up is done still works; it just pays the cost itself.
+    """
+    def __init__(self):
+        self.started: Optional[float] = None
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, steps: List[Tuple[str, Callable[[], Any]]]):
+        if self._thread is not None:
+            return
+        self.started = time.monotonic()
+        with self._lock:
+            self.steps = {name: {"status": "pending"} for name, _ in steps}
+        self._thread = threading.Thread(target=self._run, args=(steps,), name="warmup", daemon=True)
+        self._thread.start()
+
+    def _run(self, steps: List[Tuple[str, Callable[[], Any]]]):
+        for name, fn in steps:
+            began = time.monotonic()
+            try:
+                fn()
+                result = {"status": "done"}
+            except Exception as e:
+                logger.exception(f"Warm-up step {name} failed")
+                result = {"status": "failed", "error": str(e)}
+            result["seconds"] = round(time.monotonic() - began, 3)
+            with self._lock:
+                self.steps[name] = result
+        logger.info(f"Warm-up finished in {time.monotonic() - self.started:.2f}s")
+        self._done.set()
+
+    @property
+    def ready(self) -> bool:
+        """Every step finished without error (trivially true if never started)."""
+        if self._thread is None:
+            return True
+        with self._lock:
+            return self._done.is_set() and all(step["status"] == "done" for step in self.steps.values())
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            steps = {name: dict(step) for name, step in self.steps.items()}
+        if self._thread is None or self.ready:
+            state = "ready"
+        elif not self._done.is_set():
+            state = "warming"
+        else:
+            state = "failed"
+        return {
+            "status": state,
+            "uptime": round(time.monotonic() - self.started, 3) if self.started else None,
+            "steps": steps,
+        }
+
+warmup = Warmup()
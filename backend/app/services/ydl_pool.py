@@ -0,0 +1,257 @@
+import logging
+import os
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+import yt_dlp
+from yt_dlp.networking.exceptions import HTTPError
+from yt_dlp.postprocessor import FFmpegPostProcessor
+from app.core.config import settings
+from app.services.download_engine import RangeSplitDownloader
+from app.services.postprocess import postprocess_pool
+from app.services.rate_limiter import host_limiter, parse_retry_after
+from app.services.tracing import current_trace, phase
+
+logger = logging.getLogger(__name__)
+
+# Lease overrides that yt-dlp reads once in __init__ rather than from params
+_HOOK_OVERRIDES = {
+    "progress_hooks": "_progress_hooks",
+    "postprocessor_hooks": "_postprocessor_hooks",
+}
+
+# Per-run state YoutubeDL keeps in private attributes, reset between leases so
+# it doesn't leak into the next one. A yt-dlp release may rename them: a
+# missing one is logged (once) rather than silently skipped or fatal.
+_RUN_STATE = ("_download_retcode", "_playlist_level", "_playlist_urls", "_printed_messages")
+_missing_run_state = set()
+
+def _reset_run_state(ydl: yt_dlp.YoutubeDL):
+    for attr in _RUN_STATE:
+        if not hasattr(ydl, attr):
+            if attr not in _missing_run_state:
+                _missing_run_state.add(attr)
+                logger.warning(f"YoutubeDL has no {attr} (yt-dlp {yt_dlp.version.__version__}): leases may share its state")
+            continue
+        value = getattr(ydl, attr)
+        if isinstance(value, int):
+            setattr(ydl, attr, 0)
+        else:
+            value.clear()
+
+class ThrottledYoutubeDL(yt_dlp.YoutubeDL):
+    """
+    YoutubeDL whose every HTTP request (extractor pages, API calls, media and
+    fragment downloads) is paced by the shared per-host AIMD limiter, which
+    in turn learns from the 429/403 and Retry-After answers it gets back.
+    ffmpeg post-processors run in the post-processing pool.
+
+    `request_seconds` collects the time to response headers of every request
+    made during the current lease: the latency of the network path (proxy
+    hop included), whatever number of requests the page needs.
+    """
+    def __init__(self, params=None, auto_init=True):
+        self.request_seconds: List[float] = []
+        super().__init__(params, auto_init)
+
+    def request_latency(self) -> Optional[float]:
+        """Median request latency of the current lease, None if it made no requests."""
+        return statistics.median(self.request_seconds) if self.request_seconds else None
+
+    def urlopen(self, req):
+        url = req if isinstance(req, str) else getattr(req, "url", None) or req.get_full_url()
+        key, limiter = host_limiter.get(url, self.params.get("proxy"))
+        limiter.acquire(key)
+        started = time.monotonic()
+        try:
+            response = super().urlopen(req)
+        except HTTPError as e:
+            if e.status in (429, 403):
+                retry_after = parse_retry_after(e.response.headers.get("Retry-After"))
+                logger.warning(f"{key} answered {e.status}, slowing down (Retry-After: {retry_after})")
+                limiter.on_throttle(retry_after)
+            raise
+        limiter.on_success()
+        self.request_seconds.append(time.monotonic() - started)
+        return response
+
+    def dl(self, name, info, subtitle=False, test=False):
+        # Large progressive files go to the Range splitter when the lease grants
+        # more than one connection (split_connections); everything else, DASH/HLS
+        # included, uses yt-dlp's own downloaders
+        if test or subtitle or name == "-" or not RangeSplitDownloader.suitable(info, self.params):
+            return super().dl(name, info, subtitle, test)
+        fd = RangeSplitDownloader(self, self.params)
+        for hook in self._progress_hooks:
+            fd.add_progress_hook(hook)
+        new_info = self._copy_infodict(info)
+        if new_info.get("http_headers") is None:
+            new_info["http_headers"] = self._calc_headers(new_info)
+        return fd.download(name, new_info, subtitle)
+
+    def run_pp(self, pp, infodict):
+        if not isinstance(pp, FFmpegPostProcessor):
+            # File moves and metadata-only steps don't need a slot
+            return super().run_pp(pp, infodict)
+        # Tell the progress hooks we're waiting, the pool may be busy with other jobs
+        for hook in self._postprocessor_hooks:
+            hook({"status": "queued", "postprocessor": pp.pp_key(), "info_dict": infodict})
+        return postprocess_pool.run(pp.pp_key(), super().run_pp, pp, infodict)
+
+class _Pooled:
+    """One warm YoutubeDL instance plus the bookkeeping used to decide when to recycle it."""
+    def __init__(self, ydl: yt_dlp.YoutubeDL, cookie_mtime: Optional[float]):
+        self.ydl = ydl
+        self.cookie_mtime = cookie_mtime
+        self.created = time.monotonic()
+        self.uses = 0
+
+class YDLPool:
+    """
+    Long-lived YoutubeDL instances, one idle list per option profile
+    (e.g. "extract:proxy", "download:direct").
+
+    A fresh YoutubeDL per request re-parses the cookie file, re-creates
+    extractor instances and opens new HTTP connections. Pooled instances keep
+    their cookie jar, extractors and request handlers (and with them the
+    keep-alive connections) between requests. Each lease gets exclusive use
+    of an instance, since YoutubeDL is not thread-safe.
+
+    Instances are recycled after `max_uses` leases, after `max_age` seconds,
+    when the cookie file changed on disk, or when a lease raised.
+    """
+    def __init__(self, max_idle: int, max_uses: int, max_age: float):
+        self.max_idle = max_idle
+        self.max_uses = max_uses
+        self.max_age = max_age
+        self._idle: Dict[str, List[_Pooled]] = {}
+        self._lock = threading.Lock()
+        self._created = 0
+        self._reused = 0
+        self._recycled = 0
+
+    @staticmethod
+    def _cookie_mtime(opts: Dict[str, Any]) -> Optional[float]:
+        path = opts.get("cookiefile")
+        try:
+            return os.path.getmtime(path) if path else None
+        except OSError:
+            return None
+
+    def _healthy(self, pooled: _Pooled, opts: Dict[str, Any]) -> bool:
+        if pooled.uses >= self.max_uses:
+            return False
+        if time.monotonic() - pooled.created > self.max_age:
+            return False
+        # Rotated cookies: the warm jar is stale
+        return pooled.cookie_mtime == self._cookie_mtime(opts)
+
+    def _acquire(self, profile: str, opts: Dict[str, Any]) -> _Pooled:
+        while True:
+            with self._lock:
+                idle = self._idle.get(profile)
+                pooled = idle.pop() if idle else None
+            if pooled is None:
+                break
+            if self._healthy(pooled, opts):
+                with self._lock:
+                    self._reused += 1
+                return pooled
+            self._discard(pooled)
+
+        with self._lock:
+            self._created += 1
+        return _Pooled(ThrottledYoutubeDL(opts), self._cookie_mtime(opts))
+
+    def _release(self, profile: str, pooled: _Pooled):
+        with self._lock:
+            idle = self._idle.setdefault(profile, [])
+            if len(idle) < self.max_idle:
+                idle.append(pooled)
+                return
+        self._discard(pooled)
+
+    def _discard(self, pooled: _Pooled):
+        with self._lock:
+            self._recycled += 1
+        # close() would save this instance's jar over the shared cookie file,
+        # which bumps its mtime (every other idle instance on the jar would look
+        # stale) and can overwrite cookies rotated on disk since. `params` may be
+        # the caller's opts dict, so replace it rather than edit it.
+        pooled.ydl.params = {k: v for k, v in pooled.ydl.params.items() if k != "cookiefile"}
+        try:
+            pooled.ydl.close()
+        except Exception as e:
+            logger.warning(f"Closing pooled YoutubeDL failed: {e}")
+
+    @contextmanager
+    def lease(self, profile: str, opts: Dict[str, Any], **overrides) -> Iterator[yt_dlp.YoutubeDL]:
+        """
+        Borrow a YoutubeDL for `profile`, built from `opts` if none is idle.
+        `overrides` are per-request params (format, paths, playlist_items,
+        progress_hooks, ...) applied for this lease only and undone afterwards.
+        """
+        # A cold instance costs a YoutubeDL() (extractor and cookie setup)
+        with phase("extractor_init"):
+            pooled = self._acquire(profile, opts)
+        ydl = pooled.ydl
+        saved_params = {k: ydl.params.get(k) for k in overrides if k not in _HOOK_OVERRIDES}
+        saved_hooks = {attr: getattr(ydl, attr) for attr in _HOOK_OVERRIDES.values()}
+        saved_selector = ydl.format_selector
+        ydl.request_seconds = []
+        ok = False
+        try:
+            for key, value in overrides.items():
+                if key in _HOOK_OVERRIDES:
+                    setattr(ydl, _HOOK_OVERRIDES[key], list(value or []))
+                else:
+                    ydl.params[key] = value
+            if "format" in overrides:
+                # The selector is compiled once in __init__
+                ydl.format_selector = ydl.build_format_selector(overrides["format"]) if overrides["format"] else None
+            yield ydl
+            ok = True
+        finally:
+            trace = current_trace.get()
+            if trace is not None:
+                # Close the last phase marked from yt-dlp's output
+                trace.end_mark()
+            pooled.uses += 1
+            for key, value in saved_params.items():
+                if value is None:
+                    ydl.params.pop(key, None)
+                else:
+                    ydl.params[key] = value
+            for attr, hooks in saved_hooks.items():
+                setattr(ydl, attr, hooks)
+            ydl.format_selector = saved_selector
+            _reset_run_state(ydl)
+            if ok:
+                self._release(profile, pooled)
+            else:
+                self._discard(pooled)
+
+    def clear(self):
+        with self._lock:
+            pooled = [p for idle in self._idle.values() for p in idle]
+            self._idle.clear()
+        for p in pooled:
+            self._discard(p)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            idle = {profile: len(items) for profile, items in self._idle.items()}
+        return {
+            "idle": idle,
+            "created": self._created,
+            "reused": self._reused,
+            "recycled": self._recycled,
+        }
+
+ydl_pool = YDLPool(
+    max_idle=settings.YDL_POOL_MAX_IDLE,
+    max_uses=settings.YDL_POOL_MAX_USES,
+    max_age=settings.YDL_POOL_MAX_AGE,
+)
@@ -0,0 +1,41 @@
+"""
+Standalone download worker: `python -m app.worker`
+
+Runs the download pool without the web server, so the download tier can be
+scaled separately. Point it at the same TASK_DB_PATH as the API and set
+RUN_DOWNLOAD_WORKERS=false on the API side.
+"""
+import logging
+import signal
+import threading
+from app.core.config import settings
+from app.services.download_workers import download_pool
+from app.services.downloader import extractor
+from app.services.storage import storage
+from app.services.storage_backends import storage_backend
+from app.services.task_manager import task_manager
+from app.services.warmup import warmup
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("app.worker")
+
+def main():
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    warmup.start([
+        ("tasks", task_manager.open),
+        ("storage", storage.open),
+        ("extractor", extractor.warm_up),
+        ("storage_backend", storage_backend.open),
+    ])
+    download_pool.start()
+    storage.start_janitor(settings.STORAGE_JANITOR_INTERVAL)
+    stop.wait()
+    logger.info("Shutting down download workers")
+    download_pool.stop()
+    storage.stop_janitor()
+
+if __name__ == "__main__":
+    main()
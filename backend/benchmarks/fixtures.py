@@ -0,0 +1,119 @@
+import json
+import os
+import shutil
+import subprocess
+from typing import Any, Dict, List
+
+# Bump when the generated layout changes so stale fixture dirs are rebuilt
+FIXTURE_VERSION = 1
+
+_VIDEO = ["-c:v", "libx264", "-preset", "ultrafast", "-g", "50", "-pix_fmt", "yuv420p"]
+_AUDIO = ["-c:a", "aac", "-b:a", "96k"]
+
+_PAGE = """<!DOCTYPE html>
+<html><head>
+<meta charset="utf-8">
+<title>{title}</title>
+<meta property="og:title" content="{title}">
+</head><body>
+<h1>{title}</h1>
+{body}
+</body></html>
+"""
+
+def _sources(duration: int) -> List[str]:
+    # Test pattern + tone, so every fixture is real, decodable media that
+    # post-processors (merge, HLS fixup) can work on
+    return [
+        "-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=25:duration={duration}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=44100:duration={duration}",
+    ]
+
+def _ffmpeg(*args: str):
+    subprocess.run(["ffmpeg", "-v", "error", "-y", *args], check=True)
+
+def _progressive(root: str, duration: int):
+    _ffmpeg(
+        *_sources(duration), "-map", "0:v", "-map", "1:a", *_VIDEO, "-s", "1280x720", "-b:v", "3M",
+        *_AUDIO, "-movflags", "+faststart", os.path.join(root, "progressive.mp4"),
+    )
+
+def _hls(root: str, duration: int):
+    # Two renditions behind a master playlist, muxed A/V in MPEG-TS segments
+    out = os.path.join(root, "hls")
+    os.makedirs(out, exist_ok=True)
+    _ffmpeg(
+        *_sources(duration), "-map", "0:v", "-map", "1:a", "-map", "0:v", "-map", "1:a",
+        *_VIDEO, "-s:v:0", "1280x720", "-b:v:0", "2500k", "-s:v:1", "640x360", "-b:v:1", "800k", *_AUDIO,
+        "-f", "hls", "-hls_time", "2", "-hls_playlist_type", "vod",
+        "-var_stream_map", "v:0,a:0,name:720p v:1,a:1,name:360p", "-master_pl_name", "master.m3u8",
+        "-hls_segment_filename", os.path.join(out, "%v", "seg%03d.ts"), os.path.join(out, "%v", "index.m3u8"),
+    )
+
+def _dash(root: str, duration: int):
+    # Separate video and audio adaptation sets, so downloads go through the merger
+    out = os.path.join(root, "dash")
+    os.makedirs(out, exist_ok=True)
+    _ffmpeg(
+        *_sources(duration), "-map", "0:v", "-map", "0:v", "-map", "1:a",
+        *_VIDEO, "-s:v:0", "1280x720", "-b:v:0", "2500k", "-s:v:1", "640x360", "-b:v:1", "800k", *_AUDIO,
+        "-f", "dash", "-seg_duration", "2", "-use_template", "1", "-use_timeline", "0",
+        "-adaptation_sets", "id=0,streams=v id=1,streams=a", os.path.join(out, "manifest.mpd"),
+    )
+
+def _pages(root: str):
+    pages = {
+        "page-video.html": ("Progressive video page", '<video controls src="/progressive.mp4"></video>'),
+        "page-hls.html": (
+            "HLS video page",
+            '<video controls><source src="/hls/master.m3u8" type="application/x-mpegURL"></video>',
+        ),
+        "page-multi.html": (
+            "Page with several videos",
+            '<video src="/progressive.mp4"></video>\n<video src="/hls/360p/index.m3u8"></video>',
+        ),
+    }
+    for name, (title, body) in pages.items():
+        with open(os.path.join(root, name), "w") as f:
+            f.write(_PAGE.format(title=title, body=body))
+
+def ensure_fixtures(root: str, duration: int = 30) -> Dict[str, Any]:
+    """
+    Generate the fixture media under `root` (once; reused while the
+    version and duration match). Needs ffmpeg with libx264 and aac.
+    """
+    manifest_path = os.path.join(root, "fixtures.json")
+    wanted = {"version": FIXTURE_VERSION, "duration": duration}
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if {k: manifest.get(k) for k in wanted} == wanted:
+            return manifest
+    except (OSError, ValueError):
+        pass
+
+    if not shutil.which("ffmpeg"):
+        raise RuntimeError("ffmpeg is required to generate the benchmark fixtures")
+    shutil.rmtree(root, ignore_errors=True)
+    os.makedirs(root)
+    _progressive(root, duration)
+    _hls(root, duration)
+    _dash(root, duration)
+    _pages(root)
+
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        total += sum(os.path.getsize(os.path.join(dirpath, name)) for name in filenames)
+    manifest = {**wanted, "bytes": total}
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+    return manifest
+
+# Fixture kind -> path on the origin
+TARGETS = {
+    "progressive": "/progressive.mp4",
+    "hls": "/hls/master.m3u8",
+    "dash": "/dash/manifest.mpd",
+    "page": "/page-video.html",
+    "page_hls": "/page-hls.html",
+}
@@ -0,0 +1,152 @@
+"""
+Local stand-in for a media CDN: serves the benchmark fixtures with Range
+support, the content types yt-dlp's generic extractor keys off, and optional
+per-request latency and per-connection bandwidth limits.
+
+    python -m benchmarks.origin --root /tmp/mediasense-bench/fixtures --port 8765
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+_CONTENT_TYPES = {
+    ".mp4": "video/mp4",
+    ".m4s": "video/iso.segment",
+    ".ts": "video/mp2t",
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".mpd": "application/dash+xml",
+    ".html": "text/html; charset=utf-8",
+    ".json": "application/json",
+}
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+_CHUNK = 64 * 1024
+
+class _Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.range_requests = 0
+        self.bytes_sent = 0
+
+    def snapshot(self):
+        with self.lock:
+            return {"requests": self.requests, "range_requests": self.range_requests, "bytes_sent": self.bytes_sent}
+
+class OriginHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Set by serve()
+    root = "."
+    latency = 0.0
+    rate: Optional[float] = None
+    stats = _Stats()
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def do_GET(self):
+        self._serve(body=True)
+
+    def _serve(self, body: bool):
+        path = self.path.split("?", 1)[0]
+        if path == "/_stats":
+            return self._send_json(self.stats.snapshot())
+
+        full = os.path.realpath(os.path.join(self.root, path.lstrip("/")))
+        if not full.startswith(os.path.realpath(self.root) + os.sep) or not os.path.isfile(full):
+            self.send_error(404)
+            return
+        size = os.path.getsize(full)
+        start, end, status = 0, size - 1, 200
+
+        header = self.headers.get("Range")
+        match = _RANGE.match(header or "")
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                start = max(0, size - int(match.group(2)))
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+
+        with self.stats.lock:
+            self.stats.requests += 1
+            self.stats.range_requests += status == 206
+        if self.latency:
+            time.sleep(self.latency)
+
+        self.send_response(status)
+        self.send_header("Content-Type", _CONTENT_TYPES.get(os.path.splitext(full)[1], "application/octet-stream"))
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+        if not body:
+            return
+
+        with open(full, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            began = time.monotonic()
+            sent = 0
+            while remaining > 0:
+                chunk = f.read(min(_CHUNK, remaining))
+                if not chunk:
+                    break
+                try:
+                    self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    break
+                remaining -= len(chunk)
+                sent += len(chunk)
+                if self.rate:
+                    # Sleep off whatever we are ahead of the allowed rate
+                    ahead = sent / self.rate - (time.monotonic() - began)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        with self.stats.lock:
+            self.stats.bytes_sent += sent
+
+    def _send_json(self, data):
+        payload = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(root: str, host: str = "127.0.0.1", port: int = 8765, latency_ms: float = 0, rate_kbps: float = 0):
+    """Serve `root` until interrupted. `rate_kbps` limits each response (KiB/s)."""
+    OriginHandler.root = root
+    OriginHandler.latency = latency_ms / 1000
+    OriginHandler.rate = rate_kbps * 1024 if rate_kbps else None
+    server = ThreadingHTTPServer((host, port), OriginHandler)
+    server.daemon_threads = True
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve benchmark fixtures over HTTP")
+    parser.add_argument("--root", required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--rate-kbps", type=float, default=0)
+    args = parser.parse_args()
+    serve(args.root, args.host, args.port, args.latency_ms, args.rate_kbps)
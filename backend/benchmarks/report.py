@@ -0,0 +1,124 @@
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+# Metrics checked against the baseline and which direction is worse
+_LOWER_IS_BETTER = ("p50", "p95", "p99")
+_HIGHER_IS_BETTER = ("throughput",)
+_PROCESS_LOWER_IS_BETTER = ("rss_peak", "cpu_seconds", "write_bytes")
+# Below this many samples p99 is just the slowest request; too noisy to gate on
+_MIN_P99_SAMPLES = 50
+
+def percentile(values: Sequence[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile (`pct` in 0-100)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+def summarize(latencies: List[float], errors: int, elapsed: float, nbytes: int = 0) -> Dict[str, Any]:
+    """Latency percentiles (seconds), request rate and, if bytes moved, bytes/s."""
+    count = len(latencies)
+    summary = {
+        "count": count,
+        "errors": errors,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "mean": sum(latencies) / count if count else None,
+        "max": max(latencies) if latencies else None,
+        "rps": count / elapsed if elapsed else None,
+    }
+    if nbytes:
+        summary["bytes"] = nbytes
+        summary["throughput"] = nbytes / elapsed if elapsed else None
+    return {k: round(v, 4) if isinstance(v, float) else v for k, v in summary.items()}
+
+def _regressed(current: float, base: float, tolerance: float, floor: float, lower_is_better: bool) -> bool:
+    # Small absolute differences (a few ms on a fast endpoint) are noise
+    if abs(current - base) <= floor:
+        return False
+    if lower_is_better:
+        return current > base * (1 + tolerance)
+    return current < base * (1 - tolerance)
+
+def compare(
+    results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.25, latency_floor: float = 0.025,
+) -> List[str]:
+    """
+    Regressions of `results` against `baseline`, as readable lines. Latencies
+    and throughput are compared per scenario, plus the server's peak RSS,
+    CPU time and bytes written. New errors are always a regression.
+    """
+    problems = []
+    for name, base in baseline.get("scenarios", {}).items():
+        current = results.get("scenarios", {}).get(name)
+        if current is None:
+            problems.append(f"{name}: missing from this run")
+            continue
+        if current["errors"] > base["errors"]:
+            problems.append(f"{name}: {current['errors']} errors (baseline {base['errors']})")
+        for key in _LOWER_IS_BETTER + _HIGHER_IS_BETTER:
+            if current.get(key) is None or base.get(key) is None:
+                continue
+            if key == "p99" and min(current["count"], base["count"]) < _MIN_P99_SAMPLES:
+                continue
+            floor = latency_floor if key in _LOWER_IS_BETTER else 0
+            if _regressed(current[key], base[key], tolerance, floor, key in _LOWER_IS_BETTER):
+                problems.append(f"{name}.{key}: {current[key]} vs baseline {base[key]}")
+
+    process, base_process = results.get("process") or {}, baseline.get("process") or {}
+    for key in _PROCESS_LOWER_IS_BETTER:
+        if process.get(key) is None or base_process.get(key) is None:
+            continue
+        # 1 MiB / 0.1 s of slack for the process-wide counters
+        floor = 0.1 if key == "cpu_seconds" else 1024 * 1024
+        if _regressed(process[key], base_process[key], tolerance, floor, True):
+            problems.append(f"process.{key}: {process[key]} vs baseline {base_process[key]}")
+    return problems
+
+def _fmt_seconds(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}ms"
+
+def _fmt_bytes(value: Optional[float]) -> str:
+    if value is None:
+        return "-"
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(value) < 1024 or unit == "GiB":
+            return f"{value:.1f}{unit}"
+        value /= 1024
+
+def render(results: Dict[str, Any]) -> str:
+    """Plain-text table of a results document."""
+    lines = [f"{'scenario':<24}{'n':>6}{'err':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'rps':>8}{'throughput':>14}"]
+    for name, s in results["scenarios"].items():
+        throughput = f"{_fmt_bytes(s['throughput'])}/s" if s.get("throughput") else "-"
+        rps = f"{s['rps']:.1f}" if s.get("rps") else "-"
+        lines.append(
+            f"{name:<24}{s['count']:>6}{s['errors']:>5}{_fmt_seconds(s['p50']):>9}"
+            f"{_fmt_seconds(s['p95']):>9}{_fmt_seconds(s['p99']):>9}{rps:>8}{throughput:>14}"
+        )
+    process = results.get("process")
+    if process:
+        lines.append("")
+        lines.append(
+            f"server: rss peak {_fmt_bytes(process['rss_peak'])}, end {_fmt_bytes(process['rss_end'])}, "
+            f"cpu {process['cpu_seconds']:.1f}s, disk read {_fmt_bytes(process['read_bytes'])}, "
+            f"written {_fmt_bytes(process['write_bytes'])} (syscall {_fmt_bytes(process['wchar'])})"
+        )
+    origin = results.get("origin")
+    if origin:
+        lines.append(
+            f"origin: {origin['requests']} requests ({origin['range_requests']} ranged), "
+            f"{_fmt_bytes(origin['bytes_sent'])} sent"
+        )
+    return "\n".join(lines)
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+def save(path: str, results: Dict[str, Any]):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
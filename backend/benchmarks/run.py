@@ -0,0 +1,430 @@
+"""
+Offline load benchmark for the API.
+
+Starts the fixture origin and a uvicorn server (generic URLs enabled, state
+in a scratch directory), then drives /analyze/, /download/, /download/status
+and /download/file with concurrent clients and reports latency percentiles,
+throughput and the server's RSS, CPU and disk I/O. No network access needed.
+
+    python -m benchmarks.run                       # run and print the report
+    python -m benchmarks.run --save-baseline       # record benchmarks/baseline.json
+    python -m benchmarks.run --compare             # fail (exit 1) on regressions
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import platform
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import quote
+
+import aiohttp
+
+from benchmarks import report
+from benchmarks.fixtures import TARGETS, ensure_fixtures
+from benchmarks.origin import serve
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, "benchmarks", "baseline.json")
+API = "/api/v1"
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+class ProcessSampler:
+    """
+    Samples RSS of a process tree (the server and e.g. its ffmpeg children)
+    and reads its CPU time and I/O counters from /proc. Children that have
+    exited and been reaped are already folded into the parent's counters by
+    the kernel; live ones are added at the end. Linux only; elsewhere the
+    report has no process section.
+    """
+    def __init__(self, pid: int, interval: float = 0.2):
+        self.pid = pid
+        self.interval = interval
+        self.rss_peak = 0
+        self._start: Optional[Dict[str, int]] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _tree(self) -> List[int]:
+        pids, pending = [], [self.pid]
+        while pending:
+            pid = pending.pop()
+            pids.append(pid)
+            try:
+                for task in os.listdir(f"/proc/{pid}/task"):
+                    with open(f"/proc/{pid}/task/{task}/children") as f:
+                        pending.extend(int(child) for child in f.read().split())
+            except OSError:
+                continue
+        return pids
+
+    @staticmethod
+    def _rss(pid: int) -> int:
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                return int(f.read().split()[1]) * _PAGE_SIZE
+        except (OSError, IndexError, ValueError):
+            return 0
+
+    @staticmethod
+    def _counters(pid: int, children: bool) -> Dict[str, int]:
+        counters = defaultdict(int)
+        try:
+            with open(f"/proc/{pid}/io") as f:
+                for line in f:
+                    key, value = line.split(":")
+                    counters[key] = int(value)
+            with open(f"/proc/{pid}/stat") as f:
+                # Fields after the command name; utime is field 14 of the full line
+                fields = f.read().rsplit(")", 1)[1].split()
+            ticks = int(fields[11]) + int(fields[12])
+            if children:
+                ticks += int(fields[13]) + int(fields[14])
+            counters["cpu_ticks"] = ticks
+        except (OSError, ValueError, IndexError):
+            pass
+        return counters
+
+    def _totals(self) -> Dict[str, int]:
+        totals = defaultdict(int)
+        for pid in self._tree():
+            # Only the root's counters include its reaped children
+            for key, value in self._counters(pid, children=pid == self.pid).items():
+                totals[key] += value
+        return totals
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.rss_peak = max(self.rss_peak, sum(self._rss(pid) for pid in self._tree()))
+
+    def start(self):
+        if not os.path.exists(f"/proc/{self.pid}"):
+            return
+        self._start = self._totals()
+        self._thread.start()
+
+    def stop(self) -> Optional[Dict[str, Any]]:
+        if self._start is None:
+            return None
+        self._stop.set()
+        self._thread.join()
+        end = self._totals()
+        delta = {key: end[key] - self._start.get(key, 0) for key in end}
+        return {
+            "rss_peak": max(self.rss_peak, sum(self._rss(pid) for pid in self._tree())),
+            "rss_end": self._rss(self.pid),
+            "cpu_seconds": round(delta.get("cpu_ticks", 0) / _CLOCK_TICKS, 2),
+            "read_bytes": delta.get("read_bytes", 0),
+            "write_bytes": delta.get("write_bytes", 0),
+            "rchar": delta.get("rchar", 0),
+            "wchar": delta.get("wchar", 0),
+        }
+
+class Recorder:
+    """
+    Latencies, errors and bytes per scenario, plus a few sample error messages.
+    A scenario's rate and throughput are taken over its wall time, from the
+    first request's start to the last one's end.
+    """
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.bytes: Dict[str, int] = defaultdict(int)
+        self.spans: Dict[str, List[float]] = {}
+        self.samples: List[str] = []
+
+    def ok(self, name: str, seconds: float, nbytes: int = 0):
+        self.latencies[name].append(seconds)
+        self.bytes[name] += nbytes
+        now = time.monotonic()
+        span = self.spans.setdefault(name, [now - seconds, now])
+        span[0], span[1] = min(span[0], now - seconds), max(span[1], now)
+
+    def error(self, name: str, message: str):
+        self.errors[name] += 1
+        if len(self.samples) < 10:
+            self.samples.append(f"{name}: {message}")
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        names = list(dict.fromkeys([*self.latencies, *self.errors]))
+        return {
+            name: report.summarize(
+                self.latencies[name], self.errors[name], self._elapsed(name), self.bytes[name],
+            )
+            for name in names
+        }
+
+    def _elapsed(self, name: str) -> float:
+        span = self.spans.get(name)
+        return span[1] - span[0] if span else 0
+
+def _unique(url: str) -> str:
+    # A fresh query string defeats the analyze cache and the download blob cache
+    return f"{url}?bench={uuid.uuid4().hex[:10]}"
+
+async def _analyze(session: aiohttp.ClientSession, api: str, url: str) -> Dict[str, Any]:
+    async with session.get(f"{api}{API}/analyze/?url={quote(url, safe='')}") as resp:
+        body = await resp.json(content_type=None)
+        if resp.status != 200:
+            raise RuntimeError(f"analyze {resp.status}: {body}")
+        return body
+
+async def _download(
+    session: aiohttp.ClientSession, api: str, url: str, rec: Recorder, kind: str, poll: float, timeout: float,
+):
+    """Analyze -> POST /download/ with the handle -> poll status -> fetch the file."""
+    name = f"download_{kind}"
+    try:
+        info = await _analyze(session, api, url)
+        started = time.monotonic()
+        payload = {"url": url, "format_id": "best", "handle": info.get("handle")}
+        async with session.post(f"{api}{API}/download/", json=payload) as resp:
+            body = await resp.json(content_type=None)
+            if resp.status != 200:
+                raise RuntimeError(f"submit {resp.status}: {body}")
+        rec.ok("download_submit", time.monotonic() - started)
+        task_id = body["task_id"]
+
+        while True:
+            if time.monotonic() - started > timeout:
+                raise RuntimeError(f"task {task_id} not done after {timeout}s")
+            polled = time.monotonic()
+            async with session.get(f"{api}{API}/download/status/{task_id}") as resp:
+                task = await resp.json(content_type=None)
+            rec.ok("status", time.monotonic() - polled)
+            if task.get("status") == "completed":
+                break
+            if task.get("status") == "failed":
+                raise RuntimeError(f"task failed: {task.get('error')}")
+            await asyncio.sleep(poll)
+        completed = time.monotonic()
+
+        size = 0
+        async with session.get(f"{api}{API}/download/file/{task_id}") as resp:
+            if resp.status != 200:
+                raise RuntimeError(f"file {resp.status}")
+            rec.ok("file_ttfb", time.monotonic() - completed)
+            async for chunk in resp.content.iter_chunked(256 * 1024):
+                size += len(chunk)
+        rec.ok("file", time.monotonic() - completed, size)
+        rec.ok(name, time.monotonic() - started, size)
+    except Exception as e:
+        rec.error(name, str(e))
+
+async def _run_jobs(jobs: List[Callable[[], Awaitable[None]]], concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(job):
+        async with semaphore:
+            await job()
+
+    await asyncio.gather(*(limited(job) for job in jobs))
+
+async def drive(api: str, origin: str, args) -> Recorder:
+    rec = Recorder()
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency * 2)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        # Warm-up: imports, extractor instances, first connections. Not recorded.
+        for path in TARGETS.values():
+            try:
+                await _analyze(session, api, _unique(origin + path))
+            except Exception as e:
+                print(f"warm-up {path}: {e}", file=sys.stderr)
+
+        for kind, path in TARGETS.items():
+            async def cold(url=origin + path, name=f"analyze_cold_{kind}"):
+                started = time.monotonic()
+                try:
+                    await _analyze(session, api, _unique(url))
+                    rec.ok(name, time.monotonic() - started)
+                except Exception as e:
+                    rec.error(name, str(e))
+            await _run_jobs([cold] * args.requests, args.concurrency)
+
+        # Same URL over and over: the analyze cache path
+        warm_url = _unique(origin + TARGETS["progressive"])
+        try:
+            await _analyze(session, api, warm_url)
+        except Exception as e:
+            print(f"warm-up {warm_url}: {e}", file=sys.stderr)
+
+        async def warm():
+            started = time.monotonic()
+            try:
+                await _analyze(session, api, warm_url)
+                rec.ok("analyze_warm", time.monotonic() - started)
+            except Exception as e:
+                rec.error("analyze_warm", str(e))
+        await _run_jobs([warm] * args.requests * 5, args.concurrency)
+
+        for kind in args.download_kinds:
+            jobs = [
+                lambda kind=kind: _download(
+                    session, api, _unique(origin + TARGETS[kind]), rec, kind, args.poll_interval, args.task_timeout,
+                )
+                for _ in range(args.downloads)
+            ]
+            await _run_jobs(jobs, args.download_concurrency)
+    return rec
+
+async def _wait_ready(url: str, alive: Callable[[], bool], timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if not alive():
+                raise RuntimeError(f"{url}: process exited (port in use?)")
+            try:
+                async with session.get(url) as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+def _start_server(args, workdir: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "ALLOW_GENERIC_URLS": "true",
+        "TASK_DB_PATH": os.path.join(workdir, "tasks.db"),
+        "TEMP_DOWNLOAD_DIR": os.path.join(workdir, "downloads"),
+        # Keep the log quiet; traces would otherwise be sampled into it
+        "TRACE_SAMPLE_RATE": "0",
+    }
+    log = open(os.path.join(workdir, "server.log"), "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(args.port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline API benchmark against a local media origin")
+    parser.add_argument("--requests", type=int, default=20, help="analyze requests per fixture kind")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent analyze clients")
+    parser.add_argument("--downloads", type=int, default=4, help="downloads per fixture kind")
+    parser.add_argument("--download-concurrency", type=int, default=4)
+    parser.add_argument(
+        "--download-kinds", nargs="+", default=["progressive", "hls", "dash", "page"], choices=list(TARGETS),
+    )
+    parser.add_argument("--duration", type=int, default=30, help="fixture length in seconds")
+    parser.add_argument("--origin-latency-ms", type=float, default=0)
+    parser.add_argument("--origin-rate-kbps", type=float, default=0, help="per-connection limit, 0 = unlimited")
+    parser.add_argument("--port", type=int, default=8091, help="port for the API server")
+    parser.add_argument("--origin-port", type=int, default=8765)
+    parser.add_argument("--server-url", help="benchmark an already running server instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="pid of --server-url, for RSS and I/O")
+    parser.add_argument("--poll-interval", type=float, default=0.25)
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout")
+    parser.add_argument("--task-timeout", type=float, default=300)
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "mediasense-bench"))
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="exit 1 if the results regress the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown")
+    args = parser.parse_args()
+
+    if not shutil.which("ffprobe"):
+        print("Warning: ffprobe not found; the server's post-processing (HLS fixup) will fail and retry", file=sys.stderr)
+    fixtures_dir = os.path.join(args.workdir, "fixtures")
+    print("Preparing fixtures...", file=sys.stderr)
+    fixtures = ensure_fixtures(fixtures_dir, args.duration)
+
+    origin_url = f"http://127.0.0.1:{args.origin_port}"
+    origin = multiprocessing.Process(
+        target=serve,
+        args=(fixtures_dir, "127.0.0.1", args.origin_port, args.origin_latency_ms, args.origin_rate_kbps),
+        daemon=True,
+    )
+    origin.start()
+
+    server = None
+    run_dir = tempfile.mkdtemp(prefix="run-", dir=args.workdir)
+    if args.server_url:
+        api, pid = args.server_url.rstrip("/"), args.server_pid
+    else:
+        server = _start_server(args, run_dir)
+        api, pid = f"http://127.0.0.1:{args.port}", server.pid
+
+    try:
+        asyncio.run(_wait_ready(f"{origin_url}/_stats", origin.is_alive))
+        asyncio.run(_wait_ready(f"{api}/readyz", lambda: server is None or server.poll() is None))
+        sampler = ProcessSampler(pid) if pid else None
+        if sampler:
+            sampler.start()
+        print("Running...", file=sys.stderr)
+        started = time.monotonic()
+        rec = asyncio.run(drive(api, origin_url, args))
+        wall = time.monotonic() - started
+        process = sampler.stop() if sampler else None
+        origin_stats = asyncio.run(_fetch_json(f"{origin_url}/_stats"))
+    finally:
+        if server is not None:
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+            # Keep the log and task DB, drop the downloaded media
+            shutil.rmtree(os.path.join(run_dir, "downloads"), ignore_errors=True)
+        origin.terminate()
+
+    results = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "wall_seconds": round(wall, 2),
+            "fixtures": fixtures,
+            "options": {
+                key: getattr(args, key) for key in (
+                    "requests", "concurrency", "downloads", "download_concurrency", "download_kinds",
+                    "duration", "origin_latency_ms", "origin_rate_kbps",
+                )
+            },
+        },
+        "scenarios": rec.summary(),
+        "process": process,
+        "origin": origin_stats,
+    }
+    print(report.render(results))
+    if rec.samples:
+        print("\nErrors:\n  " + "\n  ".join(rec.samples))
+    if server is not None:
+        print(f"\nServer log: {os.path.join(run_dir, 'server.log')}", file=sys.stderr)
+
+    if args.output:
+        report.save(args.output, results)
+    if args.save_baseline:
+        report.save(args.baseline, results)
+        print(f"Baseline written to {args.baseline}", file=sys.stderr)
+    if args.compare:
+        baseline = report.load(args.baseline)
+        if baseline["meta"].get("options") != results["meta"]["options"]:
+            print("Warning: baseline was recorded with different options", file=sys.stderr)
+        problems = report.compare(results, baseline, args.tolerance)
+        if problems:
+            print("\nRegressions:\n  " + "\n  ".join(problems))
+            sys.exit(1)
+        print("\nNo regressions against the baseline")
+
+async def _fetch_json(url: str) -> Any:
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as resp:
+            return await resp.json(content_type=None)
+
+if __name__ == "__main__":
+    main()
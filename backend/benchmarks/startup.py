@@ -0,0 +1,187 @@
+"""
+Cold start benchmark: how long `import app.main` takes in a fresh
+interpreter, which packages dominate it, and how long a fresh uvicorn takes
+to answer /healthz (port bound) and /readyz (warm-up done).
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --save-baseline
+    python -m benchmarks.startup --compare
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks import report
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(BACKEND_DIR, "benchmarks", "startup_baseline.json")
+
+# Run in a fresh interpreter; prints what got imported along the way
+_IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app.main
+print(json.dumps({
+    "seconds": time.perf_counter() - started,
+    "modules": len(sys.modules),
+    "heavy": [name for name in ("yt_dlp", "aiohttp") if name in sys.modules],
+}))
+"""
+
+# Lower is better; differences under 50 ms are noise
+_CHECKED = ("import_seconds", "healthz_seconds", "readyz_seconds")
+_FLOOR = 0.05
+
+def _env(workdir: str) -> Dict[str, str]:
+    # The task DB and download dir are created on import/first use; keep them out of the tree
+    return {
+        **os.environ,
+        "TASK_DB_PATH": os.path.join(workdir, "tasks.db"),
+        "TEMP_DOWNLOAD_DIR": os.path.join(workdir, "downloads"),
+    }
+
+def measure_import(runs: int, env: Dict[str, str]) -> Dict[str, Any]:
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", _IMPORT_PROBE], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+        )
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    seconds = [s["seconds"] for s in samples]
+    return {
+        "import_seconds": round(statistics.median(seconds), 4),
+        "import_min": round(min(seconds), 4),
+        "import_max": round(max(seconds), 4),
+        "modules": samples[-1]["modules"],
+        "heavy_modules": samples[-1]["heavy"],
+    }
+
+def top_imports(env: Dict[str, str], limit: int = 10) -> List[Tuple[str, float]]:
+    """Packages by cumulative import time (from -X importtime), `app` included."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    totals: Dict[str, float] = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        try:
+            seconds = int(cumulative) / 1e6
+        except ValueError:
+            continue
+        # A package's outermost import has the largest cumulative time
+        package = name.strip().split(".")[0]
+        totals[package] = max(totals.get(package, 0.0), seconds)
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    return [(name, round(seconds, 4)) for name, seconds in ranked[:limit]]
+
+def _status(url: str) -> Optional[int]:
+    try:
+        with urllib.request.urlopen(url, timeout=2) as resp:
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+def measure_serve(port: int, env: Dict[str, str], timeout: float = 60) -> Dict[str, Any]:
+    """Seconds from spawning uvicorn until /healthz, then /readyz, return 200."""
+    base = f"http://127.0.0.1:{port}"
+    started = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    result = {"healthz_seconds": None, "readyz_seconds": None}
+    try:
+        while time.monotonic() - started < timeout and server.poll() is None:
+            if result["healthz_seconds"] is None:
+                if _status(f"{base}/healthz") == 200:
+                    result["healthz_seconds"] = round(time.monotonic() - started, 4)
+            elif _status(f"{base}/readyz") == 200:
+                result["readyz_seconds"] = round(time.monotonic() - started, 4)
+                break
+            time.sleep(0.01)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    return result
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    problems = []
+    for key in _CHECKED:
+        current, base = results.get(key), baseline.get(key)
+        if base is None:
+            continue
+        if current is None:
+            problems.append(f"{key}: not measured (server never got there)")
+        elif current - base > _FLOOR and current > base * (1 + tolerance):
+            problems.append(f"{key}: {current} vs baseline {base}")
+    if set(results.get("heavy_modules") or []) - set(baseline.get("heavy_modules") or []):
+        problems.append(f"heavy_modules: {results['heavy_modules']} now imported by app.main")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark for the API")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--port", type=int, default=8092)
+    parser.add_argument("--output", help="write the results JSON here")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="exit 1 if startup got slower than the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="mediasense-startup-") as workdir:
+        env = _env(workdir)
+        results = measure_import(args.runs, env)
+        results["top_imports"] = top_imports(env)
+        serves = [measure_serve(args.port, env) for _ in range(args.runs)]
+
+    for key in ("healthz_seconds", "readyz_seconds"):
+        values = [s[key] for s in serves if s[key] is not None]
+        results[key] = round(statistics.median(values), 4) if len(values) == len(serves) else None
+
+    print(f"import app.main   {results['import_seconds'] * 1000:.0f}ms median "
+          f"({results['import_min'] * 1000:.0f}-{results['import_max'] * 1000:.0f}ms), "
+          f"{results['modules']} modules, heavy: {', '.join(results['heavy_modules']) or 'none'}")
+    for key, label in (("healthz_seconds", "/healthz 200"), ("readyz_seconds", "/readyz 200")):
+        value = results[key]
+        print(f"{label:<18}{'-' if value is None else f'{value * 1000:.0f}ms'} after spawn")
+    print("slowest imports:")
+    for name, seconds in results["top_imports"]:
+        print(f"  {name:<40}{seconds * 1000:>7.0f}ms")
+
+    results["meta"] = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+    }
+    if args.output:
+        report.save(args.output, results)
+    if args.save_baseline:
+        report.save(args.baseline, results)
+        print(f"Baseline written to {args.baseline}", file=sys.stderr)
+    if args.compare:
+        problems = compare(results, report.load(args.baseline), args.tolerance)
+        if problems:
+            print("\nRegressions:\n  " + "\n  ".join(problems))
+            sys.exit(1)
+        print("\nNo regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+import os
+import tempfile
+
+# Settings are read at import time: point the task DB and download dir at a
+# scratch directory before anything imports `app`
+_scratch = tempfile.mkdtemp(prefix="mediasense-tests-")
+os.environ.setdefault("TASK_DB_PATH", os.path.join(_scratch, "tasks.db"))
+os.environ.setdefault("TEMP_DOWNLOAD_DIR", os.path.join(_scratch, "downloads"))
+os.environ.setdefault("RUN_DOWNLOAD_WORKERS", "false")
@@ -0,0 +1,286 @@
+"""
+RangeSplitDownloader and the DownloadEngine connection budget against the
+benchmark origin (benchmarks/origin.py), with handler variants that ignore
+Range or drop a connection halfway through a part, and parallel fragment
+downloads of the segmented benchmark fixtures through download_media.
+"""
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from http.server import ThreadingHTTPServer
+import pytest
+from benchmarks.fixtures import TARGETS, ensure_fixtures
+from benchmarks.origin import OriginHandler, _Stats
+from app.services.download_engine import DownloadEngine, download_engine
+from app.services.downloader import extractor, url_router
+from app.services.ydl_pool import ThrottledYoutubeDL
+
+SIZE = 1536 * 1024 + 123  # not a multiple of the chunk size
+CHUNK = 256 * 1024
+
+class CountingOrigin(OriginHandler):
+    """Tracks how many responses are being sent at once."""
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def _serve(self, body):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        try:
+            super()._serve(body)
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+class NoRangeOrigin(CountingOrigin):
+    """A server that always answers 200 with the whole file."""
+    def _serve(self, body):
+        del self.headers["Range"]
+        super()._serve(body)
+
+class _CutOff:
+    """wfile stand-in that breaks the connection after `limit` bytes."""
+    def __init__(self, wfile, limit):
+        self.wfile = wfile
+        self.left = limit
+
+    def write(self, data):
+        if len(data) >= self.left:
+            self.wfile.write(data[:self.left])
+            self.wfile.flush()
+            raise BrokenPipeError("cut off")
+        self.left -= len(data)
+        return self.wfile.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.wfile, name)
+
+class DroppingOrigin(CountingOrigin):
+    """Closes the connection 100 KB into the first `drops` part requests (the probe is spared)."""
+    drops = 1
+
+    def _serve(self, body):
+        cls = type(self)
+        drop = False
+        if body and self.headers.get("Range", "bytes=0-0") != "bytes=0-0":
+            with cls.lock:
+                drop = cls.drops > 0
+                cls.drops -= drop
+        if drop:
+            self.wfile = _CutOff(self.wfile, 100 * 1024)
+            self.close_connection = True
+        super()._serve(body)
+
+@pytest.fixture
+def payload(tmp_path):
+    root = tmp_path / "origin"
+    root.mkdir()
+    data = os.urandom(SIZE)
+    (root / "clip.mp4").write_bytes(data)
+    return root, data
+
+@pytest.fixture
+def origin(payload):
+    servers = []
+
+    def start(handler, rate_kbps=0):
+        # Fresh class per server: the counters and stats live on the class
+        cls = type(handler.__name__, (handler,), {
+            "root": str(payload[0]), "stats": _Stats(), "active": 0, "peak": 0, "lock": threading.Lock(),
+            "rate": rate_kbps * 1024 or None,
+        })
+        server = ThreadingHTTPServer(("127.0.0.1", 0), cls)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}/clip.mp4", cls
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture(autouse=True)
+def small_parts(monkeypatch):
+    monkeypatch.setattr(download_engine, "split_min_bytes", 1024 * 1024)
+    monkeypatch.setattr(download_engine, "chunk_bytes", CHUNK)
+
+def download(url, path, connections, **info):
+    ydl = ThrottledYoutubeDL({"quiet": True, "noprogress": True, "split_connections": connections, "retries": 3})
+    events = []
+    ydl.add_progress_hook(events.append)
+    info = {"id": "clip", "ext": "mp4", "url": url, "protocol": "http", **info}
+    assert ydl.dl(str(path), info)
+    return events
+
+def test_split_download_reassembles_the_file(origin, payload, tmp_path):
+    url, handler = origin(CountingOrigin, rate_kbps=2048)
+    target = tmp_path / "clip.mp4"
+    events = download(url, target, connections=4)
+
+    assert target.read_bytes() == payload[1]
+    assert not os.path.exists(f"{target}.part")
+    stats = handler.stats.snapshot()
+    # Probe + one request per part, all of them ranged
+    assert stats["requests"] == stats["range_requests"] == 1 + -(-SIZE // CHUNK)
+    assert 1 < handler.peak <= 4
+    assert events[-1]["status"] == "finished" and events[-1]["total_bytes"] == SIZE
+    # The contiguous prefix only ever grows and ends up covering the file
+    contiguous = [e["contiguous_bytes"] for e in events if e["status"] == "downloading"]
+    assert contiguous == sorted(contiguous)
+    assert events[-2]["downloaded_bytes"] == SIZE
+
+def test_server_without_ranges_falls_back_to_one_connection(origin, payload, tmp_path):
+    url, handler = origin(NoRangeOrigin)
+    target = tmp_path / "clip.mp4"
+    download(url, target, connections=4)
+
+    assert target.read_bytes() == payload[1]
+    stats = handler.stats.snapshot()
+    assert stats["range_requests"] == 0
+    assert stats["requests"] == 2  # the probe, then the plain download
+    assert handler.peak == 1
+
+def test_dropped_part_is_retried(origin, payload, tmp_path):
+    url, handler = origin(DroppingOrigin)
+    target = tmp_path / "clip.mp4"
+    download(url, target, connections=2)
+
+    assert target.read_bytes() == payload[1]
+    stats = handler.stats.snapshot()
+    # One extra request to finish the part that was cut off
+    assert stats["requests"] == 1 + -(-SIZE // CHUNK) + 1
+    assert handler.drops == 0
+
+def test_small_file_is_not_split(origin, payload, tmp_path):
+    url, handler = origin(CountingOrigin)
+    target = tmp_path / "clip.mp4"
+    download(url, target, connections=4, filesize=512 * 1024)
+
+    assert target.read_bytes() == payload[1]
+    assert handler.stats.snapshot()["range_requests"] == 0
+
+def test_connections_are_capped_per_platform():
+    engine = DownloadEngine({"youtube": 3, "default": 2}, max_connections=16, split_min_bytes=0, chunk_bytes=CHUNK)
+    with engine.connections("youtube") as youtube, engine.connections("pinterest") as other:
+        assert (youtube, other) == (3, 2)
+        assert engine.stats()["in_use"] == 5
+    assert engine.stats()["in_use"] == 0
+
+def test_connections_are_capped_globally():
+    engine = DownloadEngine({"youtube": 8, "default": 2}, max_connections=4, split_min_bytes=0, chunk_bytes=CHUNK)
+    granted = []
+    with engine.connections("youtube") as first:
+        # A platform allowance above the global cap is cut down to it
+        assert first == 4
+
+        def waiter():
+            with engine.connections("pinterest") as n:
+                granted.append(n)
+
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        time.sleep(0.2)
+        # Nothing left: the second download waits for the first
+        assert granted == [] and thread.is_alive()
+    thread.join(timeout=2)
+    assert granted == [2]
+
+def test_partial_grant_when_the_budget_is_nearly_spent():
+    engine = DownloadEngine({"youtube": 3, "default": 3}, max_connections=4, split_min_bytes=0, chunk_bytes=CHUNK)
+    with engine.connections("youtube") as first, engine.connections("youtube") as second:
+        assert (first, second) == (3, 1)
+        assert engine.stats() == {"max_connections": 4, "in_use": 4}
+
+def test_split_download_uses_only_the_granted_connections(origin, payload, tmp_path):
+    url, handler = origin(CountingOrigin, rate_kbps=1024)
+    engine = DownloadEngine({"default": 8}, max_connections=3, split_min_bytes=0, chunk_bytes=CHUNK)
+    target = tmp_path / "clip.mp4"
+    with engine.connections("generic") as connections:
+        download(url, target, connections=connections)
+
+    assert target.read_bytes() == payload[1]
+    assert connections == 3
+    assert handler.peak == 3
+
+class SegmentOrigin(OriginHandler):
+    """Records every path requested and how many segments are being sent at once."""
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+    paths: list = []
+
+    def _serve(self, body):
+        cls = type(self)
+        segment = body and self.path.endswith((".m4s", ".ts"))
+        with cls.lock:
+            cls.paths.append(self.path)
+            if segment:
+                cls.active += 1
+                cls.peak = max(cls.peak, cls.active)
+        try:
+            super()._serve(body)
+        finally:
+            if segment:
+                with cls.lock:
+                    cls.active -= 1
+
+@pytest.fixture(scope="module")
+def fixtures_root(tmp_path_factory):
+    if not shutil.which("ffmpeg"):
+        pytest.skip("ffmpeg is needed to generate and merge the segmented fixtures")
+    root = tmp_path_factory.mktemp("fixtures")
+    ensure_fixtures(str(root), duration=12)
+    return root
+
+@pytest.fixture
+def segment_origin(fixtures_root, monkeypatch):
+    # A rate limit long enough per segment that parallel fetches overlap
+    handler = type("SegmentOrigin", (SegmentOrigin,), {
+        "root": str(fixtures_root), "stats": _Stats(), "active": 0, "peak": 0, "lock": threading.Lock(),
+        "paths": [], "rate": 2048 * 1024,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(url_router, "allow_generic", True)
+    monkeypatch.setattr(download_engine, "per_platform", {"default": 4})
+    yield f"http://127.0.0.1:{server.server_port}", handler
+    server.shutdown()
+    server.server_close()
+
+def media_duration(path):
+    # No ffprobe needed: ffmpeg prints the container duration for any input
+    out = subprocess.run(["ffmpeg", "-hide_banner", "-i", str(path)], capture_output=True, text=True).stderr
+    h, m, s = re.search(r"Duration: (\d+):(\d+):([\d.]+)", out).groups()
+    return int(h) * 3600 + int(m) * 60 + float(s), out
+
+@pytest.mark.parametrize("kind, segments", [
+    ("dash", [r"/dash/chunk-stream0-(\d+)\.m4s", r"/dash/chunk-stream2-(\d+)\.m4s"]),
+    pytest.param(
+        "hls", [r"/hls/720p/seg(\d+)\.ts"],
+        # The HLS fixup post-processor probes the audio codec
+        marks=pytest.mark.skipif(not shutil.which("ffprobe"), reason="needs ffprobe"),
+    ),
+])
+def test_segmented_download_fetches_fragments_in_parallel(segment_origin, tmp_path, kind, segments):
+    origin, handler = segment_origin
+    path = extractor.download_media(origin + TARGETS[kind], "best", str(tmp_path))
+
+    # Several fragments were on the wire at the same time, within the platform's allowance
+    assert 1 < handler.peak <= 4
+    # Each chosen rendition was fetched as an unbroken run of 2 s segments, once each...
+    for pattern in segments:
+        numbers = sorted(int(m.group(1)) for m in map(re.compile(pattern).fullmatch, handler.paths) if m)
+        assert len(numbers) >= 6
+        assert numbers == list(range(numbers[0], numbers[0] + len(numbers)))
+    # ...and the output is the whole clip, with both tracks
+    duration, probe = media_duration(path)
+    assert duration == pytest.approx(12, abs=0.5)
+    assert "Video: h264" in probe and "Audio: aac" in probe
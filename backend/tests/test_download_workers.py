@@ -0,0 +1,132 @@
+"""
+Shared downloads in the worker pool: identical requests attach to the one
+in flight without holding a worker, and are completed or failed by its owner.
+"""
+import os
+import threading
+import time
+import pytest
+from app.core.config import settings
+from app.services.download_workers import DownloadWorkerPool
+from app.services.downloader import extractor
+from app.services.storage import storage
+from app.services.task_manager import task_manager
+
+SHARED = "https://www.youtube.com/watch?v=sharedvideo"
+OTHER = "https://www.youtube.com/watch?v=othervideo0"
+
+class FakeDownloads:
+    """
+    Stands in for extractor.download_media. Downloads of SHARED report 50%
+    once `halfway` is set and finish (or raise `error`) once `release` is.
+    """
+    def __init__(self):
+        self.halfway = threading.Event()
+        self.release = threading.Event()
+        self.error = None
+        self.calls = []
+
+    def __call__(self, url, format_id, output_dir, progress_hook=None, **kwargs):
+        self.calls.append(url)
+        if url == SHARED:
+            assert self.halfway.wait(10)
+            progress_hook({"status": "downloading", "downloaded_bytes": 50, "total_bytes": 100})
+            assert self.release.wait(10)
+            if self.error:
+                raise self.error
+        path = os.path.join(output_dir, f"{url[-11:]}.mp4")
+        with open(path, "wb") as f:
+            f.write(url.encode())
+        return path
+
+@pytest.fixture
+def downloads(monkeypatch):
+    fake = FakeDownloads()
+    monkeypatch.setattr(extractor, "download_media", fake)
+    monkeypatch.setattr(settings, "STORAGE_DEFAULT_RESERVATION_MB", 1)
+    yield fake
+    fake.halfway.set()
+    fake.release.set()
+
+@pytest.fixture
+def pool():
+    pool = DownloadWorkerPool(concurrency=2, lease_seconds=30, poll_interval=0.05, max_attempts=3, retry_backoff=10)
+    pool.start()
+    yield pool
+    pool.stop()
+
+def wait_for(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return
+        time.sleep(0.02)
+    raise AssertionError("timed out")
+
+def statuses(task_ids):
+    return [task_manager.get_task(t)["status"] for t in task_ids]
+
+def test_waiters_attach_without_taking_a_worker(pool, downloads):
+    format_id = f"best-{time.monotonic()}"
+    shared = [task_manager.create_task(url=SHARED, format_id=format_id) for _ in range(4)]
+    pool.notify()
+    wait_for(lambda: pool.stats()["attached"] == 3)
+    assert pool.stats()["active"] == 1
+
+    # Both workers aren't stuck behind the shared download: an unrelated job still runs
+    other = task_manager.create_task(url=OTHER, format_id=format_id)
+    pool.notify()
+    wait_for(lambda: statuses([other]) == ["completed"])
+    assert statuses(shared) == ["processing"] * 4
+    phases = sorted(task_manager.get_task(t)["phase"] for t in shared)
+    assert phases == ["downloading", "waiting", "waiting", "waiting"]
+
+    # Attached tasks mirror the owner's progress
+    downloads.halfway.set()
+    wait_for(lambda: {task_manager.get_task(t)["progress"] for t in shared} == {50.0})
+    assert {task_manager.get_task(t)["phase"] for t in shared} == {"downloading"}
+
+    downloads.release.set()
+    wait_for(lambda: statuses(shared) == ["completed"] * 4)
+    tasks = [task_manager.get_task(t) for t in shared]
+    assert len({t["filepath"] for t in tasks}) == 1
+    assert downloads.calls.count(SHARED) == 1
+    assert pool.stats()["attached"] == 0
+
+def test_waiters_fail_with_the_owner(pool, downloads):
+    format_id = f"best-{time.monotonic()}"
+    downloads.error = ValueError("Download failed: Video unavailable")
+    shared = [task_manager.create_task(url=SHARED, format_id=format_id) for _ in range(3)]
+    pool.notify()
+    wait_for(lambda: pool.stats()["attached"] == 2)
+
+    downloads.halfway.set()
+    downloads.release.set()
+    wait_for(lambda: statuses(shared) == ["failed"] * 3)
+    assert {task_manager.get_task(t)["error"] for t in shared} == {"Download failed: Video unavailable"}
+
+def test_transient_failure_requeues_the_waiters(pool, downloads):
+    format_id = f"best-{time.monotonic()}"
+    downloads.error = ValueError("Download failed: HTTP Error 503: Service Unavailable")
+    shared = [task_manager.create_task(url=SHARED, format_id=format_id) for _ in range(3)]
+    pool.notify()
+    wait_for(lambda: pool.stats()["attached"] == 2)
+
+    downloads.halfway.set()
+    downloads.release.set()
+    wait_for(lambda: statuses(shared) == ["pending"] * 3)
+    jobs = [task_manager.get_job(t) for t in shared]
+    assert all(job["run_after"] > time.time() for job in jobs)
+
+def test_finished_blob_completes_later_tasks_at_once(pool, downloads):
+    format_id = f"best-{time.monotonic()}"
+    downloads.halfway.set()
+    downloads.release.set()
+    first = task_manager.create_task(url=SHARED, format_id=format_id)
+    pool.notify()
+    wait_for(lambda: statuses([first]) == ["completed"])
+    later = task_manager.create_task(url=SHARED, format_id=format_id)
+    pool.notify()
+    wait_for(lambda: statuses([later]) == ["completed"])
+    assert downloads.calls.count(SHARED) == 1
+    assert storage.waiting_tasks() == []
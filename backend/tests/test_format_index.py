@@ -0,0 +1,68 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app.api.endpoints import download
+from app.services.downloader import extractor
+from app.services.format_index import build_format_index, constraints_to_selector, select_option
+
+INFO = {
+    "id": "clip",
+    "title": "Clip",
+    "duration": 100,
+    "formats": [
+        {"format_id": "140", "vcodec": "none", "acodec": "mp4a.40.2", "ext": "m4a", "abr": 128, "filesize": 1_600_000},
+        {"format_id": "251", "vcodec": "none", "acodec": "opus", "ext": "webm", "abr": 130, "filesize": 1_700_000},
+        {"format_id": "137", "vcodec": "avc1.640028", "acodec": "none", "ext": "mp4",
+         "height": 1080, "fps": 30, "dynamic_range": "SDR", "filesize": 40_000_000},
+        {"format_id": "248", "vcodec": "vp9", "acodec": "none", "ext": "webm",
+         "height": 1080, "fps": 60, "dynamic_range": "SDR", "filesize": 50_000_000},
+        {"format_id": "337", "vcodec": "vp09.02.51.10", "acodec": "none", "ext": "webm",
+         "height": 1080, "fps": 60, "dynamic_range": "HDR10", "filesize": 80_000_000},
+        {"format_id": "136", "vcodec": "avc1.4d401f", "acodec": "none", "ext": "mp4",
+         "height": 720, "fps": 30, "filesize": 20_000_000},
+    ],
+}
+
+@pytest.fixture
+def index():
+    return build_format_index(INFO)
+
+def test_best_ranks_container_before_fps(index):
+    # Same order as FORMAT_SORT ["res", "ext"]: the MP4 pair wins over 60fps VP9
+    assert select_option(index, {})["format_id"] == "137+140"
+
+def test_hdr_true_only_returns_hdr(index):
+    option = select_option(index, {"hdr": True})
+    assert option["format_id"] == "337+251" and option["hdr"]
+    assert select_option(index, {"hdr": True, "max_height": 720}) is None
+
+def test_hdr_false_only_returns_sdr(index):
+    options = [select_option(index, {"hdr": False, "container": c}) for c in ("mp4", "webm")]
+    assert [o["format_id"] for o in options] == ["137+140", "248+251"]
+
+def test_unconstrained_ranking_does_not_prefer_sdr(index):
+    # Among otherwise equal WebM 1080p60 options the HDR one wins, as in yt-dlp's sort
+    assert select_option(index, {"container": "webm"})["format_id"] == "337+251"
+
+def test_selector_filters_dynamic_range():
+    assert "[dynamic_range!=SDR]" in constraints_to_selector({"hdr": True})
+    assert "[dynamic_range=SDR]" in constraints_to_selector({"hdr": False})
+    assert "dynamic_range" not in constraints_to_selector({})
+
+def test_best_entry_is_pinned_to_the_selected_option(index):
+    formats = extractor._process_info(INFO, index)["formats"]
+    assert formats[0]["type"] == "best"
+    assert formats[0]["format_id"] == "137+140"
+    assert formats[0]["ext"] == "mp4"
+
+def test_unmatched_hdr_constraint_is_rejected(index, monkeypatch):
+    monkeypatch.setattr(extractor, "get_raw_info", lambda handle: INFO)
+    monkeypatch.setattr(extractor, "get_format_index", lambda handle: index)
+    req = download.DownloadRequest(
+        url="https://www.youtube.com/watch?v=aaaaaaaaaaa",
+        handle="youtube:aaaaaaaaaaa",
+        constraints={"hdr": True, "max_height": 720},
+    )
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(download.start_download(req))
+    assert raised.value.status_code == 422
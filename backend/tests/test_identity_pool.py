@@ -0,0 +1,105 @@
+import time
+from collections import Counter
+import pytest
+from app.services.extraction_pool import PoolSaturated
+from app.services.identity_pool import IdentityPool, blocked_status
+
+def make_pool(n=2, **kwargs):
+    settings = dict(rate_per_minute=6000, burst=100, quarantine_seconds=0.2, max_quarantine_seconds=1.0)
+    settings.update(kwargs)
+    return IdentityPool("proxy", [f"http://10.0.0.{i}:3128" for i in range(n)], **settings)
+
+def test_empty_pool_yields_direct_connection():
+    pool = IdentityPool("proxy", [], rate_per_minute=60, burst=1)
+    assert pool.acquire() is None
+    pool.report(None, ok=False, status=429)
+
+def test_selection_is_weighted_by_health():
+    pool = make_pool(rate_per_minute=10 ** 6, burst=10 ** 4)
+    healthy, flaky = pool.entries
+    flaky.success = 0.1
+    picks = Counter(pool.acquire().id for _ in range(2000))
+    assert picks[healthy.id] > 5 * picks[flaky.id] > 0
+
+def test_prefer_pins_an_entry_until_it_is_quarantined():
+    pool = make_pool()
+    pinned = pool.entries[1]
+    assert all(pool.acquire(prefer=pinned.id) is pinned for _ in range(20))
+    pool.report(pinned, ok=False, status=429)
+    assert all(pool.acquire(prefer=pinned.id) is not pinned for _ in range(20))
+
+def test_block_quarantines_with_exponential_backoff():
+    pool = make_pool(quarantine_seconds=10, max_quarantine_seconds=25)
+    entry = pool.entries[0]
+    quarantined_for = []
+    for _ in range(3):
+        pool.report(entry, ok=False, status=429)
+        quarantined_for.append(entry.quarantined_until - time.monotonic())
+    assert quarantined_for[0] == pytest.approx(10, abs=0.5)
+    assert quarantined_for[1] == pytest.approx(20, abs=0.5)
+    # Capped at max_quarantine_seconds
+    assert quarantined_for[2] == pytest.approx(25, abs=0.5)
+    assert [s["blocks"] for s in pool.stats()] == [3, 0]
+
+def test_quarantined_entry_recovers_on_probation():
+    pool = make_pool()
+    entry = pool.entries[0]
+    pool.report(entry, ok=False, status=403)
+    assert entry not in {pool.acquire() for _ in range(20)}
+    time.sleep(0.25)
+    assert entry in {pool.acquire() for _ in range(50)}
+    assert entry.samples == 0
+    # A success after coming back resets the backoff
+    pool.report(entry, ok=True, latency=0.1)
+    assert entry.consecutive_blocks == 0
+
+def test_failures_below_min_health_quarantine():
+    pool = make_pool()
+    entry = pool.entries[0]
+    for _ in range(5):
+        pool.report(entry, ok=False)
+    # 0.8 ** 5 of the initial score is still above 0.3
+    assert entry.available(time.monotonic())
+    pool.report(entry, ok=False)
+    assert not entry.available(time.monotonic())
+
+def test_slow_entry_is_quarantined_without_failing():
+    pool = make_pool(latency_target=0.5)
+    slow, fast = pool.entries
+    for _ in range(5):
+        pool.report(slow, ok=True, latency=3.0)
+        pool.report(fast, ok=True, latency=0.05)
+    assert not slow.available(time.monotonic())
+    assert fast.available(time.monotonic())
+    # Latency is measured afresh once it is back
+    assert slow.latency == 0
+
+def test_errors_that_are_not_blocks_are_told_apart():
+    assert blocked_status("ERROR: Unable to download webpage: HTTP Error 429: Too Many Requests") == 429
+    assert blocked_status("Sign in to confirm you're not a bot") == 403
+    assert blocked_status("Video unavailable. This video is private") is None
+
+def test_token_bucket_limits_each_entry():
+    pool = make_pool(n=1, rate_per_minute=60, burst=2, acquire_timeout=0.5)
+    entry = pool.entries[0]
+    assert pool.acquire() is entry
+    assert pool.acquire() is entry
+    started = time.monotonic()
+    with pytest.raises(PoolSaturated):
+        pool.acquire()
+    # Gave up as soon as it knew the next token comes after the timeout
+    assert time.monotonic() - started < 0.2
+
+def test_token_bucket_waits_for_a_token_within_the_timeout():
+    pool = make_pool(n=1, rate_per_minute=600, burst=1, acquire_timeout=2)
+    pool.acquire()
+    started = time.monotonic()
+    pool.acquire()
+    assert 0.05 < time.monotonic() - started < 0.5
+
+def test_busy_entry_spills_over_to_the_others():
+    pool = make_pool(n=2, rate_per_minute=60, burst=3, acquire_timeout=0.1)
+    picks = Counter(pool.acquire().id for _ in range(6))
+    assert picks == {"proxy0": 3, "proxy1": 3}
+    with pytest.raises(PoolSaturated):
+        pool.acquire()
@@ -0,0 +1,54 @@
+from collections import namedtuple
+import pytest
+from app.services import storage as storage_module
+from app.services.storage import InsufficientStorage, StorageService
+
+MB = 1024 * 1024
+DiskUsage = namedtuple("DiskUsage", "total used free")
+
+@pytest.fixture
+def disk(monkeypatch):
+    """A 100 MB disk whose usage is the size of everything written under the store."""
+    state = {}
+
+    def disk_usage(path):
+        used = StorageService._tree_size(state["root"])
+        return DiskUsage(100 * MB, used, 100 * MB - used)
+
+    monkeypatch.setattr(storage_module.shutil, "disk_usage", disk_usage)
+    return state
+
+@pytest.fixture
+def store(tmp_path, disk):
+    disk["root"] = tmp_path
+    return StorageService(base_dir=str(tmp_path), high_watermark=0.8, low_watermark=0.5)
+
+def test_reservation_counts_only_what_is_not_written_yet(store):
+    staging = store.blob_staging_dir("a")
+    store.reserve("task-a", 30 * MB, staging)
+    assert store._disk_budget() == (50 * MB, 30 * MB)
+
+    # 10 MB of it is on disk now: counted once, in disk usage
+    (staging / "video.mp4.part").write_bytes(b"\0" * (10 * MB))
+    assert store._disk_budget() == (50 * MB, 20 * MB)
+
+    # A download that outgrows its estimate doesn't push the reservation negative
+    (staging / "audio.m4a.part").write_bytes(b"\0" * (25 * MB))
+    assert store._disk_budget() == (45 * MB, 0)
+
+def test_partly_written_downloads_dont_block_admission(store):
+    staging = store.blob_staging_dir("a")
+    store.reserve("task-a", 40 * MB, staging)
+    (staging / "video.mp4.part").write_bytes(b"\0" * (30 * MB))
+    # 80 MB limit - 30 MB written - 10 MB still to come: 40 MB left
+    store.reserve("task-b", 40 * MB, store.blob_staging_dir("b"))
+    with pytest.raises(InsufficientStorage):
+        store.reserve("task-c", 1 * MB)
+
+def test_released_reservation_frees_its_budget(store):
+    store.reserve("task-a", 70 * MB)
+    with pytest.raises(InsufficientStorage):
+        store.reserve("task-b", 20 * MB)
+    store.release_reservation("task-a")
+    store.reserve("task-b", 20 * MB)
+    assert store._disk_budget()[1] == 20 * MB
@@ -0,0 +1,149 @@
+"""
+MultipartUpload and the S3 backend against moto's in-memory S3: parts go
+out while the .part file is still growing, a file rewritten after the
+download falls back to a whole-file upload, failed downloads abort, and
+finished S3 blobs are served with a redirect to a presigned URL.
+"""
+import asyncio
+import os
+import time
+from urllib.parse import parse_qs, urlparse
+import pytest
+from starlette.requests import Request
+from app.api.endpoints import download as download_endpoints
+from app.services.storage_backends import S3Backend
+from app.services.task_manager import task_manager
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+BUCKET = "mediasense-test"
+MB = 1024 * 1024
+PART = 5 * MB  # the S3 minimum
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with moto.mock_aws():
+        backend = S3Backend(bucket=BUCKET, prefix="downloads/", region="us-east-1", part_size=PART, concurrency=2)
+        backend.client.create_bucket(Bucket=BUCKET)
+        backend.open()
+        yield backend
+        backend._executor.shutdown(wait=True)
+
+def wait_for(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return
+        time.sleep(0.02)
+    raise AssertionError("timed out")
+
+def stored(backend, key):
+    return backend.client.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+
+def pending_uploads(backend):
+    return backend.client.list_multipart_uploads(Bucket=BUCKET).get("Uploads", [])
+
+def grow(part, data, upload):
+    """Append `data` to the .part file and report it like yt-dlp's progress hook does."""
+    with open(part, "ab") as f:
+        f.write(data)
+    upload.follow({"status": "downloading", "tmpfilename": str(part), "downloaded_bytes": os.path.getsize(part)})
+
+def uploaded_parts(upload):
+    return sum(future.done() for future in upload._parts)
+
+def test_parts_are_uploaded_while_the_file_grows(backend, tmp_path):
+    upload = backend.start_upload("abc/best")
+    part = tmp_path / "clip.mp4.part"
+    chunks = [os.urandom(3 * MB) for _ in range(4)]
+
+    grow(part, chunks[0], upload)
+    # Less than a part on disk: nothing is sent yet
+    time.sleep(0.1)
+    assert upload.upload_id is None
+    grow(part, chunks[1], upload)
+    wait_for(lambda: uploaded_parts(upload) == 1)
+    grow(part, chunks[2], upload)
+    grow(part, chunks[3], upload)
+    wait_for(lambda: uploaded_parts(upload) == 2)
+    assert upload.offset == 2 * PART
+
+    # yt-dlp renames the .part file when it is done; only the tail is left to send
+    final = tmp_path / "clip.mp4"
+    os.rename(part, final)
+    assert upload.finish(str(final)) == "downloads/abc/best"
+    assert upload.mode == "streamed"
+    assert stored(backend, "downloads/abc/best") == b"".join(chunks)
+    head = backend.client.head_object(Bucket=BUCKET, Key="downloads/abc/best")
+    assert head["ContentType"] == "video/mp4"
+    assert backend.stats()["uploads_streamed"] == 1
+
+@pytest.mark.parametrize("rewrite", ["in_place", "merged"])
+def test_rewritten_file_is_uploaded_whole(backend, tmp_path, rewrite):
+    upload = backend.start_upload("abc/best")
+    part = tmp_path / "clip.f137.mp4.part"
+    grow(part, os.urandom(6 * MB), upload)
+    wait_for(lambda: uploaded_parts(upload) == 1)
+
+    final = tmp_path / "clip.mp4"
+    result = os.urandom(7 * MB)
+    if rewrite == "in_place":
+        # A fixup rewrites the followed file: same inode, different leading bytes
+        with open(part, "r+b") as f:
+            f.write(result)
+        os.rename(part, final)
+    else:
+        # The merger writes a new file from the video and audio downloads
+        final.write_bytes(result)
+    upload.finish(str(final))
+
+    assert upload.mode == "whole"
+    assert stored(backend, "downloads/abc/best") == result
+    # The streamed parts were dropped with their multipart upload
+    assert pending_uploads(backend) == []
+    assert backend.stats()["uploads_whole"] == 1
+
+def test_failed_download_aborts_the_upload(backend, tmp_path):
+    upload = backend.start_upload("abc/best")
+    part = tmp_path / "clip.mp4.part"
+    grow(part, os.urandom(6 * MB), upload)
+    wait_for(lambda: uploaded_parts(upload) == 1)
+    assert len(pending_uploads(backend)) == 1
+
+    upload.abort()
+    assert pending_uploads(backend) == []
+    assert backend.client.list_objects_v2(Bucket=BUCKET).get("KeyCount") == 0
+    # Progress reported after the abort is ignored
+    grow(part, os.urandom(5 * MB), upload)
+    assert upload.upload_id is None
+
+def test_get_file_redirects_to_a_presigned_url(backend, tmp_path, monkeypatch):
+    monkeypatch.setattr(download_endpoints, "storage_backend", backend)
+    path = tmp_path / "Clip.mp4"
+    path.write_bytes(b"clip")
+    backend.upload_file(str(path), "downloads/abc/best", "video/mp4")
+    task_id = task_manager.create_task(url="https://www.youtube.com/watch?v=abcdefghijk", format_id="best")
+    task_manager.update_task(
+        task_id, status="completed", filepath=str(path), filename="Clip.mp4", object_key="downloads/abc/best",
+    )
+    # The local copy may already be gone: the object store has it
+    path.unlink()
+
+    request = Request({"type": "http", "method": "GET", "path": f"/download/file/{task_id}", "headers": []})
+    response = asyncio.run(download_endpoints.get_file(task_id, request))
+
+    assert response.status_code == 307
+    location = urlparse(response.headers["location"])
+    assert (location.netloc, location.path) == (f"{BUCKET}.s3.amazonaws.com", "/downloads/abc/best")
+    query = parse_qs(location.query)
+    assert query["X-Amz-Expires"] == [str(backend.presign_seconds)]
+    assert query["response-content-disposition"] == ["attachment; filename*=UTF-8''Clip.mp4"]
+
+    # The signed URL works on its own (moto also intercepts `requests`, one of its dependencies)
+    import requests
+    fetched = requests.get(response.headers["location"])
+    assert fetched.status_code == 200 and fetched.content == b"clip"
+    assert fetched.headers["Content-Disposition"] == "attachment; filename*=UTF-8''Clip.mp4"
@@ -0,0 +1,50 @@
+import logging
+import pytest
+from app.services import ydl_pool as ydl_pool_module
+from app.services.ydl_pool import YDLPool
+
+@pytest.fixture
+def pool():
+    pool = YDLPool(max_idle=2, max_uses=10, max_age=60)
+    yield pool
+    pool.clear()
+
+def test_lease_reuses_the_instance_with_its_run_state_cleared(pool):
+    opts = {"quiet": True}
+    with pool.lease("extract:direct:anon", opts, playlist_items="1:5") as ydl:
+        first = ydl
+        ydl._download_retcode = 1
+        ydl._playlist_level = 2
+        ydl._playlist_urls.add("https://example.com/list")
+        ydl._printed_messages.add("a warning printed once")
+        ydl.request_seconds.append(0.5)
+        assert ydl.params["playlist_items"] == "1:5"
+
+    with pool.lease("extract:direct:anon", opts) as ydl:
+        assert ydl is first
+        assert ydl._download_retcode == 0
+        assert ydl._playlist_level == 0
+        assert not ydl._playlist_urls
+        assert not ydl._printed_messages
+        assert ydl.request_seconds == []
+        # Lease overrides are undone too
+        assert "playlist_items" not in ydl.params
+    assert pool.stats()["reused"] == 1
+
+def test_failed_lease_discards_the_instance(pool):
+    with pytest.raises(RuntimeError):
+        with pool.lease("extract:direct:anon", {"quiet": True}) as ydl:
+            first = ydl
+            raise RuntimeError("extraction failed")
+    with pool.lease("extract:direct:anon", {"quiet": True}) as ydl:
+        assert ydl is not first
+    assert pool.stats()["recycled"] == 1
+
+def test_missing_run_state_is_logged_once(pool, monkeypatch, caplog):
+    monkeypatch.setattr(ydl_pool_module, "_RUN_STATE", ydl_pool_module._RUN_STATE + ("_renamed_state",))
+    monkeypatch.setattr(ydl_pool_module, "_missing_run_state", set())
+    with caplog.at_level(logging.WARNING, logger="app.services.ydl_pool"):
+        for _ in range(2):
+            with pool.lease("extract:direct:anon", {"quiet": True}):
+                pass
+    assert len([r for r in caplog.records if "_renamed_state" in r.getMessage()]) == 1
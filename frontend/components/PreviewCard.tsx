@@ -18,6 +18,7 @@ interface MediaData {
     duration: string;
     platform: string;
     formats: Format[];
+    handle?: string;
 }
 
 interface PreviewCardProps {
@@ -48,7 +49,7 @@ export default function PreviewCard({ data, url }: PreviewCardProps) {
             const res = await fetch(`${API_URL}/download`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ url, format_id: formatId })
+                body: JSON.stringify({ url, format_id: formatId, handle: data.handle })
             });
 
             if (!res.ok) throw new Error("Failed to start download");
@@ -56,26 +57,49 @@ export default function PreviewCard({ data, url }: PreviewCardProps) {
             const { task_id } = await res.json();
             setDownloadState(prev => ({ ...prev, status: 'downloading', taskId: task_id }));
 
-            const interval = setInterval(async () => {
-                try {
-                    const statusRes = await fetch(`${API_URL}/download/status/${task_id}`);
-                    const statusData = await statusRes.json();
-
-                    if (statusData.status === 'completed') {
-                        clearInterval(interval);
-                        setDownloadState(prev => ({ ...prev, status: 'completed', progress: 100 }));
-                        window.location.href = `${API_URL}/download/file/${task_id}`;
-                    } else if (statusData.status === 'failed') {
+            const handleUpdate = (statusData: any): boolean => {
+                if (statusData.status === 'completed') {
+                    setDownloadState(prev => ({ ...prev, status: 'completed', progress: 100 }));
+                    window.location.href = `${API_URL}/download/file/${task_id}`;
+                    return true;
+                } else if (statusData.status === 'failed') {
+                    setDownloadState(prev => ({ ...prev, status: 'error', error: statusData.error || "Download failed" }));
+                    return true;
+                }
+                setDownloadState(prev => ({ ...prev, progress: statusData.progress || 0 }));
+                return false;
+            };
+
+            // Fallback for browsers/proxies where the event stream doesn't work
+            const poll = () => {
+                const interval = setInterval(async () => {
+                    try {
+                        const statusRes = await fetch(`${API_URL}/download/status/${task_id}`);
+                        if (handleUpdate(await statusRes.json())) clearInterval(interval);
+                    } catch (e) {
                         clearInterval(interval);
-                        setDownloadState(prev => ({ ...prev, status: 'error', error: statusData.error || "Download failed" }));
-                    } else {
-                        setDownloadState(prev => ({ ...prev, progress: statusData.progress || 0 }));
+                        setDownloadState(prev => ({ ...prev, status: 'error', error: "Connection lost" }));
                     }
-                } catch (e) {
-                    clearInterval(interval);
-                    setDownloadState(prev => ({ ...prev, status: 'error', error: "Connection lost" }));
-                }
-            }, 1000);
+                }, 1000);
+            };
+
+            if (typeof EventSource === 'undefined') {
+                poll();
+            } else {
+                // Server pushes progress as it happens instead of us polling /status
+                const events = new EventSource(`${API_URL}/download/events/${task_id}`);
+                let received = false;
+                events.onmessage = (event) => {
+                    received = true;
+                    if (handleUpdate(JSON.parse(event.data))) events.close();
+                };
+                events.onerror = () => {
+                    if (!received) {
+                        events.close();
+                        poll();
+                    }
+                };
+            }
 
         } catch (e: any) {
             setDownloadState(prev => ({ ...prev, status: 'error', error: e.message }));